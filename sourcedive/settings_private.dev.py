@@ -37,3 +37,8 @@ SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = ''  # UPDATE see lastpass
 
 # NOTE: We don't want to whitelist anyone — access should be explicitly given
 # SOCIAL_AUTH_GOOGLE_WHITELISTED_DOMAINS = ['industrydive.com']
+
+## search (see sources/search_backends.py); defaults to Postgres full-text search
+# SOURCES_SEARCH_BACKEND = 'sources.search_backends.LocalFTSSearchBackend'
+# SOURCES_SEARCH_BACKEND = 'sources.search_backends.SolrSearchBackend'
+# SOLR_URL = 'http://localhost:8983/solr/sourcedive'
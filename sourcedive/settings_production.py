@@ -0,0 +1,89 @@
+"""
+Django settings for running sourcedive in production.
+
+Use with DJANGO_SETTINGS_MODULE=sourcedive.settings_production. Builds on
+settings.py (and so on settings_private.py) and only changes what matters
+for serving requests: no debug-only apps/middleware, compiled templates
+kept in memory, persistent database connections and a cache shared by all
+worker processes.
+
+Compare it against the default settings with `manage.py benchmark settings`.
+"""
+import copy
+import os
+
+from .settings import *  # noqa: F401,F403
+
+
+DEBUG = False
+
+## drop debug-only apps and middleware
+
+DEBUG_APPS = ['debug_toolbar']
+DEBUG_MIDDLEWARE = ['debug_toolbar.middleware.DebugToolbarMiddleware']
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEBUG_APPS]
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in DEBUG_MIDDLEWARE]
+
+## templates
+
+TEMPLATES = copy.deepcopy(TEMPLATES)
+# parse each template once per process; APP_DIRS can't be combined with
+# explicit loaders, so the app directories loader is listed instead
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    context_processor for context_processor in TEMPLATES[0]['OPTIONS']['context_processors']
+    if context_processor != 'django.template.context_processors.debug'
+]
+
+## database
+
+DATABASES = copy.deepcopy(DATABASES)
+# keep connections open across requests instead of reconnecting per request
+DATABASES['default']['CONN_MAX_AGE'] = 600
+# ping reused connections at the start of each request and drop dead ones,
+# see sources/signals.py (Django 4.1+ handles this setting itself)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+## cache
+
+CACHES = {
+    'default': {
+        # shared by all worker processes on the host
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SOURCEDIVE_CACHE_DIR', '/var/tmp/sourcedive_cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# sessions are read on every admin request; serve them from the cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+## logging
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # one JSON line per request, see sources/middleware.py
+        'sources.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
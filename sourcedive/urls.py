@@ -8,6 +8,8 @@ from django.contrib.auth import views as auth_views
 urlpatterns = [
     ## general
     url(r'^admin/', admin.site.urls),
+    ## sources
+    url(r'^sources/', include('sources.urls')),
     ## social auth
     url(r'^accounts/login/$', auth_views.LoginView.as_view()),
     # url('', include('social.apps.django_app.urls', namespace='social')),
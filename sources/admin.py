@@ -1,22 +1,51 @@
-from django.contrib import admin
+import hashlib
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.admin.filters import SimpleListFilter
-from django.contrib.admin.utils import flatten_fieldsets
-from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.utils import flatten_fieldsets, unquote
+from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Q
-from django.forms import ModelMultipleChoiceField, Select
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Count, Max, Prefetch, Q
+from django import forms
+from django.forms import ModelChoiceField, ModelMultipleChoiceField
 from django.http import HttpResponseRedirect
-from django.urls import reverse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.utils.html import format_html
-
+from django.views.decorators.http import condition
+
+from sources.analytics import ANALYTICS_DEFAULT_PERIOD, ANALYTICS_PERIODS, interaction_analytics
+from sources.cache import displayable_names
+from sources.choices import PRIVACY_CHOICES
+from sources.directory import user_directory
+from sources.ics import CalendarImport
+from sources.identifiers import lookup_candidates
+from sources.lookups import merge_lookups, source_counts
+from sources.merge import MergeError, merge_sources, visible_details
+from sources.names import normalize_name
 from sources.models import (
+    ContactIdentifier,
     Dive,
+    DuplicateCandidate,
     Expertise,
     Industry,
     Interaction,
+    LookupAlias,
     Organization,
     Person,
+    SourceMerge,
 )
+from sources.pagination import EstimatedCountPaginator, KeysetChangeList
+from sources.search_backends import search_backend
+from sources.views import PagedAutocompleteJsonView, UserDirectoryAutocompleteJsonView
+from sources.widgets import CachedSelect, UserAutocompleteSelect, UserAutocompleteSelectMultiple
 
 
 class CreatedByMixin(object):
@@ -26,13 +55,18 @@ class CreatedByMixin(object):
             This will display a custom created_by field by using
             the user's first and last name instead of the user's username
         """
-        return get_user_display_name(obj.created_by)
+        return user_directory.display_name(obj.created_by_id)
     get_created_by.short_description = 'Created By'
 
 def get_user_display_name(obj):
     return obj.get_full_name() or obj.username
 
 
+def prefetch_interviewer_ids():
+    """ Prefetch interviewers as bare ids; display names come from user_directory """
+    return Prefetch('interviewer', queryset=User.objects.only('pk'))
+
+
 class UserChoiceField(ModelMultipleChoiceField):
     """
         This will change how the user (might be field interviewer, etc) is
@@ -43,11 +77,154 @@ class UserChoiceField(ModelMultipleChoiceField):
         return get_user_display_name(obj)
 
 
-class DiveAdmin(admin.ModelAdmin):
+class SingleUserChoiceField(ModelChoiceField):
+    """ UserChoiceField for a single user, e.g. a created_by foreign key """
+    def label_from_instance(self, obj):
+        return get_user_display_name(obj)
+
+
+class CalendarImportForm(forms.Form):
+    """ Upload for InteractionAdmin.import_calendar_view, see sources/ics.py """
+    file = forms.FileField(label='Calendar file (.ics)')
+    privacy_level = forms.ChoiceField(choices=PRIVACY_CHOICES, initial='private_individual')
+    interaction_type = forms.ChoiceField(choices=(('', '---------'),) + Interaction.INTERACTION_CHOICES, required=False)
+    include_future = forms.BooleanField(required=False, label='Also log events that haven\'t started yet')
+
+
+class AutocompleteAdminMixin(object):
+    """
+    Serve this model's autocomplete widgets (autocomplete_fields, or the
+    user_autocomplete_widget() below) from PagedAutocompleteJsonView, which
+    only renders the selected values into the page and answers each lookup
+    with one query over the admin's search_fields.
+    """
+
+    autocomplete_view_class = PagedAutocompleteJsonView
+
+    def autocomplete_view(self, request):
+        return self.autocomplete_view_class.as_view(model_admin=self)(request)
+
+    def autocomplete_label(self, obj):
+        return str(obj)
+
+    def has_autocomplete_permission(self, request):
+        return self.has_view_permission(request)
+
+
+class LookupMergeAdminMixin(object):
+    """ Merge action for Expertise/Industry/Organization, see sources/lookups.py """
+
+    actions = ['merge_selected']
+
+    def merge_selected(self, request, queryset):
+        """ Merge the selected rows into the one with the most sources """
+        rows = list(queryset.order_by('pk'))
+        if len(rows) < 2:
+            self.message_user(request, 'Select at least two rows to merge.', messages.WARNING)
+            return
+        counts = source_counts(self.model, [row.pk for row in rows])
+        survivor = min(rows, key=lambda row: (-counts.get(row.pk, 0), row.pk))
+        moved = merge_lookups(self.model, survivor, rows)
+        self.message_user(request, 'Merged {} rows into "{}" ({} sources re-pointed).'.format(
+            len(rows) - 1, survivor.name, moved,
+        ), messages.SUCCESS)
+    merge_selected.short_description = 'Merge selected into the most used'
+    merge_selected.allowed_permissions = ('change', 'delete')
+
+
+class ConditionalChangeViewMixin(object):
+    """
+    Answer GETs of the change view with 304 Not Modified when the browser's
+    copy is still current, so revalidating an unchanged page costs the one
+    query in change_view_state() instead of rendering the form and inlines.
+
+    The ETag hashes the values returned by change_view_state(), the path
+    (e.g. ?edit), the user and their session/CSRF cookie, which are rendered
+    into the page. It is only as complete as change_view_state(), which
+    relies on `updated`: changes shown on the page that don't save the object
+    (M2M memberships, interviewers, renamed lookups and users) bump it in
+    sources/signals.py (see touch()).
+    """
+
+    def change_view_state(self, request, pk):
+        """
+        (last modified, values the rendered page depends on) for the object,
+        or None to always render the page (no validators).
+        """
+        return None
+
+    def _change_view_validators(self, request, object_id):
+        """ (ETag, Last-Modified), computed once per request """
+        if not hasattr(request, '_change_view_validators'):
+            request._change_view_validators = (None, None)
+            try:
+                pk = self.model._meta.pk.to_python(unquote(object_id))
+            except ValidationError:
+                pk = None
+            state = self.change_view_state(request, pk) if pk is not None else None
+            if state is not None:
+                last_modified, values = state
+                key = repr((
+                    values,
+                    request.get_full_path(),
+                    request.user.pk,
+                    request.session.session_key,
+                    request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+                ))
+                request._change_view_validators = (hashlib.md5(key.encode('utf-8')).hexdigest(), last_modified)
+        return request._change_view_validators
+
+    def get_urls(self):
+        """ Route the change view through admin_view(cacheable=True), see change_view() """
+        change_url_name = '{}_{}_change'.format(self.model._meta.app_label, self.model._meta.model_name)
+        return [
+            path('<path:object_id>/change/', self.admin_site.admin_view(self.change_view, cacheable=True), name=change_url_name)
+            if getattr(url, 'name', None) == change_url_name else url
+            for url in super().get_urls()
+        ]
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # pending messages (e.g. "changed successfully") are part of the page
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            response = super().change_view(request, object_id, form_url, extra_context)
+            add_never_cache_headers(response)
+            return response
+
+        view = condition(
+            etag_func=lambda request, *args: self._change_view_validators(request, object_id)[0],
+            last_modified_func=lambda request, *args: self._change_view_validators(request, object_id)[1],
+        )(super().change_view)
+        response = view(request, object_id, form_url, extra_context)
+        # the page is per user and must be revalidated on every load, but
+        # unlike the admin's default never_cache, browsers may keep it (no
+        # no-store) so that they can revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def user_autocomplete_widget(db_field, admin_site, multiple=True):
+    """ Autocomplete widget for a foreign key/M2M to User, see SourcesUserAdmin """
+    widget_class = UserAutocompleteSelectMultiple if multiple else UserAutocompleteSelect
+    return widget_class(db_field.remote_field, admin_site)
+
+
+class SourcesUserAdmin(AutocompleteAdminMixin, UserAdmin):
+    """ The stock User admin, with autocomplete served from the user directory """
+    autocomplete_view_class = UserDirectoryAutocompleteJsonView
+
+    def autocomplete_label(self, obj):
+        return get_user_display_name(obj)
+
+    def has_autocomplete_permission(self, request):
+        # any editor can pick interviewers/dive members, as with the old select lists
+        return request.user.is_active and request.user.is_staff
+
+
+class DiveAdmin(AutocompleteAdminMixin, admin.ModelAdmin):
     fields = ['name', 'users']
-    filter_horizontal = ['users']
     list_display = ['name']
     search_fields = ['name']
+    ordering = ['name']
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         """
@@ -55,20 +232,22 @@ class DiveAdmin(admin.ModelAdmin):
             Allows us to display user's full name in select dropdowns
         """
         if db_field.name == 'users':
-            return UserChoiceField(queryset=User.objects.all(), widget=FilteredSelectMultiple('users', is_stacked=False))
+            return UserChoiceField(queryset=User.objects.all(), widget=user_autocomplete_widget(db_field, self.admin_site))
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
-class ExpertiseAdmin(admin.ModelAdmin):
+class ExpertiseAdmin(LookupMergeAdminMixin, AutocompleteAdminMixin, admin.ModelAdmin):
     fields = ['name']
     list_display = ['name']
     search_fields = ['name']
+    ordering = ['name']
 
 
-class IndustryAdmin(admin.ModelAdmin):
+class IndustryAdmin(LookupMergeAdminMixin, AutocompleteAdminMixin, admin.ModelAdmin):
     fields = ['name']
     list_display = ['name']
     search_fields = ['name']
+    ordering = ['name']
 
 
 # TO-DO: need a way to hide private interactions in the inline
@@ -99,13 +278,7 @@ class InteractionInline(admin.TabularInline, CreatedByMixin):
         """ only show private interactions to the person who created them """
         qs = super(InteractionInline, self).get_queryset(request)
 
-        # if the interaction is not private, then include them
-        # if the interaction is private and created by that user, then include them
-        return qs.filter(
-            # IMPORANT! don't give superusers access to everything
-            ~Q(privacy_level__contains='private') | \
-            Q(created_by=request.user, privacy_level='private_individual')
-        )
+        return qs.visible_to(request.user).prefetch_related(prefetch_interviewer_ids())
 
     def interviewers_listview(self, obj):
         return InteractionAdmin.interviewers_listview(None, obj)
@@ -133,7 +306,7 @@ class InteractionNewInline(admin.TabularInline, CreatedByMixin):
             a class in the select widget to enforce the correct dropdown
         """
         if db_field.name == 'created_by':
-            return UserChoiceField(queryset=User.objects.all(), widget=Select(attrs={'class': 'select'}), initial=request.user.id)
+            return SingleUserChoiceField(queryset=User.objects.all(), widget=user_autocomplete_widget(db_field, self.admin_site, multiple=False), initial=request.user.id)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
@@ -142,14 +315,20 @@ class InteractionNewInline(admin.TabularInline, CreatedByMixin):
             Allows us to display user's full name in select dropdowns
         """
         if db_field.name == 'interviewer':
-            return UserChoiceField(queryset=User.objects.all(), widget=FilteredSelectMultiple('interviewer', is_stacked=False))
+            return UserChoiceField(queryset=User.objects.all(), widget=user_autocomplete_widget(db_field, self.admin_site))
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
-class InteractionAdmin(admin.ModelAdmin, CreatedByMixin):
+class InteractionAdmin(ConditionalChangeViewMixin, admin.ModelAdmin, CreatedByMixin):
     list_display = ['interviewee', 'interaction_type', 'date_time', 'get_created_by', 'interviewers_listview', 'privacy_level']
     list_filter = ['interaction_type']
-    filter_horizontal = ['interviewer']
+    # only sources the user can see are offered; see PersonAdmin.get_queryset
+    autocomplete_fields = ['interviewee']
+    # searched through the search backend; see get_search_results
+    search_fields = ['notes']
+    # avoid COUNT(*)/OFFSET on the full table; see sources/pagination.py
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     _fields_always_readonly = ['get_created_by']
     _fields_before_notes = ['privacy_level', 'date_time', 'interaction_type', 'interviewee', 'interviewer']
@@ -237,13 +416,118 @@ class InteractionAdmin(admin.ModelAdmin, CreatedByMixin):
         """ only show private interactions to the person who created them """
         qs = super(InteractionAdmin, self).get_queryset(request)
 
-        # if the source is not private, then include them
-        # if the source is private and created by that user, then include them
-        return qs.filter(
-            # IMPORANT! don't give superusers access to everything
-            ~Q(privacy_level__contains='private') | \
-            Q(created_by=request.user, privacy_level='private_individual')
+        return qs.visible_to(request.user).prefetch_related(prefetch_interviewer_ids())
+
+    def change_view_state(self, request, pk):
+        """ See ConditionalChangeViewMixin """
+        row = (
+            Interaction.objects.visible_to(request.user).filter(pk=pk).order_by()
+            .values('updated', 'privacy_level', 'created_by_id')
+            .annotate(
+                interviewee_updated=Max('interviewee__updated'),
+                is_interviewer=Count('interviewer', filter=Q(interviewer=request.user.pk)),
+            )
+            .first()
+        )
+        if row is None:
+            return None
+        # the viewer's privacy class, as in _determine_whether_to_hide_notes/get_readonly_fields
+        if row['created_by_id'] == request.user.pk:
+            privacy_class = 'creator'
+        elif row['is_interviewer']:
+            privacy_class = 'interviewer'
+        elif row['privacy_level'] in ['searchable', 'private_individual']:
+            privacy_class = 'hidden'
+        else:
+            privacy_class = 'read-only'
+        last_modified = max(filter(None, [row['updated'], row['interviewee_updated']]), default=None)
+        return last_modified, sorted(row.items()) + [('privacy_class', privacy_class)]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search notes through the configured search backend, only matching
+        interactions whose notes the user can read (see
+        _determine_whether_to_hide_notes) so hidden notes can't be probed.
+        """
+        if not search_term:
+            return queryset, False
+        current_user = request.user
+        interviewed = Interaction.objects.filter(interviewer=current_user).values('pk')
+        queryset = queryset.filter(
+            Q(privacy_level='public') |
+            Q(created_by=current_user) |
+            Q(privacy_level='searchable', pk__in=interviewed)
+        )
+        return search_backend.filter_interactions(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path('import-calendar/', self.admin_site.admin_view(self.import_calendar_view), name='sources_interaction_import_calendar'),
+            path('analytics/', self.admin_site.admin_view(self.analytics_view), name='sources_interaction_analytics'),
+        ] + super().get_urls()
+
+    def analytics_view(self, request):
+        """ Interaction counts per month, type, interviewer and dive, see sources/analytics.py """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            months = int(request.GET.get('months', ANALYTICS_DEFAULT_PERIOD))
+        except ValueError:
+            months = ANALYTICS_DEFAULT_PERIOD
+        if months not in ANALYTICS_PERIODS:
+            months = ANALYTICS_DEFAULT_PERIOD
+        analytics = interaction_analytics(months)
+        names = user_directory.display_names([user_id for user_id, count in analytics['per_interviewer']])
+        types = dict(Interaction.INTERACTION_CHOICES)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Interaction analytics',
+            opts=self.model._meta,
+            months=months,
+            periods=ANALYTICS_PERIODS,
+            analytics=analytics,
+            per_type=[(types.get(interaction_type) or interaction_type or 'Unspecified', count) for interaction_type, count in analytics['per_type']],
+            per_interviewer=[(names.get(user_id, ''), count) for user_id, count in analytics['per_interviewer']],
+            max_per_month=max([count for month, count in analytics['per_month']] + [1]),
+        )
+        return TemplateResponse(request, 'admin/sources/interaction/analytics.html', context)
+
+    def import_calendar_view(self, request):
+        """ Log interactions from an uploaded .ics file, see sources/ics.py """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = CalendarImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            calendar_import = CalendarImport(
+                request.user,
+                privacy_level=form.cleaned_data['privacy_level'],
+                interaction_type=form.cleaned_data['interaction_type'],
+                include_future=form.cleaned_data['include_future'],
+            )
+            # the upload is read line by line, not into memory
+            counts = calendar_import.add_file(
+                line.decode('utf-8', 'replace') for line in form.cleaned_data['file']
+            )
+            skipped = ', '.join(
+                '{} {}'.format(count, reason) for reason, count in sorted(counts.items())
+                if reason not in ('events', 'created')
+            )
+            self.message_user(request, 'Logged {} interactions from {} events{}.'.format(
+                counts['created'], counts['events'], ' (skipped: {})'.format(skipped) if skipped else '',
+            ), messages.SUCCESS)
+            return HttpResponseRedirect(reverse('admin:sources_interaction_changelist'))
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Import calendar',
+            opts=self.model._meta,
+            form=form,
         )
+        return TemplateResponse(request, 'admin/sources/interaction/import_calendar.html', context)
 
     def save_model(self, request, obj, form, change):
         ## associate the Interaction being created with the User who created them
@@ -260,14 +544,15 @@ class InteractionAdmin(admin.ModelAdmin, CreatedByMixin):
             Allows us to display user's full name in select dropdowns
         """
         if db_field.name == 'interviewer':
-            return UserChoiceField(queryset=User.objects.all(), widget=FilteredSelectMultiple('interviewer', is_stacked=False))
+            return UserChoiceField(queryset=User.objects.all(), widget=user_autocomplete_widget(db_field, self.admin_site))
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
     def interviewers_listview(self, obj):
-        interviewers_list = obj.interviewer.all()
-        interviewers = [get_user_display_name(interviewer) for interviewer in interviewers_list]
-        return ', '.join(interviewers)
+        # ids come from the prefetch in get_queryset, names from the directory
+        interviewer_ids = [interviewer.pk for interviewer in obj.interviewer.all()]
+        names = user_directory.display_names(interviewer_ids)
+        return ', '.join(names[pk] for pk in interviewer_ids if pk in names)
     interviewers_listview.short_description = 'Interviewer(s)'
 
 
@@ -277,108 +562,175 @@ class InteractionAdmin(admin.ModelAdmin, CreatedByMixin):
     notes_semiprivate_display.short_description = 'Notes'
 
 
-class OrganizationAdmin(admin.ModelAdmin):
+class OrganizationAdmin(LookupMergeAdminMixin, AutocompleteAdminMixin, admin.ModelAdmin):
     fields = ['name']
     list_display = ['name']
     search_fields = ['name']
+    ordering = ['name']
 
 
-# for SimpleListFilter classes
-all_sources = Person.objects.all()
-private_sources = all_sources.filter(privacy_level='private_individual')
-non_private_sources = all_sources.exclude(privacy_level='private_individual')
-
-
-# for SimpleListFilter classes
-def get_displayable_list(private_items, non_private_items):
-    overlap_set = set(private_items) & set(non_private_items)
-
-    set(non_private_items).update(overlap_set)
-
-    displayable_list = list(set(non_private_items))
-
-    return displayable_list
-
-
-class ExpertiseFilter(SimpleListFilter):
-    title = 'Expertise'
-    parameter_name = 'expertise__name'
+class LookupNameFilter(SimpleListFilter):
+    """
+    Filter sources by the name of a linked Expertise/Industry/Organization,
+    offering the names linked to at least one non-private source. The
+    options come from the cache, see sources/cache.py.
+    """
 
     def lookups(self, request, model_admin):
-        private_expertise = [expertise.name for source in private_sources for expertise in source.expertise.all()]
-        non_private_expertise = [expertise.name for source in non_private_sources for expertise in source.expertise.all()]
-
-        options = get_displayable_list(private_expertise, non_private_expertise)
-        filters_list = [(option, option) for option in options]
-
-        return tuple(filters_list)
-
+        field_name = self.parameter_name.split('__')[0]
+        return tuple((name, name) for name in displayable_names(field_name))
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(expertise__name=self.value())
+            return queryset.filter(**{self.parameter_name: self.value()})
         else:
             return queryset
 
 
-class IndustryFilter(SimpleListFilter):
+class ExpertiseFilter(LookupNameFilter):
+    title = 'Expertise'
+    parameter_name = 'expertise__name'
+
+
+class IndustryFilter(LookupNameFilter):
     title = 'Industry'
     parameter_name = 'industries__name'
 
-    def lookups(self, request, model_admin):
-        private_industries = [industry.name for source in private_sources for industry in source.industries.all()]
-        non_private_industries = [industry.name for source in non_private_sources for industry in source.industries.all()]
 
-        options = get_displayable_list(private_industries, non_private_industries)
-        filters_list = [(option, option) for option in options]
+class OrganizationFilter(LookupNameFilter):
+    title = 'Organization'
+    parameter_name = 'organization__name'
 
-        return tuple(filters_list)
 
+class LastContactedFilter(SimpleListFilter):
+    """ Filter sources by Person.last_interaction_at (indexed, see sources/summaries.py) """
+    title = 'Last contacted'
+    parameter_name = 'last_contacted'
+    # option -> days
+    periods = {
+        '30d': 30,
+        '90d': 90,
+        '1y': 365,
+    }
+
+    def lookups(self, request, model_admin):
+        return (
+            ('30d', 'In the last 30 days'),
+            ('90d', 'In the last 90 days'),
+            ('1y', 'In the last year'),
+            ('over1y', 'Over a year ago'),
+            ('never', 'Never'),
+        )
 
     def queryset(self, request, queryset):
-        if self.value():
-            return queryset.filter(industries__name=self.value())
+        value = self.value()
+        if value in self.periods:
+            return queryset.filter(last_interaction_at__gte=timezone.now() - timedelta(days=self.periods[value]))
+        elif value == 'over1y':
+            return queryset.filter(last_interaction_at__lt=timezone.now() - timedelta(days=365))
+        elif value == 'never':
+            return queryset.filter(last_interaction_at__isnull=True)
         else:
             return queryset
 
 
-class OrganizationFilter(SimpleListFilter):
-    title = 'Organization'
-    parameter_name = 'organization__name'
+class InteractionCountFilter(SimpleListFilter):
+    """ Filter sources by Person.interaction_count """
+    title = 'Number of interactions'
+    parameter_name = 'interactions'
 
     def lookups(self, request, model_admin):
-        private_organizations = [organization.name for source in private_sources for organization in source.organization.all()]
-        non_private_organizations = [organization.name for source in non_private_sources for organization in source.organization.all()]
-
-        options = get_displayable_list(private_organizations, non_private_organizations)
-        filters_list = [(option, option) for option in options]
-
-        return tuple(filters_list)
-
+        return (
+            ('0', 'None'),
+            ('1', '1 or more'),
+            ('5', '5 or more'),
+            ('10', '10 or more'),
+        )
 
     def queryset(self, request, queryset):
-        if self.value():
-            return queryset.filter(organization__name=self.value())
+        if self.value() == '0':
+            return queryset.filter(interaction_count=0)
+        elif self.value() in ('1', '5', '10'):
+            return queryset.filter(interaction_count__gte=int(self.value()))
         else:
             return queryset
 
 
-class PersonAdmin(admin.ModelAdmin, CreatedByMixin):
-    list_display = ['name', 'updated', 'get_created_by', 'privacy_level']
-    list_filter = [IndustryFilter, ExpertiseFilter, OrganizationFilter, 'city', 'state', 'privacy_level', 'gatekeeper']
-    search_fields = ['city', 'country', 'email_address', 'expertise__name', 'first_name', 'name', 'import_notes', 'organization', 'state', 'title', 'type_of_expert', 'twitter', 'website']
-    filter_horizontal = ['expertise', 'industries', 'organization', 'exportable_by']
-    readonly_fields = ['entry_method', 'entry_type', 'get_created_by', 'updated', 'import_notes']
+class PersonAdmin(ConditionalChangeViewMixin, AutocompleteAdminMixin, admin.ModelAdmin, CreatedByMixin):
+    list_display = ['name', 'organization_names', 'expertise_names', 'last_interaction_at', 'interaction_count', 'updated', 'get_created_by', 'privacy_level']
+    # names are shown from the pre-joined summaries; see sources/summaries.py
+    list_select_related = ['summary']
+    list_filter = [IndustryFilter, ExpertiseFilter, OrganizationFilter, LastContactedFilter, InteractionCountFilter, 'city', 'state', 'privacy_level', 'gatekeeper']
+    # searched through the full-text search vector; see get_search_results
+    search_fields = ['name', 'title', 'organization__name', 'expertise__name', 'industries__name', 'import_notes']
+    autocomplete_fields = ['expertise', 'industries', 'organization', 'exportable_by']
+    # see formfield_for_choice_field
+    cached_select_fields = ['country', 'timezone']
+    readonly_fields = ['entry_method', 'entry_type', 'get_created_by', 'updated', 'last_interaction_at', 'interaction_count', 'import_notes']
     # save_as = True
     save_on_top = True
     view_on_site = False  # THIS DOES NOT WORK CURRENTLY
     inlines = (InteractionInline, InteractionNewInline,)
+    # avoid COUNT(*)/OFFSET on the full table; see sources/pagination.py
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    actions = ['merge_selected_sources']
 
     class Media:
         css = {
             'all': ('css/admin/change-link.css',)
         }
 
+    def merge_selected_sources(self, request, queryset):
+        """ Merge the selected sources into the one chosen on a confirmation page, see sources/merge.py """
+        people = list(queryset.order_by('pk'))
+        if len(people) < 2:
+            self.message_user(request, 'Select at least two sources to merge.', messages.WARNING)
+            return None
+        if request.POST.get('survivor'):
+            try:
+                source_merge = merge_sources(int(request.POST['survivor']), people, request.user)
+            except (MergeError, ValueError) as error:
+                self.message_user(request, 'Could not merge the sources: {}'.format(error), messages.ERROR)
+            else:
+                self.message_user(request, 'Merged {} into {}.'.format(source_merge.merged_ids, source_merge.survivor_name), messages.SUCCESS)
+            return None
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Merge sources',
+            opts=self.model._meta,
+            people=people,
+            action_checkbox_name=ACTION_CHECKBOX_NAME,
+        )
+        return TemplateResponse(request, 'admin/sources/person/merge.html', context)
+    merge_selected_sources.short_description = 'Merge selected sources'
+    merge_selected_sources.allowed_permissions = ('change', 'delete')
+
+    def _summary(self, obj):
+        # None until the summary is first built, right after the save commits
+        return getattr(obj, 'summary', None)
+
+    def organization_names(self, obj):
+        summary = self._summary(obj)
+        return summary.organization_names if summary else ''
+    organization_names.short_description = 'Organization'
+    organization_names.admin_order_field = 'summary__organization_names'
+
+    def expertise_names(self, obj):
+        summary = self._summary(obj)
+        return summary.expertise_names if summary else ''
+    expertise_names.short_description = 'Expertise'
+    expertise_names.admin_order_field = 'summary__expertise_names'
+
+    def get_created_by(self, obj):
+        summary = self._summary(obj)
+        if summary is None:
+            return super().get_created_by(obj)
+        return summary.created_by_name
+    get_created_by.short_description = 'Created By'
+
     def email_address_semiprivate_display(self, obj):
         display_text = 'Please contact <strong>{}</strong> for this information'.format(obj.created_by)
         return format_html(display_text)
@@ -501,6 +853,8 @@ class PersonAdmin(admin.ModelAdmin, CreatedByMixin):
                     'get_created_by',
                     # 'last_updated_by',
                     'updated',
+                    'last_interaction_at',
+                    'interaction_count',
                     'import_notes',
                 ),
             }),
@@ -511,13 +865,66 @@ class PersonAdmin(admin.ModelAdmin, CreatedByMixin):
         """ only show private sources to the person who created them """
         qs = super(PersonAdmin, self).get_queryset(request)
 
-        # if the source is not private, then include them
-        # if the source is private and created by that user, then include them
-        return qs.filter(
-            # IMPORANT! don't give superusers access to everything
-            ~Q(privacy_level__contains='private') | \
-            Q(created_by=request.user, privacy_level='private_individual')
+        return qs.visible_to(request.user)
+
+
+    def change_view_state(self, request, pk):
+        """ See ConditionalChangeViewMixin """
+        row = (
+            Person.objects.visible_to(request.user).filter(pk=pk).order_by()
+            .values('updated', 'privacy_level', 'created_by_id')
+            .annotate(
+                # the interactions inline
+                interactions_updated=Max('interviewee__updated'),
+                interaction_count=Count('interviewee'),
+            )
+            .first()
         )
+        if row is None:
+            return None
+        # the viewer's privacy class, as in _determine_whether_to_hide_contact_data
+        if row['created_by_id'] == request.user.pk:
+            privacy_class = 'creator'
+        elif row['privacy_level'] in ['searchable', 'private_individual']:
+            privacy_class = 'hidden'
+        else:
+            privacy_class = 'public'
+        last_modified = max(filter(None, [row['updated'], row['interactions_updated']]), default=None)
+        return last_modified, sorted(row.items()) + [('privacy_class', privacy_class)]
+
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+    def formfield_for_choice_field(self, db_field, request, **kwargs):
+        """ Render the long, static time zone and country lists from cache """
+        if db_field.name in self.cached_select_fields:
+            kwargs['widget'] = CachedSelect
+        return super().formfield_for_choice_field(db_field, request, **kwargs)
+
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search through the configured search backend (see
+        sources/search_backends.py) rather than OR-ing icontains over every
+        search field. Results are ranked by KeysetChangeList unless the user
+        sorts by a column. An email address, phone number, @handle or URL is
+        looked up in the contact identifiers instead (see sources/identifiers.py),
+        only among sources whose contact data the user can see (see
+        _determine_whether_to_hide_contact_data) so hidden ones can't be probed;
+        without a match there it's searched like any other term.
+        """
+        if not search_term:
+            return queryset, False
+        candidates = lookup_candidates(search_term, handles=False)
+        if candidates:
+            matches = queryset.contact_visible_to(request.user).filter(
+                pk__in=ContactIdentifier.objects.filter(value__in=candidates).values('person_id')
+            )
+            if matches.exists():
+                return matches, False
+        return search_backend.filter_people(queryset, search_term), False
 
 
     def get_fieldsets(self, request, obj=None):
@@ -587,11 +994,153 @@ class PersonAdmin(admin.ModelAdmin, CreatedByMixin):
         super(PersonAdmin, self).save_model(request, obj, form, change)
 
 
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    """ The review queue of likely duplicate sources, filled by `manage.py find_duplicates` """
+    list_display = ['person_a_link', 'person_b_link', 'score', 'matching_fields', 'status', 'get_reviewed_by']
+    list_filter = ['status']
+    list_select_related = ['person_a', 'person_b']
+    fields = ['person_a_link', 'person_b_link', 'score', 'matching_fields', 'status', 'get_reviewed_by']
+    readonly_fields = ['person_a_link', 'person_b_link', 'score', 'matching_fields', 'get_reviewed_by']
+    actions = ['dismiss', 'merge_pairs']
+
+    def get_queryset(self, request):
+        """ Only pairs of sources the user can see """
+        visible = Person.objects.visible_to(request.user)
+        return super().get_queryset(request).filter(person_a__in=visible, person_b__in=visible)
+
+    def has_add_permission(self, request):
+        return False
+
+    def _person_link(self, person):
+        url = reverse('admin:sources_person_change', args=[person.pk])
+        return format_html('<a href="{}">{}</a> ({})', url, person.name or '', person.pk)
+
+    def person_a_link(self, obj):
+        return self._person_link(obj.person_a)
+    person_a_link.short_description = 'Source'
+
+    def person_b_link(self, obj):
+        return self._person_link(obj.person_b)
+    person_b_link.short_description = 'Possible duplicate'
+
+    def get_reviewed_by(self, obj):
+        return user_directory.display_name(obj.reviewed_by_id) if obj.reviewed_by_id else ''
+    get_reviewed_by.short_description = 'Reviewed by'
+
+    def save_model(self, request, obj, form, change):
+        if 'status' in form.changed_data:
+            obj.reviewed_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def dismiss(self, request, queryset):
+        """ Mark the selected pairs as not duplicates; find_duplicates won't suggest them again """
+        updated = queryset.update(status='dismissed', reviewed_by=request.user)
+        self.message_user(request, 'Dismissed {} pairs.'.format(updated), messages.SUCCESS)
+    dismiss.short_description = 'Mark as not duplicates'
+
+    def has_merge_permission(self, request):
+        return request.user.has_perms(['sources.change_person', 'sources.delete_person'])
+
+    def merge_pairs(self, request, queryset):
+        """
+        Merge each selected pair; pairs that share a source are merged
+        together, into the source that was entered first
+        """
+        # union-find over the selected pairs
+        parents = {}
+
+        def root(pk):
+            while parents.setdefault(pk, pk) != pk:
+                pk = parents[pk]
+            return pk
+
+        for person_a_id, person_b_id in queryset.values_list('person_a_id', 'person_b_id'):
+            first, second = sorted([root(person_a_id), root(person_b_id)])
+            parents[second] = first
+        groups = defaultdict(list)
+        for pk in parents:
+            groups[root(pk)].append(pk)
+
+        merged = 0
+        for survivor_id, pks in groups.items():
+            try:
+                merge_sources(survivor_id, pks, request.user)
+                merged += len(pks) - 1
+            except MergeError as error:
+                self.message_user(request, 'Could not merge {}: {}'.format(', '.join(map(str, sorted(pks))), error), messages.ERROR)
+        self.message_user(request, 'Merged {} sources into {}.'.format(merged, len(groups)), messages.SUCCESS)
+    merge_pairs.short_description = 'Merge the sources of each pair'
+    merge_pairs.allowed_permissions = ('merge',)
+
+
+class LookupAliasAdmin(admin.ModelAdmin):
+    list_display = ['alias', 'normalized_name', 'kind']
+    list_filter = ['kind']
+    search_fields = ['alias', 'normalized_name']
+
+    def save_model(self, request, obj, form, change):
+        ## aliases are compared with normalized names
+        obj.alias = normalize_name(obj.alias, obj.kind)
+        obj.normalized_name = normalize_name(obj.normalized_name, obj.kind)
+        super().save_model(request, obj, form, change)
+
+
+class SourceMergeAdmin(admin.ModelAdmin):
+    """ The audit log of merged sources, see sources/merge.py """
+    list_display = ['created', 'survivor_link', 'merged_ids', 'get_merged_by']
+    fields = ['created', 'survivor_link', 'merged_ids', 'get_merged_by', 'details_display']
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        """ only show merges into sources the user can see, and their own merges into since deleted ones """
+        qs = super().get_queryset(request)
+        return qs.filter(
+            Q(survivor__in=Person.objects.visible_to(request.user)) |
+            Q(survivor__isnull=True, merged_by=request.user)
+        )
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            # never saved, the admin is read-only
+            obj.details = visible_details(obj.details, request.user)
+        return obj
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def survivor_link(self, obj):
+        if obj.survivor_id is None:
+            return '{} (deleted)'.format(obj.survivor_name)
+        url = reverse('admin:sources_person_change', args=[obj.survivor_id])
+        return format_html('<a href="{}">{}</a> ({})', url, obj.survivor_name, obj.survivor_id)
+    survivor_link.short_description = 'Survivor'
+
+    def get_merged_by(self, obj):
+        return user_directory.display_name(obj.merged_by_id) if obj.merged_by_id else ''
+    get_merged_by.short_description = 'Merged by'
+
+    def details_display(self, obj):
+        return format_html('<pre>{}</pre>', obj.details)
+    details_display.short_description = 'Details'
+
+
 admin.site.register(Dive, DiveAdmin)
+admin.site.register(DuplicateCandidate, DuplicateCandidateAdmin)
 admin.site.register(Expertise, ExpertiseAdmin)
 admin.site.register(Organization, OrganizationAdmin)
 admin.site.register(Industry, IndustryAdmin)
+admin.site.register(LookupAlias, LookupAliasAdmin)
 admin.site.register(Interaction, InteractionAdmin)
 admin.site.register(Person, PersonAdmin)
+admin.site.register(SourceMerge, SourceMergeAdmin)
+admin.site.unregister(User)
+admin.site.register(User, SourcesUserAdmin)
 
 admin.site.site_header = 'Source Dive'
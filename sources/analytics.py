@@ -0,0 +1,193 @@
+"""
+Interaction counts per interviewer, type, month and dive, for the analytics
+page of the Interaction admin.
+
+Grouping millions of interactions (and their interviewers) for every page
+view is too slow, so the counts are kept in the InteractionRollup table, one
+row per (interviewer, interaction type, day) with the number of interactions.
+Rows without a user count every interaction once, whatever its interviewers;
+the per-type and per-month totals come from those. The per-dive counts add
+up the dive members' rows, so an interaction with two interviewers in a dive
+counts twice there.
+
+Days are in settings.TIME_ZONE. update_rollup() recomputes whole days after
+the transaction that changed their interactions commits (see REFRESHERS in
+sources/signals.py), which stays correct when an interaction moves to
+another day or changes interviewers without having to know the old values.
+`manage.py rebuild_rollup` recomputes every day.
+
+The page's numbers are cached in the 'analytics' namespace of
+sources/cache.py, which is invalidated whenever the rollup changes.
+"""
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from sources.cache import read_through
+
+
+ROLLUP_BATCH_SIZE = 5000
+# days recomputed per query
+ROLLUP_DAYS_PER_QUERY = 100
+ANALYTICS_PERIODS = [3, 12, 24]
+ANALYTICS_DEFAULT_PERIOD = 12
+# first key of the Postgres advisory locks taken per day, see _lock_days
+ROLLUP_LOCK_CLASS = 4350
+
+
+def local_day(value):
+    """ The day (in settings.TIME_ZONE) of a datetime, or of an ISO string as saved on an unsaved instance """
+    tz = timezone.get_default_timezone()
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        # as the database stores it
+        value = timezone.make_aware(value, tz)
+    return timezone.localtime(value, tz).date()
+
+
+def _day_range(day):
+    """ Q for the datetimes within a day in settings.TIME_ZONE """
+    tz = timezone.get_default_timezone()
+    return Q(
+        date_time__gte=timezone.make_aware(datetime.combine(day, time.min), tz),
+        date_time__lt=timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz),
+    )
+
+
+def interaction_days(interaction_ids, interaction_model=None):
+    """ The days of the given interactions """
+    if interaction_model is None:
+        from sources.models import Interaction as interaction_model
+    return {
+        local_day(date_time)
+        for date_time in interaction_model.objects.filter(pk__in=list(interaction_ids)).values_list('date_time', flat=True)
+    }
+
+
+def rollup_counts(interactions):
+    """ Counter of (user id or None, interaction type, day) for an Interaction queryset """
+    counts = Counter()
+    # TruncDate uses the current time zone
+    with timezone.override(timezone.get_default_timezone()):
+        per_interviewer = (
+            interactions.filter(interviewer__isnull=False).order_by()
+            .values_list('interviewer', 'interaction_type', TruncDate('date_time'))
+            .annotate(count=Count('pk'))
+        )
+        for user_id, interaction_type, day, count in per_interviewer:
+            counts[user_id, interaction_type, day] = count
+        per_day = (
+            interactions.order_by()
+            .values_list('interaction_type', TruncDate('date_time'))
+            .annotate(count=Count('pk'))
+        )
+        for interaction_type, day, count in per_day:
+            counts[None, interaction_type, day] = count
+    return counts
+
+
+def _lock_days(days):
+    # two concurrent recomputations of a day would both insert its rows
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s, day) FROM unnest(%s::int[]) AS day ORDER BY day',
+                [ROLLUP_LOCK_CLASS, sorted(day.toordinal() for day in days)],
+            )
+
+
+def update_rollup(days=None, interaction_model=None, rollup_model=None, batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Recompute the InteractionRollup rows of the given days, or of every day
+    when days is None. Takes the models so migrations can pass in their
+    historical ones.
+    """
+    if interaction_model is None:
+        from sources.models import Interaction as interaction_model
+    if rollup_model is None:
+        from sources.models import InteractionRollup as rollup_model
+
+    if days is None:
+        chunks = [None]
+    else:
+        days = sorted(set(days))
+        chunks = [days[start:start + ROLLUP_DAYS_PER_QUERY] for start in range(0, len(days), ROLLUP_DAYS_PER_QUERY)]
+    for chunk in chunks:
+        with transaction.atomic():
+            if chunk is None:
+                interactions = interaction_model.objects.all()
+                rollup_model.objects.all().delete()
+            else:
+                _lock_days(chunk)
+                in_days = Q()
+                for day in chunk:
+                    in_days |= _day_range(day)
+                interactions = interaction_model.objects.filter(in_days)
+                rollup_model.objects.filter(day__in=chunk).delete()
+            rollup_model.objects.bulk_create([
+                rollup_model(user_id=user_id, interaction_type=interaction_type, day=day, count=count)
+                for (user_id, interaction_type, day), count in rollup_counts(interactions).items()
+            ], batch_size=batch_size)
+
+
+def month_start(day, months_back=0):
+    """ The first day of the month months_back months before day's """
+    month = day.year * 12 + day.month - 1 - months_back
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def interaction_analytics(months=ANALYTICS_DEFAULT_PERIOD):
+    """
+    Interaction counts over the last `months` calendar months (this one
+    included), from the rollup and cached until it changes:
+
+        {
+            'since': date,
+            'total': int,
+            'per_month': [(first day of the month, count)],
+            'per_type': [(interaction type, count)],
+            'per_interviewer': [(user id, count)],
+            'per_dive': [(dive name, count)],
+        }
+
+    Lists other than per_month are ordered by count, highest first.
+    """
+    from sources.models import InteractionRollup
+
+    since = month_start(timezone.localdate(), months - 1)
+
+    def load():
+        rows = InteractionRollup.objects.filter(day__gte=since).order_by()
+        totals = rows.filter(user=None)
+        interviewers = rows.filter(user__isnull=False)
+
+        def grouped(queryset, *fields):
+            return [
+                tuple(row) for row in
+                queryset.values_list(*fields).annotate(total=Sum('count')).order_by('-total', *fields)
+            ]
+
+        counts = dict(
+            totals.annotate(month=TruncMonth('day')).values_list('month').annotate(total=Sum('count'))
+        )
+        # months without interactions too
+        per_month = [
+            (month_start(since, -offset), counts.get(month_start(since, -offset), 0))
+            for offset in range(months)
+        ]
+        return {
+            'since': since,
+            'total': sum(count for month, count in per_month),
+            'per_month': per_month,
+            'per_type': grouped(totals, 'interaction_type'),
+            'per_interviewer': grouped(interviewers, 'user'),
+            'per_dive': grouped(interviewers.filter(user__dive_members__isnull=False), 'user__dive_members__name'),
+        }
+
+    return read_through('analytics', '{}:{}'.format(since.isoformat(), months), load)
@@ -0,0 +1,353 @@
+"""
+Read-only JSON API over sources and interactions, for other newsroom tools.
+
+    /sources/api/sources/?fields=name,email_address,expertise&limit=500
+    /sources/api/sources/<id>/
+    /sources/api/interactions/?interviewee=<source id>
+    POST /sources/api/interactions/bulk/   (see sources/bulk.py)
+    /sources/api/lookup/?q=+1 (202) 555-0123   (see sources/identifiers.py)
+
+Staff only, with the same privacy rules as the admin: rows come from
+visible_to(user), and the contact details/notes the admin would hide from
+the user are returned as null.
+
+Lists are ordered like the admin changelists (newest first) and paged with
+a keyset cursor: each page links to the next one through an opaque `cursor`
+parameter, so a page deep into a large pull costs the same as the first.
+Rows are serialized straight from .values() with only the requested columns
+(`fields=`, default all), and M2M names are fetched for the whole page with
+one query per M2M field; no model instances are created.
+"""
+import json
+from collections import defaultdict
+from functools import partial, wraps
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_http_methods
+
+from sources.bulk import BULK_MAX_ITEMS, log_interactions
+from sources.directory import user_directory
+from sources.identifiers import lookup_candidates
+from sources.models import ContactIdentifier, Interaction, Person
+from sources.pagination import decode_cursor, encode_cursor, seek
+
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+
+class APIError(Exception):
+    """ A bad request, answered with a 400 and this message """
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view=None, methods=('GET',)):
+    """ GET only (by default), staff only, with APIErrors turned into 400 responses """
+    if view is None:
+        return partial(api_view, methods=methods)
+
+    @require_http_methods(methods)
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not (request.user.is_active and request.user.is_staff):
+            return _json({'error': 'Authentication required'}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except APIError as error:
+            return _json({'error': str(error)}, status=400)
+    return wrapped
+
+
+class Resource(object):
+    """ How a model is listed and serialized by the API """
+
+    model = None
+    # the model's descending default ordering field; pages seek on it and the pk
+    keyset_field = None
+    # API name -> column
+    fields = {}
+    # API name -> (M2M field, column of the related model to list)
+    m2m_fields = {}
+    # columns the privacy rules need, fetched whether requested or not
+    private_columns = []
+
+    def get_queryset(self, user):
+        return self.model.objects.visible_to(user)
+
+    def filter(self, queryset, params):
+        """ Apply the resource's query string filters """
+        if params.get('updated_since'):
+            updated_since = parse_datetime(params['updated_since'])
+            if updated_since is None:
+                raise APIError('updated_since must be an ISO 8601 date and time.')
+            queryset = queryset.filter(updated__gte=updated_since)
+        return queryset
+
+    def hide_private(self, rows, user):
+        """ Null the values the admin would hide from the user, in place """
+
+    def field_names(self, params):
+        requested = params.get('fields')
+        if not requested:
+            return list(self.fields) + list(self.m2m_fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields and name not in self.m2m_fields]
+        if unknown:
+            raise APIError('Unknown fields: {}. Available: {}.'.format(
+                ', '.join(unknown), ', '.join(list(self.fields) + list(self.m2m_fields))
+            ))
+        return names
+
+    def m2m_values(self, name, ids):
+        """ {row id: [related values]} for one M2M field, in one query """
+        field_name, column = self.m2m_fields[name]
+        field = self.model._meta.get_field(field_name)
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        related = defaultdict(list)
+        lookup = f'{target}__{column}' if column else f'{target}_id'
+        pairs = field.remote_field.through.objects.filter(**{f'{source}_id__in': ids}).values_list(f'{source}_id', lookup)
+        for row_id, value in pairs.order_by(lookup):
+            related[row_id].append(value)
+        return related
+
+    def values(self, queryset, names):
+        """ The queryset as value rows with the columns for the named fields """
+        columns = {'pk', self.keyset_field} | set(self.private_columns)
+        columns |= {self.fields[name] for name in names if name in self.fields}
+        return queryset.values(*columns)
+
+    def serialize(self, rows, names, user):
+        """ API representations of value rows from values() """
+        if not rows:
+            return []
+        self.hide_private(rows, user)
+        ids = [row['pk'] for row in rows]
+        m2m = {name: self.m2m_values(name, ids) for name in names if name in self.m2m_fields}
+        scalar_names = [name for name in names if name in self.fields]
+        return [
+            dict(
+                [('id', row['pk'])]
+                + [(name, row[self.fields[name]]) for name in scalar_names]
+                + [(name, related.get(row['pk'], [])) for name, related in m2m.items()]
+            )
+            for row in rows
+        ]
+
+
+class SourceResource(Resource):
+    model = Person
+    keyset_field = 'updated'
+    fields = {
+        'name': 'name',
+        'prefix': 'prefix',
+        'pronouns': 'pronouns',
+        'title': 'title',
+        'type_of_expert': 'type_of_expert',
+        'gatekeeper': 'gatekeeper',
+        'privacy_level': 'privacy_level',
+        'email_address': 'email_address',
+        'phone_number_primary': 'phone_number_primary',
+        'phone_number_secondary': 'phone_number_secondary',
+        'linkedin': 'linkedin',
+        'twitter': 'twitter',
+        'skype': 'skype',
+        'website': 'website',
+        'timezone': 'timezone',
+        'city': 'city',
+        'state': 'state',
+        'country': 'country',
+        'entry_method': 'entry_method',
+        'entry_type': 'entry_type',
+        'import_notes': 'import_notes',
+        'created_by': 'created_by_id',
+        'interaction_count': 'interaction_count',
+        'last_interaction_at': 'last_interaction_at',
+        'created': 'created',
+        'updated': 'updated',
+    }
+    m2m_fields = {
+        'expertise': ('expertise', 'name'),
+        'industries': ('industries', 'name'),
+        'organization': ('organization', 'name'),
+        'exportable_by': ('exportable_by', 'name'),
+    }
+    private_columns = ['privacy_level', 'created_by_id']
+    # see PersonAdmin._get_correct_contact_field_names
+    contact_columns = ['email_address', 'phone_number_primary', 'phone_number_secondary']
+
+    def hide_private(self, rows, user):
+        # as PersonAdmin._determine_whether_to_hide_contact_data
+        for row in rows:
+            if row['created_by_id'] != user.pk and row['privacy_level'] in ['searchable', 'private_individual']:
+                for column in self.contact_columns:
+                    if column in row:
+                        row[column] = None
+
+
+class InteractionResource(Resource):
+    model = Interaction
+    keyset_field = 'date_time'
+    fields = {
+        'date_time': 'date_time',
+        'interaction_type': 'interaction_type',
+        'interviewee': 'interviewee_id',
+        'privacy_level': 'privacy_level',
+        'notes': 'notes',
+        'created_by': 'created_by_id',
+        'created': 'created',
+        'updated': 'updated',
+    }
+    m2m_fields = {
+        # user ids; names are added from the user directory
+        'interviewers': ('interviewer', None),
+    }
+    private_columns = ['privacy_level', 'created_by_id']
+
+    def filter(self, queryset, params):
+        if params.get('interviewee'):
+            try:
+                queryset = queryset.filter(interviewee_id=int(params['interviewee']))
+            except ValueError:
+                raise APIError('interviewee must be a source id.')
+        return super().filter(queryset, params)
+
+    def m2m_values(self, name, ids):
+        related = super().m2m_values(name, ids)
+        names = user_directory.display_names({user_id for user_ids in related.values() for user_id in user_ids})
+        return {
+            row_id: [{'id': user_id, 'name': names.get(user_id, '')} for user_id in user_ids]
+            for row_id, user_ids in related.items()
+        }
+
+    def hide_private(self, rows, user):
+        # as InteractionAdmin._determine_whether_to_hide_notes
+        if 'notes' not in rows[0]:
+            return
+        hidden = [
+            row for row in rows
+            if row['privacy_level'] in ['searchable', 'private_individual'] and row['created_by_id'] != user.pk
+        ]
+        if not hidden:
+            return
+        interviewing = set(
+            Interaction.interviewer.through.objects.filter(
+                interaction_id__in=[row['pk'] for row in hidden if row['privacy_level'] == 'searchable'],
+                user_id=user.pk,
+            ).values_list('interaction_id', flat=True)
+        )
+        for row in hidden:
+            if row['pk'] not in interviewing:
+                row['notes'] = None
+
+
+RESOURCES = {
+    'sources': SourceResource(),
+    'interactions': InteractionResource(),
+}
+
+
+@api_view
+def resource_list(request, resource_name):
+    resource = RESOURCES.get(resource_name)
+    if resource is None:
+        return _json({'error': 'Not found'}, status=404)
+    try:
+        limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError:
+        raise APIError('limit must be a number.')
+    names = resource.field_names(request.GET)
+
+    field = resource.keyset_field
+    queryset = resource.filter(resource.get_queryset(request.user), request.GET).order_by(f'-{field}', '-pk')
+    if request.GET.get('cursor'):
+        try:
+            direction, value, pk = decode_cursor(request.GET['cursor'])
+        except IncorrectLookupParameters:
+            direction = None
+        if direction != 'n':
+            raise APIError('Invalid cursor.')
+        queryset = queryset.filter(seek(field, 'n', value, pk))
+
+    # one row past the page tells whether there is a next page
+    rows = list(resource.values(queryset, names)[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor('n', rows[-1][field], rows[-1]['pk'])
+        next_url = request.build_absolute_uri('{}?{}'.format(request.path, params.urlencode()))
+
+    return _json({'results': resource.serialize(rows, names, request.user), 'next': next_url})
+
+
+@api_view
+def resource_detail(request, resource_name, pk):
+    resource = RESOURCES.get(resource_name)
+    if resource is None:
+        return _json({'error': 'Not found'}, status=404)
+    names = resource.field_names(request.GET)
+    rows = list(resource.values(resource.get_queryset(request.user).filter(pk=pk), names))
+    if not rows:
+        return _json({'error': 'Not found'}, status=404)
+    return _json(resource.serialize(rows, names, request.user)[0])
+
+
+@api_view(methods=['POST'])
+def interactions_bulk(request):
+    """
+    Log many interactions in one request: {"interactions": [...]}, each item
+    as described in sources/bulk.py. Like any POST it needs the CSRF token
+    (X-CSRFToken header).
+    """
+    try:
+        items = json.loads(request.body.decode('utf-8'))['interactions']
+    except (UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise APIError('The body must be JSON with an "interactions" list.')
+    if not isinstance(items, list):
+        raise APIError('"interactions" must be a list.')
+    if len(items) > BULK_MAX_ITEMS:
+        raise APIError('At most {} interactions per request.'.format(BULK_MAX_ITEMS))
+
+    results = log_interactions(items, request.user)
+    return _json({
+        'created': sum(result['status'] == 'created' for result in results),
+        'failed': sum(result['status'] == 'error' for result in results),
+        'results': [dict(result, index=index) for index, result in enumerate(results)],
+    })
+
+
+@api_view
+def lookup(request):
+    """
+    The sources that have a contact identifier matching q, e.g. an email
+    address or phone number, among those whose contact details the user can
+    see (Person.objects.contact_visible_to), so the hidden details of other
+    users' semi-private sources can't be probed. Only names are returned.
+    """
+    term = request.GET.get('q', '')
+    candidates = lookup_candidates(term)
+    if not candidates:
+        raise APIError('q must be an email address, phone number, handle or URL.')
+    matches = list(
+        ContactIdentifier.objects.filter(value__in=candidates, person__in=Person.objects.contact_visible_to(request.user))
+        .order_by('person_id', 'kind')
+        .values_list('person_id', 'kind', 'person__name', 'person__privacy_level', 'person__created_by_id')
+    )
+    creators = user_directory.display_names({match[4] for match in matches if match[4]})
+    results = {}
+    for person_id, kind, name, privacy_level, created_by_id in matches:
+        result = results.setdefault(person_id, {
+            'id': person_id,
+            'name': name,
+            'privacy_level': privacy_level,
+            'created_by': creators.get(created_by_id),
+            'matched': [],
+        })
+        result['matched'].append(kind)
+    return _json({'query': term, 'results': list(results.values())})
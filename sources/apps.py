@@ -8,4 +8,5 @@ class SourcesConfig(AppConfig):
     verbose_name = 'Source Database'
 
     def ready(self):
-        Person = self.get_model('Person')
+        # connect the signal receivers
+        from sources import signals  # noqa: F401
@@ -0,0 +1,248 @@
+"""
+Logging many interactions at once, for tools that sync calls and meetings
+into sources instead of a reporter entering them one by one through
+InteractionNewInline (which validates a whole admin form and writes the
+interviewers with several queries per interaction).
+
+log_interactions(items, user) takes plain dicts:
+
+    {
+        "interviewee": "jane@example.com",      # or "interviewee_id": 12
+        "interviewers": [3, "jdoe"],            # user ids, usernames or emails;
+                                                # defaults to the logging user
+        "date_time": "2020-06-01T14:30:00-04:00",
+        "interaction_type": "telephone",        # optional
+        "privacy_level": "searchable",
+        "notes": "...",                         # optional
+    }
+
+and runs a fixed number of queries however many there are: one for all the
+interviewees (by email, case-insensitively, among the sources the user can
+see), one for all the interviewers, a bulk_create of the interactions and one
+of the interviewer through-table rows, all in one transaction. Items that
+don't validate are skipped and reported; the rest are created. The result
+has one entry per item, in order.
+"""
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from sources.choices import PRIVACY_CHOICES
+from sources.models import Interaction, Person
+from sources.signals import invalidate_cache_on_commit, schedule_refresh
+from sources.summaries import update_interaction_totals
+
+
+BULK_BATCH_SIZE = 500
+BULK_MAX_ITEMS = 1000
+
+INTERACTION_TYPES = {value for value, label in Interaction.INTERACTION_CHOICES}
+PRIVACY_LEVELS = {value for value, label in PRIVACY_CHOICES}
+
+
+def _interviewee_key(item):
+    """ ('id', pk), ('email', lowercased address) or None """
+    if item.get('interviewee_id') not in (None, ''):
+        try:
+            return ('id', int(item['interviewee_id']))
+        except (TypeError, ValueError):
+            return None
+    if isinstance(item.get('interviewee'), str) and item['interviewee'].strip():
+        return ('email', item['interviewee'].strip().lower())
+    return None
+
+
+def _interviewer_key(value):
+    """ ('id', pk), ('name', lowercased username or email) or None """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return ('id', value)
+    if isinstance(value, str) and value.strip():
+        value = value.strip()
+        return ('id', int(value)) if value.isdigit() else ('name', value.lower())
+    return None
+
+
+def _interviewer_values(item, user):
+    """ The item's interviewers as a list, the logging user if it has none """
+    values = item.get('interviewers', [user.pk])
+    return values if isinstance(values, list) else [values]
+
+
+def resolve_interviewees(keys, user):
+    """
+    {key: [source ids]} for _interviewee_key()s, in one query; only sources
+    visible to the user match
+    """
+    ids = {value for kind, value in keys if kind == 'id'}
+    emails = {value for kind, value in keys if kind == 'email'}
+    if not ids and not emails:
+        return {}
+    matches = {key: [] for key in keys}
+    rows = (
+        Person.objects.visible_to(user)
+        .annotate(email_address_lower=Lower('email_address'))
+        # lower(email_address) IN (...) uses the index from migration 0028
+        .filter(Q(pk__in=ids) | Q(email_address_lower__in=emails))
+        .order_by('-updated')
+        .values_list('pk', 'email_address_lower')
+    )
+    for pk, email in rows:
+        if ('id', pk) in matches:
+            matches[('id', pk)].append(pk)
+        if ('email', email) in matches:
+            matches[('email', email)].append(pk)
+    return matches
+
+
+def resolve_interviewers(keys):
+    """ {key: user id} for _interviewer_key()s, in one query """
+    ids = {value for kind, value in keys if kind == 'id'}
+    names = {value for kind, value in keys if kind == 'name'}
+    if not ids and not names:
+        return {}
+    matches = {}
+    rows = (
+        User.objects.annotate(username_lower=Lower('username'), email_lower=Lower('email'))
+        .filter(Q(pk__in=ids) | Q(username_lower__in=names) | Q(email_lower__in=names))
+        .order_by('pk')
+        .values_list('pk', 'username_lower', 'email_lower')
+    )
+    for pk, username, email in rows:
+        matches[('id', pk)] = pk
+        # a username wins over another user's email address
+        matches[('name', username)] = pk
+        matches.setdefault(('name', email), pk)
+    return matches
+
+
+def _clean(item, user, interviewees, interviewers):
+    """ (Interaction, [interviewer ids], None) for a valid item, or (None, None, errors) """
+    errors = {}
+
+    key = _interviewee_key(item)
+    matched = interviewees.get(key, []) if key else []
+    if key is None:
+        errors['interviewee'] = 'An email address or interviewee_id is required.'
+    elif not matched:
+        errors['interviewee'] = 'No source found for {}.'.format(key[1])
+    elif len(matched) > 1:
+        errors['interviewee'] = 'Several sources match {} ({}); use interviewee_id.'.format(
+            key[1], ', '.join(str(pk) for pk in matched)
+        )
+
+    interviewer_ids = []
+    unknown = []
+    for value in _interviewer_values(item, user):
+        interviewer_id = interviewers.get(_interviewer_key(value))
+        if interviewer_id is None:
+            unknown.append(str(value))
+        elif interviewer_id not in interviewer_ids:
+            interviewer_ids.append(interviewer_id)
+    if unknown:
+        errors['interviewers'] = 'Unknown users: {}.'.format(', '.join(unknown))
+    elif not interviewer_ids:
+        errors['interviewers'] = 'At least one interviewer is required.'
+
+    date_time = None
+    try:
+        date_time = parse_datetime(item.get('date_time') or '')
+    except (TypeError, ValueError):
+        pass
+    if date_time is None:
+        errors['date_time'] = 'An ISO 8601 date and time is required.'
+    elif timezone.is_naive(date_time):
+        date_time = timezone.make_aware(date_time)
+
+    interaction_type = item.get('interaction_type') or ''
+    if interaction_type not in INTERACTION_TYPES and interaction_type != '':
+        errors['interaction_type'] = 'Must be one of {}.'.format(', '.join(sorted(INTERACTION_TYPES)))
+
+    privacy_level = item.get('privacy_level')
+    if privacy_level not in PRIVACY_LEVELS:
+        errors['privacy_level'] = 'Must be one of {}.'.format(', '.join(sorted(PRIVACY_LEVELS)))
+
+    notes = item.get('notes') or ''
+    if not isinstance(notes, str):
+        errors['notes'] = 'Must be text.'
+
+    if errors:
+        return None, None, errors
+    interaction = Interaction(
+        interviewee_id=matched[0],
+        date_time=date_time,
+        interaction_type=interaction_type,
+        privacy_level=privacy_level,
+        notes=notes,
+        created_by=user,
+    )
+    return interaction, interviewer_ids, None
+
+
+def create_interactions(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert unsaved Interactions with their interviewers, given as
+    (Interaction, [user ids]) pairs, in one transaction; sets their pks
+    """
+    interactions = [interaction for interaction, interviewer_ids in rows]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Interaction.objects.bulk_create(interactions, batch_size=batch_size)
+        else:
+            # bulk_create doesn't set the pks on these backends (SQLite);
+            # they're needed for the through rows
+            for interaction in interactions:
+                interaction.save()
+        Through = Interaction.interviewer.through
+        Through.objects.bulk_create([
+            Through(interaction_id=interaction.pk, user_id=interviewer_id)
+            for interaction, interviewer_ids in rows
+            for interviewer_id in interviewer_ids
+        ], batch_size=batch_size)
+        # bulk_create sends no post_save; index and count them like a saved interaction
+        schedule_refresh('interaction', [interaction.pk for interaction in interactions])
+        invalidate_cache_on_commit('counts')
+        update_interaction_totals({interaction.interviewee_id for interaction in interactions})
+
+
+def log_interactions(items, user, batch_size=BULK_BATCH_SIZE):
+    """
+    Create an Interaction per valid item (see the module docstring), logged by
+    user. Returns one {'status': 'created', 'id': ...} or
+    {'status': 'error', 'errors': {field: message}} per item, in order.
+    """
+    results = [None] * len(items)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {'status': 'error', 'errors': {'item': 'Must be an object.'}}
+
+    items_to_resolve = [item for item in items if isinstance(item, dict)]
+    interviewees = resolve_interviewees(
+        {key for key in map(_interviewee_key, items_to_resolve) if key}, user
+    )
+    interviewers = resolve_interviewers({
+        key for key in (
+            _interviewer_key(value) for item in items_to_resolve for value in _interviewer_values(item, user)
+        ) if key
+    })
+
+    valid = []
+    for index, item in enumerate(items):
+        if results[index] is not None:
+            continue
+        interaction, interviewer_ids, errors = _clean(item, user, interviewees, interviewers)
+        if errors:
+            results[index] = {'status': 'error', 'errors': errors}
+        else:
+            valid.append((index, interaction, interviewer_ids))
+    if not valid:
+        return results
+
+    create_interactions([(interaction, interviewer_ids) for index, interaction, interviewer_ids in valid], batch_size)
+    for index, interaction, interviewer_ids in valid:
+        results[index] = {'status': 'created', 'id': interaction.pk}
+    return results
@@ -0,0 +1,186 @@
+"""
+Caching for data that the admin reads on most requests but that rarely
+changes: the Expertise/Industry/Organization names offered by the source list
+filters, each user's dive memberships and the row counts on the admin index
+(per user, as each counts only the rows their changelist shows).
+
+Values live in the default cache (locmem in development, the shared file
+cache in settings_production) under versioned keys, one version per
+namespace. Invalidating a namespace bumps its version, so every key in it is
+dropped at once without having to know the keys; the receivers in
+sources/signals.py do that after the transaction that changed the data
+commits.
+
+Each process counts hits and misses per namespace and publishes them to the
+cache every CACHE_STATS_FLUSH_INTERVAL seconds; `manage.py cache_stats`
+reports the hit rates of all processes.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# invalidation is explicit, so this only bounds how long unused keys linger
+SOURCES_CACHE_TIMEOUT = getattr(settings, 'SOURCES_CACHE_TIMEOUT', 60 * 60)
+# seconds
+CACHE_STATS_FLUSH_INTERVAL = getattr(settings, 'CACHE_STATS_FLUSH_INTERVAL', 10)
+CACHE_STATS_TIMEOUT = 60 * 60
+
+NAMESPACES = [
+    # list filter options
+    'lookups',
+    # dive ids per user
+    'dives',
+    # row counts on the admin index, per user; invalidated when rows are
+    # created, deleted or change privacy level rather than on every save
+    'counts',
+    # the interaction analytics page, see sources/analytics.py
+    'analytics',
+]
+
+STATS_PROCESSES_KEY = 'sources:cachestats:processes'
+
+logger = logging.getLogger('sources.performance')
+
+_missing = object()
+
+
+def _version_key(namespace):
+    return 'sources:version:{}'.format(namespace)
+
+
+def namespace_version(namespace):
+    """ The current version of a namespace's keys """
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # start from the clock rather than 1, so a version key that was
+        # evicted doesn't come back as a version that has stale keys
+        cache.add(_version_key(namespace), int(time.time() * 1000), None)
+        version = cache.get(_version_key(namespace), int(time.time() * 1000))
+    return version
+
+
+def invalidate(*namespaces):
+    """ Drop every cached value in the given namespaces """
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            # not set yet (or evicted); there is nothing cached under it
+            cache.add(_version_key(namespace), int(time.time() * 1000), None)
+
+
+def read_through(namespace, key, load, timeout=SOURCES_CACHE_TIMEOUT):
+    """ The cached value for key in namespace, calling load() to fill it on a miss """
+    cache_key = 'sources:{}:{}'.format(namespace, key)
+    version = namespace_version(namespace)
+    value = cache.get(cache_key, _missing, version=version)
+    if value is _missing:
+        cache_stats.record(namespace, hit=False)
+        value = load()
+        cache.set(cache_key, value, timeout, version=version)
+    else:
+        cache_stats.record(namespace, hit=True)
+    return value
+
+
+## hit rates
+
+class CacheStats(object):
+    """ This process's hit/miss counts per namespace """
+
+    def __init__(self, flush_interval=CACHE_STATS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # namespace -> [hits, misses]
+        self.counts = defaultdict(lambda: [0, 0])
+        self.process_key = 'sources:cachestats:{}:{}'.format(socket.gethostname(), os.getpid())
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, namespace, hit):
+        with self._lock:
+            self.counts[namespace][0 if hit else 1] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._last_flush = time.monotonic()
+                snapshot = {namespace: tuple(counts) for namespace, counts in self.counts.items()}
+        if due:
+            try:
+                self.flush(snapshot)
+            except Exception:
+                logger.exception('Could not publish cache stats')
+
+    def flush(self, snapshot=None):
+        """ Publish this process's counts to the cache """
+        if snapshot is None:
+            with self._lock:
+                snapshot = {namespace: tuple(counts) for namespace, counts in self.counts.items()}
+        cache.set(self.process_key, snapshot, CACHE_STATS_TIMEOUT)
+        processes = cache.get(STATS_PROCESSES_KEY) or set()
+        if self.process_key not in processes:
+            processes.add(self.process_key)
+            cache.set(STATS_PROCESSES_KEY, processes, None)
+
+
+cache_stats = CacheStats()
+
+
+def collect_stats():
+    """ {namespace: (hits, misses)} summed over every process that has published recently """
+    totals = defaultdict(lambda: [0, 0])
+    processes = cache.get(STATS_PROCESSES_KEY) or set()
+    found = cache.get_many(list(processes))
+    for snapshot in found.values():
+        for namespace, (hits, misses) in snapshot.items():
+            totals[namespace][0] += hits
+            totals[namespace][1] += misses
+    if set(found) != processes:
+        cache.set(STATS_PROCESSES_KEY, set(found), None)
+    return {namespace: tuple(counts) for namespace, counts in totals.items()}
+
+
+def reset_stats():
+    """ Forget every process's counts """
+    cache.delete_many(list(cache.get(STATS_PROCESSES_KEY) or set()) + [STATS_PROCESSES_KEY])
+    with cache_stats._lock:
+        cache_stats.counts.clear()
+
+
+## cached data
+
+def displayable_names(field_name):
+    """
+    Names of the Expertise/Industry/Organization rows (Person M2M field_name)
+    linked to at least one non-private source, for the source list filters.
+    """
+    from sources.models import Person
+
+    def load():
+        model = Person._meta.get_field(field_name).related_model
+        return list(
+            model.objects.filter(person__in=Person.objects.exclude(privacy_level='private_individual'))
+            .order_by('name').values_list('name', flat=True).distinct()
+        )
+
+    return read_through('lookups', field_name, load)
+
+
+def user_dive_ids(user_id):
+    """ Ids of the dives a user is a member of """
+    from sources.models import Dive
+
+    return read_through(
+        'dives', 'user:{}'.format(user_id),
+        lambda: list(Dive.objects.filter(users=user_id).order_by('pk').values_list('pk', flat=True)),
+    )
+
+
+def model_count(model, user_id, count):
+    """ Number of rows of a model that a user can see, calling count() to fill the cache """
+    return read_through('counts', '{}:{}'.format(model._meta.label_lower, user_id), count)
@@ -218,3 +218,34 @@ COUNTRY_CHOICES = (
     ('Zambia','Zambia'),
     ('Zimbabwe','Zimbabwe'),
 )
+
+
+class LazyChoices(object):
+    """
+    Choices that are only built the first time they are iterated, rather
+    than when the module defining them is imported. Django keeps any
+    iterable that isn't an iterator as-is for a field's choices.
+    """
+    def __init__(self, build):
+        self._build = build
+        self._choices = None
+
+    def _load(self):
+        if self._choices is None:
+            self._choices = tuple(self._build())
+        return self._choices
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
+def _timezone_choices():
+    # pytz checks every zone file exists the first time all_timezones is read
+    import pytz
+    return ((tz, tz) for tz in pytz.all_timezones)
+
+
+TIMEZONE_CHOICES = LazyChoices(_timezone_choices)
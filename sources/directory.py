@@ -0,0 +1,134 @@
+"""
+In-process directory of users' display names.
+
+Admin pages render a display name for the creator and interviewers of every
+row; looking each one up through a foreign key costs a query per row. The
+directory keeps id -> display name in a bounded LRU with a TTL, and the full
+(id, display name) choice list that the user autocomplete is answered from.
+
+Entries are dropped when a User is saved or deleted (see sources/signals.py).
+That only reaches the current process, so the TTL bounds how long another
+process can show a stale name.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+USER_DIRECTORY_MAX_SIZE = getattr(settings, 'USER_DIRECTORY_MAX_SIZE', 5000)
+# seconds
+USER_DIRECTORY_TTL = getattr(settings, 'USER_DIRECTORY_TTL', 300)
+
+
+def _display_name(first_name, last_name, username):
+    """ Same as get_user_display_name() in sources/admin.py, from value rows """
+    return '{} {}'.format(first_name, last_name).strip() or username
+
+
+class UserDirectory(object):
+
+    def __init__(self, max_size=USER_DIRECTORY_MAX_SIZE, ttl=USER_DIRECTORY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user id -> (expires at, display name), least recently used first
+        self._names = OrderedDict()
+        # (expires at, [(user id, display name, username)]) or None
+        self._choices = None
+        # bumped by invalidate() so a load that raced with it isn't cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _users(self):
+        from django.contrib.auth.models import User
+
+        return User.objects.order_by().values_list('pk', 'first_name', 'last_name', 'username')
+
+    def _remember(self, user_id, name, now):
+        self._names[user_id] = (now + self.ttl, name)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    def display_names(self, user_ids):
+        """ {user id: display name} for the given ids, loading any misses in one query """
+        now = time.monotonic()
+        names = {}
+        missing = set()
+        with self._lock:
+            generation = self._generation
+            for user_id in user_ids:
+                if user_id is None:
+                    continue
+                entry = self._names.get(user_id)
+                if entry and entry[0] > now:
+                    self._names.move_to_end(user_id)
+                    names[user_id] = entry[1]
+                else:
+                    missing.add(user_id)
+        if missing and self._choices is None:
+            # first miss since (re)loading: one query fills the whole LRU
+            for user_id, name, username in self._load_choices():
+                if user_id in missing:
+                    names[user_id] = name
+                    missing.discard(user_id)
+        if missing:
+            rows = self._users().filter(pk__in=missing)
+            with self._lock:
+                for user_id, first_name, last_name, username in rows:
+                    names[user_id] = _display_name(first_name, last_name, username)
+                    if generation == self._generation:
+                        self._remember(user_id, names[user_id], now)
+        return names
+
+    def display_name(self, user_id):
+        """ Display name for a user id, or '' if there is no such user """
+        if user_id is None:
+            return ''
+        return self.display_names([user_id]).get(user_id, '')
+
+    def _load_choices(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._choices and self._choices[0] > now:
+                return self._choices[1]
+            generation = self._generation
+        rows = sorted(
+            ((user_id, _display_name(first_name, last_name, username), username)
+             for user_id, first_name, last_name, username in self._users()),
+            key=lambda row: (row[1].casefold(), row[0]),
+        )
+        with self._lock:
+            if generation != self._generation:
+                return rows
+            self._choices = (now + self.ttl, rows)
+            for user_id, name, username in rows[:self.max_size]:
+                self._remember(user_id, name, now)
+        return rows
+
+    def choices(self):
+        """ [(user id, display name)] for every user, sorted by display name """
+        return [(user_id, name) for user_id, name, username in self._load_choices()]
+
+    def search(self, term):
+        """ Choices whose display name or username contains every word of term """
+        words = term.casefold().split()
+        return [
+            (user_id, name) for user_id, name, username in self._load_choices()
+            if all(word in name.casefold() or word in username.casefold() for word in words)
+        ]
+
+    def invalidate(self, user_id=None):
+        """ Forget one user (and the choice list), or everything when user_id is None """
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._names.clear()
+            else:
+                self._names.pop(user_id, None)
+            self._choices = None
+
+
+# shared by every admin class in this process
+user_directory = UserDirectory()
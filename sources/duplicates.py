@@ -0,0 +1,264 @@
+"""
+Finding sources that are probably the same person entered twice (repeated
+imports, manual entry), for review in the "Duplicate candidates" admin.
+
+Comparing every pair of sources doesn't scale, so sources are only compared
+within blocks that share a key:
+
+    - the normalized email address (lowercased, without a +tag)
+    - each phone number in E.164 form (+12025550123; numbers without a
+      country code get DUPLICATE_DEFAULT_COUNTRY_CODE)
+    - a phonetic key of the name (Soundex of the first and last names), so
+      "Jon Smyth" and "John Smith" meet
+
+Blocks bigger than DUPLICATE_MAX_BLOCK_SIZE are skipped; a key shared by that
+many sources (a switchboard number, a very common name) doesn't say much.
+
+find_duplicates() streams the sources' key columns and splits the keys into
+`workers` partitions by a hash of the key. Each partition is handled by its
+own process, which keeps only its own keys in memory, collects the pairs in
+its blocks and then scores them by field similarity (score_pair) in chunks.
+The pairs scoring at least `min_score` replace the pending candidates in the
+DuplicateCandidate table; pairs a reviewer dismissed stay dismissed.
+"""
+import re
+import zlib
+from collections import defaultdict
+from difflib import SequenceMatcher
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from sources.models import DuplicateCandidate, Person
+
+
+DUPLICATE_DEFAULT_COUNTRY_CODE = getattr(settings, 'DUPLICATE_DEFAULT_COUNTRY_CODE', '1')
+DUPLICATE_MAX_BLOCK_SIZE = getattr(settings, 'DUPLICATE_MAX_BLOCK_SIZE', 50)
+DUPLICATE_MIN_SCORE = 0.5
+DUPLICATE_CHUNK_SIZE = 5000
+
+KEY_COLUMNS = ['pk', 'name', 'email_address', 'phone_number_primary', 'phone_number_secondary']
+
+# how much each field counts towards the score, when both sources have it
+FIELD_WEIGHTS = {
+    'email': 0.45,
+    'phone': 0.3,
+    'name': 0.25,
+}
+
+NAME_AFFIXES = {'dr', 'mr', 'mrs', 'ms', 'mx', 'prof', 'jr', 'sr', 'ii', 'iii', 'iv', 'phd', 'md', 'esq'}
+
+
+## normalization
+
+def normalize_email(email_address):
+    """ Lowercased address without mailto: or a +tag, or '' """
+    email_address = (email_address or '').strip().lower()
+    if email_address.startswith('mailto:'):
+        email_address = email_address[len('mailto:'):]
+    if not re.match(r'^[^@\s]+@[^@\s]+$', email_address):
+        return ''
+    local, at, domain = email_address.partition('@')
+    local = local.split('+', 1)[0]
+    return '{}@{}'.format(local, domain) if local else ''
+
+
+def normalize_phone(phone_number, default_country_code=DUPLICATE_DEFAULT_COUNTRY_CODE):
+    """ The number in E.164 form, or '' if it doesn't look like one """
+    phone_number = (phone_number or '').strip()
+    # drop an extension
+    phone_number = re.split(r'(?i)\s*(?:x|ext\.?|extension|#)\s*\d+$', phone_number)[0]
+    digits = re.sub(r'\D', '', phone_number)
+    if phone_number.startswith('+'):
+        pass
+    elif phone_number.startswith('00'):
+        digits = digits[2:]
+    elif default_country_code == '1' and len(digits) == 11 and digits.startswith('1'):
+        pass
+    else:
+        digits = default_country_code + digits.lstrip('0')
+    if not 8 <= len(digits) <= 15:
+        return ''
+    return '+' + digits
+
+
+def name_parts(name):
+    """ The lowercased words of a name, without titles like Dr. or Jr., in first-last order """
+    name = (name or '').strip()
+    if ',' in name:
+        # "Last, First"
+        last, _, first = name.partition(',')
+        name = '{} {}'.format(first, last)
+    return [word for word in re.findall(r'[^\W\d_]+', name.lower()) if word not in NAME_AFFIXES]
+
+
+SOUNDEX_CODES = dict(
+    [(letter, '1') for letter in 'bfpv']
+    + [(letter, '2') for letter in 'cgjkqsxz']
+    + [(letter, '3') for letter in 'dt']
+    + [('l', '4')]
+    + [(letter, '5') for letter in 'mn']
+    + [('r', '6')]
+)
+
+
+def soundex(word):
+    """ American Soundex code of a word (letters a-z only), e.g. S530 for smith and smyth """
+    word = re.sub(r'[^a-z]', '', word.lower())
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_key(name):
+    """ Phonetic key of the first and last names, or '' for a single word """
+    parts = name_parts(name)
+    if len(parts) < 2:
+        return ''
+    return soundex(parts[0]) + soundex(parts[-1])
+
+
+def blocking_keys(name, email_address, phone_number_primary, phone_number_secondary):
+    """ The keys a source is blocked on """
+    keys = set()
+    email_key = normalize_email(email_address)
+    if email_key:
+        keys.add('e:' + email_key)
+    for phone_number in (phone_number_primary, phone_number_secondary):
+        phone_key = normalize_phone(phone_number)
+        if phone_key:
+            keys.add('p:' + phone_key)
+    phonetic_key = name_key(name)
+    if phonetic_key:
+        keys.add('n:' + phonetic_key)
+    return keys
+
+
+## scoring
+
+def score_pair(a, b):
+    """
+    (score between 0 and 1, [matching fields]) for two sources given as dicts
+    of KEY_COLUMNS. Fields only count when both sources have them, and the
+    score is scaled down when few of them do, so two sources with nothing
+    but the same name don't score as high as two with the same name, email
+    and phone.
+    """
+    similarities = {}
+    emails = normalize_email(a['email_address']), normalize_email(b['email_address'])
+    if all(emails):
+        similarities['email'] = 1.0 if emails[0] == emails[1] else 0.0
+    phones = [
+        {normalize_phone(row['phone_number_primary']), normalize_phone(row['phone_number_secondary'])} - {''}
+        for row in (a, b)
+    ]
+    if all(phones):
+        similarities['phone'] = 1.0 if phones[0] & phones[1] else 0.0
+    names = ' '.join(name_parts(a['name'])), ' '.join(name_parts(b['name']))
+    if all(names):
+        similarities['name'] = SequenceMatcher(None, *names).ratio()
+    if not similarities:
+        return 0.0, []
+
+    present = sum(FIELD_WEIGHTS[field] for field in similarities)
+    weighted = sum(FIELD_WEIGHTS[field] * similarity for field, similarity in similarities.items()) / present
+    coverage = present / sum(FIELD_WEIGHTS.values())
+    matching = [field for field, similarity in similarities.items() if similarity >= 0.85]
+    return round(weighted * (0.5 + 0.5 * coverage), 4), matching
+
+
+## finding
+
+def _partition(key, partitions):
+    # crc32 rather than hash(), which differs between processes
+    return zlib.crc32(key.encode('utf-8')) % partitions
+
+
+def find_partition_pairs(partition, partitions, min_score=DUPLICATE_MIN_SCORE,
+                         max_block_size=DUPLICATE_MAX_BLOCK_SIZE, chunk_size=DUPLICATE_CHUNK_SIZE):
+    """
+    [(lower pk, higher pk, score, [matching fields])] for the pairs of sources
+    sharing a key in this partition, and the number of oversized blocks
+    """
+    blocks = defaultdict(list)
+    rows = Person.objects.order_by('pk').values_list(*KEY_COLUMNS)
+    for pk, *values in rows.iterator(chunk_size=chunk_size):
+        for key in blocking_keys(*values):
+            if _partition(key, partitions) == partition:
+                blocks[key].append(pk)
+
+    pairs = set()
+    oversized = 0
+    for pks in blocks.values():
+        if len(pks) > max_block_size:
+            oversized += 1
+            continue
+        pairs.update((a, b) for index, a in enumerate(pks) for b in pks[index + 1:])
+    del blocks
+
+    results = []
+    pairs = sorted(pairs)
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        pks = {pk for pair in chunk for pk in pair}
+        people = {row['pk']: row for row in Person.objects.filter(pk__in=pks).values(*KEY_COLUMNS)}
+        for a, b in chunk:
+            if a in people and b in people:
+                score, matching = score_pair(people[a], people[b])
+                if score >= min_score:
+                    results.append((a, b, score, matching))
+    return results, oversized
+
+
+def _find_partition_pairs(args):
+    # runs in a worker process, which opens its own connection
+    try:
+        return find_partition_pairs(*args)
+    finally:
+        connections.close_all()
+
+
+def find_duplicates(workers=1, min_score=DUPLICATE_MIN_SCORE, max_block_size=DUPLICATE_MAX_BLOCK_SIZE,
+                    chunk_size=DUPLICATE_CHUNK_SIZE, dry_run=False):
+    """
+    Find the likely duplicate sources and replace the pending
+    DuplicateCandidates with them. Returns {'candidates': ..., 'oversized
+    blocks': ...}.
+    """
+    tasks = [(partition, workers, min_score, max_block_size, chunk_size) for partition in range(workers)]
+    if workers > 1:
+        # the workers can't share the parent's connection
+        connections.close_all()
+        with get_context('fork').Pool(workers) as pool:
+            partition_results = pool.map(_find_partition_pairs, tasks)
+    else:
+        partition_results = [find_partition_pairs(*tasks[0])]
+
+    # a pair sharing several keys can be found by several partitions
+    pairs = {}
+    oversized = 0
+    for results, partition_oversized in partition_results:
+        oversized += partition_oversized
+        for a, b, score, matching in results:
+            pairs[(a, b)] = (score, matching)
+
+    if not dry_run:
+        with transaction.atomic():
+            DuplicateCandidate.objects.filter(status='pending').delete()
+            DuplicateCandidate.objects.bulk_create([
+                DuplicateCandidate(person_a_id=a, person_b_id=b, score=score, matching_fields=', '.join(matching))
+                for (a, b), (score, matching) in pairs.items()
+            ], batch_size=chunk_size, ignore_conflicts=True)
+    return {'candidates': len(pairs), 'oversized blocks': oversized}
@@ -0,0 +1,101 @@
+"""
+Registry of the queries that the busiest pages and jobs run, so their plans
+can be checked for regressions (`manage.py check_query_plans`).
+
+Each entry builds the queryset from the dict returned by
+sources.synthetic.seed_sources(), going through the same admin/search/export
+code the real request uses wherever that code exposes the queryset.
+"""
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from sources.models import Expertise, Interaction, Person
+from sources.pagination import seek
+
+
+# label -> function(seeded) returning a queryset
+HOT_QUERIES = {}
+
+CHANGELIST_PAGE_SIZE = 100
+
+
+def hot_query(label):
+    """ Register a queryset builder under label """
+    def register(build):
+        HOT_QUERIES[label] = build
+        return build
+    return register
+
+
+def _admin_request(user, params=None):
+    request = RequestFactory().get('/', params or {})
+    request.user = user or AnonymousUser()
+    return request
+
+
+def _changelist(model, seeded, params=None):
+    """ A ModelAdmin's privacy-filtered queryset in keyset changelist order """
+    request = _admin_request(seeded['users'][1], params)
+    model_admin = admin.site._registry[model]
+    return model_admin.get_queryset(request), request, model_admin
+
+
+@hot_query('source changelist')
+def source_changelist(seeded):
+    queryset, request, model_admin = _changelist(Person, seeded)
+    return queryset.order_by('-updated', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('source changelist, next page')
+def source_changelist_next_page(seeded):
+    queryset, request, model_admin = _changelist(Person, seeded)
+    cursor = queryset.order_by('-updated', '-pk')[CHANGELIST_PAGE_SIZE * 5]
+    return queryset.filter(seek('updated', 'n', cursor.updated, cursor.pk)).order_by('-updated', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('source changelist, privacy filter')
+def source_changelist_privacy(seeded):
+    queryset, request, model_admin = _changelist(Person, seeded)
+    return queryset.filter(privacy_level='public').order_by('-updated', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('source changelist, expertise filter')
+def source_changelist_expertise(seeded):
+    queryset, request, model_admin = _changelist(Person, seeded)
+    name = Expertise.objects.filter(person__pk=seeded['person_ids'][0]).values_list('name', flat=True)[0]
+    return queryset.filter(expertise__name=name).order_by('-updated', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('source search')
+def source_search(seeded):
+    queryset, request, model_admin = _changelist(Person, seeded)
+    # e.g. 'Source 17', which matches sources 17, 170-179, 1700-1799 and so on
+    search_term = ' '.join(Person.objects.get(pk=seeded['person_ids'][0]).name.split()[:2])
+    queryset, may_have_duplicates = model_admin.get_search_results(request, queryset, search_term)
+    if 'search_rank' in queryset.query.annotations:
+        return queryset.order_by('-search_rank', '-pk')[:CHANGELIST_PAGE_SIZE]
+    return queryset.order_by('-updated', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('interaction changelist')
+def interaction_changelist(seeded):
+    queryset, request, model_admin = _changelist(Interaction, seeded)
+    return queryset.order_by('-date_time', '-pk')[:CHANGELIST_PAGE_SIZE]
+
+
+@hot_query('interactions for a source')
+def source_interactions(seeded):
+    return Interaction.objects.filter(interviewee_id=seeded['person_ids'][0]).visible_to(seeded['users'][1])
+
+
+@hot_query('export')
+def export(seeded):
+    from sources.management.commands.export_csv import exportable_sources
+
+    return exportable_sources(seeded['users'][0])
+
+
+@hot_query('import email lookup')
+def import_email_lookup(seeded):
+    return Person.objects.with_email(seeded['emails'][0].upper()).order_by().values('pk')[:1]
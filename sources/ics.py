@@ -0,0 +1,256 @@
+"""
+Importing interactions from calendar (.ics) exports, through
+`manage.py import_ics` or the "Import calendar" page of the interactions
+admin.
+
+The file is parsed as a stream, one VEVENT at a time, so an export with years
+of meetings doesn't have to fit in memory. Attendees and organizers are
+matched by email address against two in-memory indexes built once per
+import (lowercased email -> source id among the sources the importing user
+can see, and -> user id), so matching costs no queries per event. Each event
+gives one interaction per attendee that is a source, with the attendees that
+are users as interviewers (the importing user when there are none).
+
+Interactions are created in batches of ICS_BATCH_SIZE, each batch in its own
+transaction after one query for the (interviewee, date_time) pairs that
+already exist; those, and repeats within the import, are skipped. Cancelled
+events, all-day events and events that haven't started yet are skipped too.
+Recurring events are imported once, at their DTSTART.
+"""
+from collections import Counter
+from datetime import datetime
+
+import pytz
+from django.contrib.auth.models import User
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from sources.bulk import create_interactions
+from sources.models import Interaction, Person
+
+
+ICS_BATCH_SIZE = 500
+# the event's SUMMARY is kept as the notes
+NOTES_MAX_LENGTH = 1000
+
+
+## parsing
+
+def unfolded_lines(lines):
+    """ Logical lines of an iCalendar stream (continuation lines joined) """
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def parse_property(line):
+    """ (NAME, {PARAM: value}, value) for a content line """
+    # the value starts at the first colon that isn't inside a quoted parameter
+    in_quotes = False
+    for position, character in enumerate(line):
+        if character == '"':
+            in_quotes = not in_quotes
+        elif character == ':' and not in_quotes:
+            break
+    else:
+        return line.upper(), {}, ''
+    name, *params = line[:position].split(';')
+    parameters = {}
+    for param in params:
+        key, _, value = param.partition('=')
+        parameters[key.upper()] = value.strip('"')
+    return name.upper(), parameters, line[position + 1:]
+
+
+def unescape_text(value):
+    """ A TEXT value with its backslash escapes undone """
+    result = []
+    characters = iter(value)
+    for character in characters:
+        if character == '\\':
+            escaped = next(characters, '')
+            result.append('\n' if escaped in ('n', 'N') else escaped)
+        else:
+            result.append(character)
+    return ''.join(result)
+
+
+def parse_date_time(value, parameters):
+    """ An aware datetime for a DTSTART value, or None for dates and bad values """
+    if parameters.get('VALUE', '').upper() == 'DATE' or 'T' not in value:
+        return None
+    utc = value.endswith('Z')
+    try:
+        parsed = datetime.strptime(value.rstrip('Z')[:15], '%Y%m%dT%H%M%S')
+    except ValueError:
+        return None
+    if utc:
+        return timezone.make_aware(parsed, timezone.utc)
+    try:
+        zone = pytz.timezone(parameters['TZID'])
+    except (KeyError, pytz.UnknownTimeZoneError):
+        # floating time, or a zone name pytz doesn't know (e.g. Windows names)
+        zone = timezone.get_default_timezone()
+    return timezone.make_aware(parsed, zone)
+
+
+def _email(value, parameters):
+    if value.lower().startswith('mailto:'):
+        return value[len('mailto:'):].strip().lower()
+    return parameters.get('EMAIL', '').strip().lower()
+
+
+def parse_events(lines):
+    """
+    Yield a dict per VEVENT in an iCalendar stream: uid, start (aware datetime
+    or None), summary, status and emails (organizer and attendees, lowercased)
+    """
+    event = None
+    # depth of components nested in the event (VALARM, ...)
+    nested = 0
+    for line in unfolded_lines(lines):
+        name, parameters, value = parse_property(line)
+        if name == 'BEGIN':
+            if event is not None:
+                nested += 1
+            elif value.upper() == 'VEVENT':
+                event = {'uid': '', 'start': None, 'summary': '', 'status': '', 'emails': []}
+        elif name == 'END':
+            if nested:
+                nested -= 1
+            elif event is not None and value.upper() == 'VEVENT':
+                yield event
+                event = None
+        elif event is None or nested:
+            continue
+        elif name == 'DTSTART':
+            event['start'] = parse_date_time(value, parameters)
+        elif name == 'SUMMARY':
+            event['summary'] = unescape_text(value)
+        elif name == 'UID':
+            event['uid'] = value
+        elif name == 'STATUS':
+            event['status'] = value.upper()
+        elif name in ('ATTENDEE', 'ORGANIZER'):
+            email = _email(value, parameters)
+            if email and email not in event['emails']:
+                event['emails'].append(email)
+
+
+## importing
+
+def email_indexes(user):
+    """
+    ({email: source id}, {email: user id}), lowercased; sources are the ones
+    user can see, and addresses shared by several sources map to None
+    """
+    sources = {}
+    people = (
+        Person.objects.visible_to(user).exclude(email_address=None).exclude(email_address='')
+        .annotate(email_address_lower=Lower('email_address')).order_by()
+        .values_list('email_address_lower', 'pk')
+    )
+    for email, pk in people.iterator(chunk_size=5000):
+        sources[email] = None if email in sources else pk
+    users = dict(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email')).order_by('-pk')
+        .values_list('email_lower', 'pk')
+    )
+    return sources, users
+
+
+class CalendarImport(object):
+    """ Imports the events of one or more .ics streams for a user """
+
+    def __init__(self, user, privacy_level, interaction_type='', include_future=False,
+                 dry_run=False, batch_size=ICS_BATCH_SIZE):
+        self.user = user
+        self.privacy_level = privacy_level
+        self.interaction_type = interaction_type
+        self.include_future = include_future
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.sources, self.users = email_indexes(user)
+        self.counts = Counter()
+        # (interviewee id, date_time) pairs seen in this import
+        self._seen = set()
+        self._pending = []
+
+    def add_events(self, events):
+        now = timezone.now()
+        for event in events:
+            self.counts['events'] += 1
+            if event['status'] == 'CANCELLED':
+                self.counts['cancelled'] += 1
+                continue
+            if event['start'] is None:
+                self.counts['no start time'] += 1
+                continue
+            if event['start'] > now and not self.include_future:
+                self.counts['future'] += 1
+                continue
+
+            interviewee_ids = []
+            interviewer_ids = []
+            for email in event['emails']:
+                if self.sources.get(email):
+                    interviewee_ids.append(self.sources[email])
+                elif email in self.users:
+                    interviewer_ids.append(self.users[email])
+                elif email in self.sources:
+                    self.counts['ambiguous email'] += 1
+            if not interviewee_ids:
+                self.counts['no known source'] += 1
+                continue
+            interviewer_ids = interviewer_ids or [self.user.pk]
+
+            for interviewee_id in interviewee_ids:
+                if (interviewee_id, event['start']) in self._seen:
+                    self.counts['duplicates'] += 1
+                    continue
+                self._seen.add((interviewee_id, event['start']))
+                self._pending.append((Interaction(
+                    interviewee_id=interviewee_id,
+                    date_time=event['start'],
+                    interaction_type=self.interaction_type,
+                    privacy_level=self.privacy_level,
+                    notes=event['summary'][:NOTES_MAX_LENGTH],
+                    created_by=self.user,
+                ), interviewer_ids))
+                if len(self._pending) >= self.batch_size:
+                    self.flush()
+        self.flush()
+        return self.counts
+
+    def add_file(self, ics_file):
+        """ Import an open text file (or any iterable of lines) """
+        return self.add_events(parse_events(ics_file))
+
+    def flush(self):
+        """ Create the pending interactions that aren't logged already """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        existing = set(
+            Interaction.objects.filter(
+                interviewee_id__in={interaction.interviewee_id for interaction, interviewer_ids in pending},
+                date_time__in={interaction.date_time for interaction, interviewer_ids in pending},
+            ).order_by().values_list('interviewee_id', 'date_time')
+        )
+        rows = [
+            (interaction, interviewer_ids) for interaction, interviewer_ids in pending
+            if (interaction.interviewee_id, interaction.date_time) not in existing
+        ]
+        self.counts['duplicates'] += len(pending) - len(rows)
+        if rows and not self.dry_run:
+            create_interactions(rows, self.batch_size)
+        self.counts['created'] += len(rows)
@@ -0,0 +1,117 @@
+"""
+Reverse lookups of sources by contact identifier ("do we already have
+whoever is calling from +1 202 555 0123?").
+
+A source's email address, phone numbers, Twitter/Skype handles and
+LinkedIn/website URLs are free text, so they are also stored normalized in
+the indexed ContactIdentifier table:
+
+    email      lowercased, without a +tag     jane@example.com
+    phone      E.164                          +12025550123
+    twitter    lowercased, without @ or URL   janedoe
+    skype      lowercased                     jane.doe
+    linkedin   canonical URL                  linkedin.com/in/janedoe
+    website    canonical URL                  example.com/about
+
+The rows are rebuilt for the sources changed in a transaction after it
+commits (see REFRESHERS in sources/signals.py), and for every source with
+index_identifiers() / `manage.py rebuild_identifiers`. lookup_candidates()
+turns whatever a reporter pastes into the values to look up.
+"""
+import re
+from urllib.parse import urlsplit
+
+from django.db import transaction
+
+from sources.duplicates import normalize_email, normalize_phone
+
+
+IDENTIFIER_BATCH_SIZE = 2000
+
+IDENTIFIER_COLUMNS = ['pk', 'email_address', 'phone_number_primary', 'phone_number_secondary', 'twitter', 'skype', 'linkedin', 'website']
+
+
+def normalize_handle(handle):
+    """ A Twitter/Skype handle: lowercased, without @ or a twitter.com URL """
+    handle = (handle or '').strip().lower()
+    handle = re.sub(r'^(?:https?://)?(?:www\.|mobile\.)?(?:twitter|x)\.com/', '', handle)
+    handle = re.sub(r'^(?:live|skype):', '', handle)
+    return handle.lstrip('@').strip('/').split('/')[0].split('?')[0]
+
+
+def normalize_url(url):
+    """ host/path without the scheme, www., query, fragment or trailing slash, lowercased """
+    url = (url or '').strip().lower()
+    if not url:
+        return ''
+    if '://' not in url:
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ''
+    host = parts.hostname or ''
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    if '.' not in host:
+        return ''
+    return host + parts.path.rstrip('/')
+
+
+def identifiers(row):
+    """ {(kind, value)} for a dict of IDENTIFIER_COLUMNS """
+    values = {
+        ('email', normalize_email(row['email_address'])),
+        ('phone', normalize_phone(row['phone_number_primary'])),
+        ('phone', normalize_phone(row['phone_number_secondary'])),
+        ('twitter', normalize_handle(row['twitter'])),
+        ('skype', normalize_handle(row['skype'])),
+        ('linkedin', normalize_url(row['linkedin'])),
+        ('website', normalize_url(row['website'])),
+    }
+    return {(kind, value) for kind, value in values if value}
+
+
+def lookup_candidates(term, handles=True):
+    """
+    The identifier values a pasted term could be. Bare words are also tried
+    as handles when handles is True; the admin search passes False so that
+    names still go to full-text search.
+    """
+    term = (term or '').strip()
+    candidates = set()
+    if '@' in term[1:]:
+        candidates.add(normalize_email(term))
+    if len(re.sub(r'\D', '', term)) >= 7 and re.match(r'^[+\d\s().\-/]+(?:\s*(?:x|ext\.?)\s*\d+)?$', term, re.IGNORECASE):
+        candidates.add(normalize_phone(term))
+    if '/' in term or re.match(r'^(?:https?://|www\.)', term, re.IGNORECASE):
+        candidates.add(normalize_url(term))
+        if re.search(r'(?:twitter|x)\.com/', term, re.IGNORECASE):
+            candidates.add(normalize_handle(term))
+    if term.startswith('@') or (handles and re.match(r'^[\w.\-]+$', term)):
+        candidates.add(normalize_handle(term))
+    return candidates - {''}
+
+
+def index_identifiers(person_ids=None, person_model=None, batch_size=IDENTIFIER_BATCH_SIZE):
+    """
+    Rebuild the ContactIdentifier rows of the given sources, or of all of
+    them when person_ids is None; ids of deleted sources just lose theirs.
+    """
+    if person_model is None:
+        from sources.models import Person as person_model
+    identifier_model = person_model._meta.get_field('contact_identifiers').related_model
+
+    if person_ids is None:
+        person_ids = person_model.objects.order_by('pk').values_list('pk', flat=True)
+    person_ids = list(person_ids)
+    for start in range(0, len(person_ids), batch_size):
+        batch = person_ids[start:start + batch_size]
+        rows = person_model.objects.filter(pk__in=batch).values(*IDENTIFIER_COLUMNS)
+        with transaction.atomic():
+            identifier_model.objects.filter(person_id__in=batch).delete()
+            identifier_model.objects.bulk_create([
+                identifier_model(person_id=row['pk'], kind=kind, value=value[:255])
+                for row in rows
+                for kind, value in sorted(identifiers(row))
+            ])
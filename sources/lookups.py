@@ -0,0 +1,171 @@
+"""
+Finding and merging Expertise, Industry and Organization rows that are the
+same name written differently (see sources/names.py).
+
+merge_lookups() moves the sources of the duplicates to the survivor with two
+statements per merge however many sources are linked: an INSERT ... SELECT
+... ON CONFLICT DO NOTHING of the duplicates' through rows re-pointed at the
+survivor (sources already linked to the survivor are skipped), then a DELETE
+of the duplicates' through rows. The re-pointed sources' `updated` is bumped
+with one UPDATE and their search text, identifiers and summaries are
+refreshed after the commit, as for a source saved with new memberships. The
+duplicates' names become aliases of the survivor's, so later imports and
+saves of them resolve to the survivor.
+
+normalize_lookups() (`manage.py normalize_lookups`) recomputes every row's
+normalized name and merges each group of rows that share one.
+"""
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from sources.models import Expertise, Industry, LookupAlias, Organization, Person, canonical_name
+from sources.names import clean_name, normalize_name
+from sources.signals import schedule_person_refresh
+
+
+LOOKUP_MODELS = [Expertise, Industry, Organization]
+
+# Person M2M field per lookup model
+PERSON_FIELDS = {
+    Expertise: 'expertise',
+    Industry: 'industries',
+    Organization: 'organization',
+}
+
+
+def _through(model):
+    """ (through model, person column, lookup column) of a lookup model's Person M2M """
+    field = Person._meta.get_field(PERSON_FIELDS[model])
+    through = field.remote_field.through
+    return (
+        through,
+        through._meta.get_field(field.m2m_field_name()).column,
+        through._meta.get_field(field.m2m_reverse_field_name()).column,
+    )
+
+
+def get_or_create_lookup(model, name):
+    """ The row whose normalized name matches name, created if there's none; like get_or_create() """
+    name = clean_name(name)
+    same = model.objects.filter(normalized_name=canonical_name(model, name)).order_by('pk').first()
+    if same is not None:
+        return same, False
+    return model.objects.get_or_create(name=name)
+
+
+def source_counts(model, pks):
+    """ {pk: number of linked sources} for rows of a lookup model, in one query """
+    through, person_column, lookup_column = _through(model)
+    return dict(
+        through.objects.filter(**{f'{lookup_column}__in': pks}).order_by()
+        .values_list(lookup_column).annotate(count=Count('pk'))
+    )
+
+
+def merge_lookups(model, survivor, duplicates):
+    """
+    Merge duplicates (rows or ids) of a lookup model into survivor (a row or
+    id). Returns the number of sources that were linked to the duplicates.
+    """
+    survivor_id = getattr(survivor, 'pk', survivor)
+    duplicate_ids = sorted({getattr(duplicate, 'pk', duplicate) for duplicate in duplicates} - {survivor_id})
+    if not duplicate_ids:
+        return 0
+    model_name = model._meta.model_name
+    through, person_column, lookup_column = _through(model)
+    quote = connection.ops.quote_name
+
+    with transaction.atomic():
+        rows = {row.pk: row for row in model.objects.select_for_update().filter(pk__in=[survivor_id] + duplicate_ids)}
+        survivor = rows[survivor_id]
+        duplicate_ids = [pk for pk in duplicate_ids if pk in rows]
+        if not duplicate_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(duplicate_ids))
+        person_ids = sorted(
+            through.objects.filter(**{f'{lookup_column}__in': duplicate_ids})
+            .order_by().values_list(person_column, flat=True).distinct()
+        )
+        with connection.cursor() as cursor:
+            # the WHERE is also what lets SQLite parse ON CONFLICT after a SELECT
+            cursor.execute(
+                'INSERT INTO {table} ({person}, {lookup}) '
+                'SELECT DISTINCT {person}, %s FROM {table} WHERE {lookup} IN ({placeholders}) '
+                'ON CONFLICT DO NOTHING'.format(
+                    table=quote(through._meta.db_table), person=quote(person_column),
+                    lookup=quote(lookup_column), placeholders=placeholders,
+                ),
+                [survivor_id] + duplicate_ids,
+            )
+            cursor.execute(
+                'DELETE FROM {table} WHERE {lookup} IN ({placeholders})'.format(
+                    table=quote(through._meta.db_table), lookup=quote(lookup_column), placeholders=placeholders,
+                ),
+                duplicate_ids,
+            )
+
+        # the duplicates' names, and aliases pointing at them, now mean the survivor
+        duplicate_keys = (
+            {normalize_name(rows[pk].name, model_name) for pk in duplicate_ids}
+            | {rows[pk].normalized_name for pk in duplicate_ids}
+        ) - {'', survivor.normalized_name}
+        LookupAlias.objects.filter(kind=model_name, normalized_name__in=duplicate_keys).update(
+            normalized_name=survivor.normalized_name
+        )
+        existing = set(
+            LookupAlias.objects.filter(kind=model_name, alias__in=duplicate_keys).values_list('alias', flat=True)
+        )
+        LookupAlias.objects.filter(kind=model_name, alias__in=existing).update(normalized_name=survivor.normalized_name)
+        LookupAlias.objects.bulk_create([
+            LookupAlias(kind=model_name, alias=key, normalized_name=survivor.normalized_name)
+            for key in duplicate_keys - existing
+        ])
+
+        model.objects.filter(pk__in=duplicate_ids).delete()
+        # raw SQL sends no m2m_changed or post_save: the sources' memberships
+        # changed, which their change view's ETag and summaries are built from
+        Person.objects.filter(pk__in=person_ids).update(updated=timezone.now())
+        schedule_person_refresh(person_ids)
+    return len(person_ids)
+
+
+def normalize_lookups(model, dry_run=False, stdout=None):
+    """
+    Recompute the normalized names of a lookup model's rows and merge the
+    rows that share one into the row with the most sources. Returns
+    (rows merged away, sources re-pointed).
+    """
+    model_name = model._meta.model_name
+    aliases = dict(LookupAlias.objects.filter(kind=model_name).values_list('alias', 'normalized_name'))
+    changed = []
+    groups = {}
+    for row in model.objects.order_by('pk').only('pk', 'name', 'normalized_name').iterator():
+        key = normalize_name(row.name, model_name)
+        key = aliases.get(key, key)
+        if key != row.normalized_name:
+            row.normalized_name = key
+            changed.append(row)
+        if key:
+            groups.setdefault(key, []).append((row.pk, row.name))
+    if changed and not dry_run:
+        model.objects.bulk_update(changed, ['normalized_name'], batch_size=1000)
+
+    groups = {key: rows for key, rows in groups.items() if len(rows) > 1}
+    counts = source_counts(model, [pk for rows in groups.values() for pk, name in rows])
+
+    merged = moved = 0
+    for key, rows in sorted(groups.items()):
+        # keep the most used row, the oldest on ties
+        rows.sort(key=lambda row: (-counts.get(row[0], 0), row[0]))
+        survivor_id, survivor_name = rows[0]
+        if stdout:
+            stdout.write('{}: {} <- {}'.format(
+                model._meta.verbose_name, survivor_name, ', '.join(name for pk, name in rows[1:])
+            ))
+        merged += len(rows) - 1
+        if dry_run:
+            moved += sum(counts.get(pk, 0) for pk, name in rows[1:])
+        else:
+            moved += merge_lookups(model, survivor_id, [pk for pk, name in rows[1:]])
+    return merged, moved
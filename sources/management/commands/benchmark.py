@@ -0,0 +1,328 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from sources.admin import PersonAdmin
+from sources.models import Interaction, Person
+from sources.plans import describe_plan, explain_queryset
+from sources.synthetic import seed_sources
+
+
+# indexes added in migration 0028_add_hot_column_indexes
+HOT_COLUMN_INDEXES = [
+    'person_updated_idx',
+    'person_privacy_updated_idx',
+    'person_created_by_updated_idx',
+    'person_email_lower_idx',
+    'interaction_date_time_idx',
+    'interaction_interviewee_dt_idx',
+    'interaction_privacy_dt_idx',
+    'interaction_created_by_dt_idx',
+]
+
+
+def _explain_hot_queries(command, seeded):
+    """ Print the plan shape and execution time of the changelist and import lookups """
+    user = seeded['users'][0]
+    person_id = seeded['person_ids'][0]
+    email_address = seeded['emails'][0].upper()
+    queries = [
+        ('source changelist', Person.objects.visible_to(user).order_by('-updated')[:100]),
+        ('source changelist (privacy filter)', Person.objects.filter(privacy_level='public').order_by('-updated')[:100]),
+        ('sources created by user', Person.objects.filter(created_by=user).order_by('-updated')[:100]),
+        ('import email lookup', Person.objects.with_email(email_address).order_by().values('pk')[:1]),
+        ('interaction changelist', Interaction.objects.visible_to(user).order_by('-date_time')[:100]),
+        ('interactions for a source', Interaction.objects.filter(interviewee_id=person_id).order_by('-date_time')),
+    ]
+    for label, queryset in queries:
+        plan = explain_queryset(queryset, analyze=True)
+        command.stdout.write('  {:<38} {:>9.2f} ms  {}'.format(
+            label, plan['Execution Time'], describe_plan(plan)
+        ))
+
+
+def benchmark_indexes(command, options):
+    """
+    Seed a synthetic dataset and compare the hot query plans without and
+    with the indexes from migration 0028. Everything is rolled back.
+    """
+    if connection.vendor != 'postgresql':
+        raise CommandError('The indexes benchmark needs EXPLAIN ANALYZE and only runs on Postgres.')
+
+    with transaction.atomic():
+        start = time.perf_counter()
+        seeded = seed_sources(people=options['people'], interactions=options['interactions'])
+        command.stdout.write('Seeded {} sources and {} interactions in {:.1f}s\n'.format(
+            options['people'], options['interactions'], time.perf_counter() - start
+        ))
+
+        # savepoint: drop the indexes, measure, then roll back to restore them
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index_name in HOT_COLUMN_INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+                cursor.execute('ANALYZE sources_person')
+                cursor.execute('ANALYZE sources_interaction')
+            command.stdout.write('Before (no hot column indexes):')
+            _explain_hot_queries(command, seeded)
+            transaction.set_rollback(True)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE sources_person')
+            cursor.execute('ANALYZE sources_interaction')
+        command.stdout.write('\nAfter (migration 0028 indexes):')
+        _explain_hot_queries(command, seeded)
+
+        transaction.set_rollback(True)
+
+
+def _median_ms(func, repeat):
+    """ Median wall time of func() in milliseconds """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+# run in a fresh interpreter; prints seconds spent in django.setup()
+STARTUP_SCRIPT = (
+    'import time\n'
+    'start = time.perf_counter()\n'
+    'import django\n'
+    'django.setup()\n'
+    '{extra}'
+    'print(time.perf_counter() - start)\n'
+)
+
+
+def _startup_ms(extra='', settings_module=None, repeat=5):
+    """ Median django.setup() time in a fresh interpreter, in milliseconds """
+    env = dict(os.environ)
+    if settings_module:
+        env['DJANGO_SETTINGS_MODULE'] = settings_module
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT.format(extra=extra)],
+            env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]) * 1000)
+    return statistics.median(timings)
+
+
+def benchmark_widgets(command, options):
+    """
+    Compare startup with the time zone choices built at import time (as
+    Person.timezone_choices() used to) against building them lazily, and
+    the Source form render with stock Select widgets against CachedSelect.
+    """
+    repeat = options['repeat']
+    # the eager build is emulated by forcing the lazy choices during startup
+    eager = _startup_ms('from sources.choices import TIMEZONE_CHOICES\nlen(TIMEZONE_CHOICES)\n')
+    lazy = _startup_ms()
+    command.stdout.write('Startup (django.setup(), median of 5 fresh interpreters):')
+    command.stdout.write('  {:<32} {:>9.1f} ms'.format('time zones built at import', eager))
+    command.stdout.write('  {:<32} {:>9.1f} ms'.format('lazy time zone choices', lazy))
+
+    model_admin = admin.site._registry[Person]
+    request = RequestFactory().get('/admin/sources/person/add/')
+    request.user = User.objects.filter(is_superuser=True).first() or User(username='benchmark', is_staff=True, is_superuser=True)
+
+    def form_for(cached_select_fields):
+        model_admin.cached_select_fields = cached_select_fields
+        try:
+            return model_admin.get_form(request)(initial={'timezone': 'America/New_York', 'country': 'United States'})
+        finally:
+            del model_admin.cached_select_fields
+
+    stock_form = form_for([])
+    cached_form = form_for(PersonAdmin.cached_select_fields)
+    command.stdout.write('\nSource form render (median of {} renders):'.format(repeat))
+    for label, render in (
+        ('time zone + country selects', lambda form: (str(form['timezone']), str(form['country']))),
+        ('whole form', lambda form: form.as_p()),
+    ):
+        before = _median_ms(lambda: render(stock_form), repeat)
+        after = _median_ms(lambda: render(cached_form), repeat)
+        command.stdout.write('  {:<32} {:>9.2f} ms -> {:>7.2f} ms'.format(label, before, after))
+
+
+# run in a fresh interpreter; prints the median latency of each URL in ms,
+# as JSON, after one warm-up request
+REQUEST_SCRIPT = (
+    'import json, statistics, time\n'
+    'import django\n'
+    'django.setup()\n'
+    'from django.conf import settings\n'
+    'from django.contrib.auth.models import User\n'
+    'from django.test import Client\n'
+    'hosts = [host for host in settings.ALLOWED_HOSTS if host and "*" not in host]\n'
+    'client = Client(HTTP_HOST=hosts[0] if hosts else "localhost")\n'
+    'user = User.objects.filter(is_superuser=True).order_by("pk").first()\n'
+    'if user is not None:\n'
+    '    client.force_login(user)\n'
+    'results = {{}}\n'
+    'for url in {urls!r}:\n'
+    '    client.get(url)\n'
+    '    timings = []\n'
+    '    for _ in range({repeat}):\n'
+    '        start = time.perf_counter()\n'
+    '        status = client.get(url).status_code\n'
+    '        timings.append((time.perf_counter() - start) * 1000)\n'
+    '    results[url] = [status, statistics.median(timings)]\n'
+    'print(json.dumps(results))\n'
+)
+# admin pages hit on every editing session. The source changelist is left
+# out by default: its Industry/Expertise/Organization list filters run a
+# query per source, which swamps everything else (add it with --url).
+SETTINGS_BENCHMARK_URLS = [
+    '/admin/',
+    '/admin/sources/person/add/',
+    '/admin/sources/interaction/',
+    '/admin/sources/interaction/add/',
+]
+
+
+def _request_latencies(settings_module, urls, repeat):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    output = subprocess.run(
+        [sys.executable, '-c', REQUEST_SCRIPT.format(urls=urls, repeat=repeat)],
+        env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_settings(command, options):
+    """
+    Compare startup time and admin request latency under the default
+    settings and the production profile, each in fresh interpreters so
+    the settings modules don't interfere. Requests are made as the first
+    superuser, if there is one, against the configured database.
+    """
+    baseline, production = options['baseline_settings'], options['production_settings']
+    repeat = options['repeat']
+    urls = options['url'] or SETTINGS_BENCHMARK_URLS
+
+    command.stdout.write('Startup (django.setup(), median of 5 fresh interpreters):')
+    for settings_module in (baseline, production):
+        command.stdout.write('  {:<40} {:>9.1f} ms'.format(settings_module, _startup_ms(settings_module=settings_module)))
+
+    before = _request_latencies(baseline, urls, repeat)
+    after = _request_latencies(production, urls, repeat)
+    command.stdout.write('\nRequest latency (median of {} requests): {} -> {}'.format(repeat, baseline, production))
+    for url in urls:
+        (status_before, ms_before), (status_after, ms_after) = before[url], after[url]
+        command.stdout.write('  {:<32} {:>9.2f} ms -> {:>7.2f} ms  (HTTP {}/{})'.format(
+            url, ms_before, ms_after, status_before, status_after
+        ))
+
+
+PERFORMANCE_MIDDLEWARE = 'sources.middleware.PerformanceMiddleware'
+
+
+def benchmark_middleware(command, options):
+    """
+    Measure PerformanceMiddleware's overhead: admin request latency with and
+    without it (requests alternate between the two so drift affects both),
+    and the per-query cost of its execute wrapper.
+    """
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    from sources.middleware import QueryTimer
+
+    repeat = options['repeat']
+    urls = options['url'] or SETTINGS_BENCHMARK_URLS
+    user = User.objects.filter(is_superuser=True).order_by('pk').first()
+    if user is None:
+        raise CommandError('The middleware benchmark requests admin pages as a superuser; create one first.')
+    hosts = [host for host in settings.ALLOWED_HOSTS if host and '*' not in host]
+    without_middleware = [middleware for middleware in settings.MIDDLEWARE if middleware != PERFORMANCE_MIDDLEWARE]
+
+    clients = {}
+    for label, middleware in (('without', without_middleware), ('with', [PERFORMANCE_MIDDLEWARE] + without_middleware)):
+        # the handler loads MIDDLEWARE on its first request and keeps it
+        with override_settings(MIDDLEWARE=middleware):
+            client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+            client.force_login(user)
+            for url in urls:
+                client.get(url)
+        clients[label] = client
+
+    command.stdout.write('Request latency (median of {} requests):'.format(repeat))
+    for url in urls:
+        timings = {'without': [], 'with': []}
+        for _ in range(repeat):
+            for label, client in clients.items():
+                start = time.perf_counter()
+                client.get(url)
+                timings[label].append((time.perf_counter() - start) * 1000)
+        before, after = statistics.median(timings['without']), statistics.median(timings['with'])
+        command.stdout.write('  {:<32} {:>9.2f} ms -> {:>7.2f} ms  ({:+.1f}%)'.format(
+            url, before, after, (after - before) / before * 100
+        ))
+
+    def run_queries():
+        with connection.cursor() as cursor:
+            for _ in range(100):
+                cursor.execute('SELECT 1')
+
+    def run_wrapped_queries():
+        with connection.execute_wrapper(QueryTimer()):
+            run_queries()
+
+    before = _median_ms(run_queries, repeat) / 100
+    after = _median_ms(run_wrapped_queries, repeat) / 100
+    command.stdout.write('\nPer query (SELECT 1): {:.4f} ms -> {:.4f} ms ({:+.4f} ms)'.format(before, after, after - before))
+
+
+SCENARIOS = {
+    'indexes': benchmark_indexes,
+    'middleware': benchmark_middleware,
+    'settings': benchmark_settings,
+    'widgets': benchmark_widgets,
+}
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark (against a throwaway synthetic dataset where one is needed).'
+
+    def add_arguments(self, parser):
+        ## required
+        parser.add_argument('scenario', choices=sorted(SCENARIOS),
+            help='Which benchmark to run.'
+        )
+        ## optional
+        parser.add_argument('--people', type=int, default=200000,
+            help='Number of synthetic sources to seed.'
+        )
+        parser.add_argument('--interactions', type=int, default=500000,
+            help='Number of synthetic interactions to seed.'
+        )
+        parser.add_argument('--repeat', type=int, default=200,
+            help='Number of times to repeat each timed operation.'
+        )
+        parser.add_argument('--baseline-settings', default='sourcedive.settings',
+            help='Settings module to compare against (settings scenario).'
+        )
+        parser.add_argument('--production-settings', default='sourcedive.settings_production',
+            help='Settings module being measured (settings scenario).'
+        )
+        parser.add_argument('--url', action='append',
+            help='URL to request, repeatable (settings/middleware scenarios; defaults to a few admin pages).'
+        )
+
+    def handle(self, *args, **options):
+        SCENARIOS[options['scenario']](self, options)
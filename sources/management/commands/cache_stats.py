@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from sources.cache import NAMESPACES, collect_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Print the hit rates of the sources cache namespaces (see sources/cache.py).'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--reset', action='store_true',
+            help='Clear the recorded counts after printing them.'
+        )
+
+    def handle(self, *args, **options):
+        stats = collect_stats()
+        if not stats:
+            self.stdout.write('No cache stats recorded (they need a cache shared with the web processes).')
+        else:
+            self.stdout.write('{:<12} {:>10} {:>10} {:>9}'.format('namespace', 'hits', 'misses', 'hit rate'))
+            for namespace in NAMESPACES:
+                hits, misses = stats.get(namespace, (0, 0))
+                rate = '{:.1%}'.format(hits / (hits + misses)) if hits + misses else '-'
+                self.stdout.write('{:<12} {:>10} {:>10} {:>9}'.format(namespace, hits, misses, rate))
+
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,129 @@
+import json
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from sources.hot_queries import HOT_QUERIES
+from sources.plans import explain_queryset, plan_regressions, plan_summary
+from sources.search import update_search_vectors
+from sources.summaries import refresh_summaries
+from sources.synthetic import seed_sources
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'query_plans.json')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset, EXPLAIN the registered hot queries (sources/hot_queries.py) '
+        'and fail if a plan regressed against the recorded baseline. Everything is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--people', type=int, default=20000,
+            help='Number of synthetic sources to seed.'
+        )
+        parser.add_argument('--interactions', type=int, default=50000,
+            help='Number of synthetic interactions to seed.'
+        )
+        parser.add_argument('--seed', type=int, default=0,
+            help='Random seed for the synthetic data, so runs are comparable.'
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+            help='Baseline plans file.'
+        )
+        parser.add_argument('--cost-threshold', type=float, default=0.5,
+            help='Fail when an estimated cost grows by more than this fraction (0.5 = 50%%).'
+        )
+        parser.add_argument('--cost-floor', type=float, default=100,
+            help='Ignore cost growth smaller than this many cost units (noise on cheap queries).'
+        )
+        parser.add_argument('--strict', action='store_true',
+            help='Also fail when a plan changed shape without getting worse, e.g. used another index.'
+        )
+        parser.add_argument('--update-baseline', action='store_true',
+            help='Record the current plans as the new baseline instead of checking them.'
+        )
+        parser.add_argument('--query', action='append', choices=sorted(HOT_QUERIES),
+            help='Only check this query (can be repeated).'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('check_query_plans compares Postgres plans and only runs on Postgres.')
+
+        labels = options['query'] or list(HOT_QUERIES)
+        # rows left behind by earlier (rolled back) runs inflate the page
+        # counts the planner costs with; VACUUM can't run in a transaction
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE')
+        with transaction.atomic():
+            random.seed(options['seed'])
+            start = time.perf_counter()
+            seeded = seed_sources(people=options['people'], interactions=options['interactions'])
+            # bulk_create skips the signals that maintain the search vectors
+            # and summaries
+            update_search_vectors(seeded['person_ids'])
+            refresh_summaries(seeded['person_ids'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write('Seeded {} sources and {} interactions in {:.1f}s\n'.format(
+                options['people'], options['interactions'], time.perf_counter() - start
+            ))
+            summaries = {
+                label: plan_summary(explain_queryset(HOT_QUERIES[label](seeded)))
+                for label in labels
+            }
+            transaction.set_rollback(True)
+
+        if options['update_baseline']:
+            self._write_baseline(options['baseline'], summaries)
+            return
+
+        try:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            raise CommandError('No baseline at {}; record one with --update-baseline.'.format(options['baseline']))
+
+        failures = 0
+        for label, summary in summaries.items():
+            if label not in baseline:
+                self.stdout.write('  {:<38} {:>9.0f}  NEW (no baseline)  {}'.format(label, summary['cost'], summary['shape']))
+                continue
+            problems = plan_regressions(baseline[label], summary, options['cost_threshold'], options['cost_floor'])
+            if options['strict'] and summary['shape'] != baseline[label]['shape']:
+                problems.append('plan changed from "{}"'.format(baseline[label]['shape']))
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR('  {:<38} {:>9.0f}  REGRESSED'.format(label, summary['cost'])))
+                for problem in problems:
+                    self.stdout.write('      ' + problem)
+            elif summary['shape'] != baseline[label]['shape']:
+                self.stdout.write(self.style.WARNING('  {:<38} {:>9.0f}  changed  {}'.format(label, summary['cost'], summary['shape'])))
+                self.stdout.write('      was "{}"'.format(baseline[label]['shape']))
+            else:
+                self.stdout.write('  {:<38} {:>9.0f}  ok  {}'.format(label, summary['cost'], summary['shape']))
+
+        if failures:
+            raise CommandError(
+                '{} of {} query plans regressed. If the change is intended, re-record the baseline '
+                'with --update-baseline.'.format(failures, len(summaries))
+            )
+
+    def _write_baseline(self, path, summaries):
+        try:
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            baseline = {}
+        # keep the baselines of queries that weren't run (see --query)
+        baseline.update(summaries)
+        with open(path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        self.stdout.write('Recorded {} plans in {}'.format(len(summaries), path))
@@ -6,34 +6,42 @@ from django.core.management import call_command
 from django.contrib.auth.models import User
 # from django.http import HttpResponse
 
-from sources.models import Person, Dive
+from sources.cache import user_dive_ids
+from sources.models import Person, PersonSummary
 
 
-def export_sources(user_id):
+def exportable_sources(user):
     """
-    Generate a list and provide a csv. Sources included are based on sources:
+    Sources the user may export:
         - this user created
         - another user set exportable by a Dive this user is affiliated with
         - another user set exportable by this user
     """
-    user = User.objects.get(id=user_id)
     sources = Person.objects.all()
 
     # created by this user (all privacy levels)
     sources_created_by_user = sources.filter(created_by=user)
-    # exportable by Dive (only public for now)
-    try:
-        user_dive = Dive.objects.get(users=user)
+    # exportable by Dive (only public for now), for users in exactly one dive
+    dive_ids = user_dive_ids(user.pk)
+    if len(dive_ids) == 1:
         sources_exportable_by_dive = sources.filter(
             privacy_level='public',
-            exportable_by=user_dive
+            exportable_by=dive_ids[0]
         )
         # combine the querysets
         sources_to_export = sources_created_by_user | sources_exportable_by_dive
-    except:
+    else:
         sources_to_export = sources_created_by_user
     # exportable by another user; TODO after this field is added
     # sources_exportable_by_user = sources.filter()
+    return sources_to_export
+
+
+def export_sources(user_id):
+    """ Generate a list and provide a csv, see exportable_sources() """
+    user = User.objects.get(id=user_id)
+    sources_to_export = exportable_sources(user).select_related('summary').order_by('pk')
+    usernames = dict(User.objects.values_list('pk', 'username'))
 
     # create the csv
     username = user.get_username()
@@ -46,29 +54,23 @@ def export_sources(user_id):
 
         sources_writer.writeheader()
 
-        # must be so verbose in order to join the M2M fields values into strings
-        for source in sources:
-            expertise = ', '.join(
-                [expertise.name for expertise in source.expertise.all()]
-            )
-            industries = ', '.join(
-                [industry.name for industry in source.industries.all()]
-            )
-            organizations = ', '.join(
-                [organization.name for organization in source.organization.all()]
-            )
+        # the M2M names come joined from the source summaries (see
+        # sources/summaries.py) instead of three queries per source
+        for source in sources_to_export.iterator(chunk_size=2000):
+            summary = getattr(source, 'summary', None) or PersonSummary()
 
             row_dict = {
                 'city': source.city,
                 'country': source.country,
                 'email_address': source.email_address,
-                'expertise': expertise,
+                'expertise': summary.expertise_names,
+                'exportable_by': summary.dive_names,
                 'gatekeeper': source.gatekeeper,
                 'import_notes': source.import_notes,
-                'industries': industries,
+                'industries': summary.industry_names,
                 'linkedin': source.linkedin,
                 'name': source.name,
-                'organization': organizations,
+                'organization': summary.organization_names,
                 'phone_number_primary': source.phone_number_primary,
                 'phone_number_secondary': source.phone_number_secondary,
                 'prefix': source.prefix,
@@ -81,7 +83,8 @@ def export_sources(user_id):
                 'twitter': source.twitter,
                 'type_of_expert': source.type_of_expert,
                 'website': source.website,
-                'created_by': source.created_by.username,
+                'created_by': usernames.get(source.created_by_id, ''),
+                'created': source.created,
                 'updated': source.updated,
             }
             sources_writer.writerow(row_dict)
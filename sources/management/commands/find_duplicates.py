@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sources.duplicates import DUPLICATE_CHUNK_SIZE, DUPLICATE_MAX_BLOCK_SIZE, DUPLICATE_MIN_SCORE, find_duplicates
+
+
+class Command(BaseCommand):
+    help = 'Find likely duplicate sources and queue them for review in the admin (see sources/duplicates.py).'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--workers', type=int, default=1,
+            help='Number of processes to split the blocking keys between.'
+        )
+        parser.add_argument('--min-score', type=float, default=DUPLICATE_MIN_SCORE,
+            help='Lowest score (0 to 1) of a pair to queue.'
+        )
+        parser.add_argument('--max-block-size', type=int, default=DUPLICATE_MAX_BLOCK_SIZE,
+            help='Skip keys shared by more sources than this.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=DUPLICATE_CHUNK_SIZE,
+            help='Number of rows to read or write at a time.'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+            help='Count the candidates without replacing the review queue.'
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        counts = find_duplicates(
+            workers=max(options['workers'], 1),
+            min_score=options['min_score'],
+            max_block_size=options['max_block_size'],
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write('{} candidate pairs in {:.1f}s ({} oversized blocks skipped)'.format(
+            counts['candidates'], time.monotonic() - start, counts['oversized blocks'],
+        ))
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User, Group
 from django.utils import timezone
 
 from sourcedive.settings import TEST_ENV
+from sources.lookups import get_or_create_lookup
 from sources.models import Dive, Expertise, Industry, Organization, Person
 
 
@@ -17,11 +18,10 @@ def create_person(data_dict, m2m_dict):
     both import file types.
     """
     email_address = data_dict['email_address']
-    # check if the person already exists:
-    try:
-        exists = Person.objects.get(email_address=email_address)
+    # check if the person already exists (case-insensitive, uses the lower(email_address) index)
+    if Person.objects.with_email(email_address).exists():
         create_message = f'Skipping: Person with {email_address} already exists.'
-    except:
+    else:
         # try:
         person_obj, person_created = Person.objects.update_or_create(**data_dict)
         # populate MANY-TO-MANY fields
@@ -29,28 +29,28 @@ def create_person(data_dict, m2m_dict):
             # created_by (FK)
             created_by_email = m2m_dict['created_by']
             user, user_created = User.objects.get_or_create(email=created_by_email)
-            person_qs = Person.objects.filter(email_address=person_obj.email_address)
+            person_qs = Person.objects.filter(pk=person_obj.pk)
             person_qs.update(created_by=user)
             # expertise (M2M)
             expertise_values = m2m_dict['expertise']
             if expertise_values:
                 values_list = [value.strip() for value in expertise_values.split(',')]
                 for value in values_list:
-                    expertise_obj, expertise_created = Expertise.objects.get_or_create(name=value)
+                    expertise_obj, expertise_created = get_or_create_lookup(Expertise, value)
                     person_obj.expertise.add(expertise_obj)
             # industry (M2M)
             industry_values = m2m_dict['industries']
             if industry_values:
                 values_list = [value.strip() for value in industry_values.split(',')]
                 for value in values_list:
-                    industry_obj, industry_created = Industry.objects.get_or_create(name=value)
+                    industry_obj, industry_created = get_or_create_lookup(Industry, value)
                     person_obj.industries.add(industry_obj)
             # organization (M2M)
             organization_values = m2m_dict['organization']
             if organization_values:
                 values_list = [value.strip() for value in organization_values.split(',')]
                 for value in values_list:
-                    organization_obj, organization_created = Organization.objects.get_or_create(name=value)
+                    organization_obj, organization_created = get_or_create_lookup(Organization, value)
                     person_obj.organization.add(organization_obj)
             # owned by (M2M)
             exportable_by_values = m2m_dict['exportable_by']
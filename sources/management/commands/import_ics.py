@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sources.choices import PRIVACY_CHOICES
+from sources.ics import ICS_BATCH_SIZE, CalendarImport
+from sources.models import Interaction
+
+
+class Command(BaseCommand):
+    help = 'Log interactions from the events of calendar (.ics) files (see sources/ics.py).'
+
+    def add_arguments(self, parser):
+        ## required
+        parser.add_argument('files', nargs='+',
+            help='Specify the .ics files.'
+        )
+        parser.add_argument('--user', required=True,
+            help='Username of the user the interactions are logged by; only sources they can see are matched.'
+        )
+        ## optional
+        parser.add_argument('--privacy-level', choices=[value for value, label in PRIVACY_CHOICES], default='private_individual',
+            help='Privacy level of the new interactions.'
+        )
+        parser.add_argument('--interaction-type', choices=[value for value, label in Interaction.INTERACTION_CHOICES], default='',
+            help='Type of the new interactions.'
+        )
+        parser.add_argument('--include-future', action='store_true',
+            help='Also log events that haven\'t started yet.'
+        )
+        parser.add_argument('--batch-size', type=int, default=ICS_BATCH_SIZE,
+            help='Number of interactions to create at a time.'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+            help='Count what would be imported without creating anything.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('No user {}'.format(options['user']))
+
+        start = time.monotonic()
+        calendar_import = CalendarImport(
+            user,
+            privacy_level=options['privacy_level'],
+            interaction_type=options['interaction_type'],
+            include_future=options['include_future'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        for path in options['files']:
+            try:
+                with open(path, encoding='utf-8', errors='replace', newline='') as ics_file:
+                    calendar_import.add_file(ics_file)
+            except OSError as error:
+                raise CommandError(error)
+
+        counts = calendar_import.counts
+        self.stdout.write('{} events in {:.1f}s: {} interactions {}'.format(
+            counts['events'], time.monotonic() - start, counts['created'],
+            'would be created' if options['dry_run'] else 'created',
+        ))
+        for reason, count in sorted(counts.items()):
+            if reason not in ('events', 'created'):
+                self.stdout.write('  {}: {}'.format(reason, count))
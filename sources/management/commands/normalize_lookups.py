@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from sources.lookups import LOOKUP_MODELS, normalize_lookups
+
+
+class Command(BaseCommand):
+    help = 'Merge the expertise, industries and organizations whose names normalize the same (see sources/lookups.py).'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--model', choices=[model._meta.model_name for model in LOOKUP_MODELS],
+            help='Only normalize this model.'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+            help='Print the merges without making them.'
+        )
+
+    def handle(self, *args, **options):
+        for model in LOOKUP_MODELS:
+            if options['model'] and model._meta.model_name != options['model']:
+                continue
+            merged, moved = normalize_lookups(model, dry_run=options['dry_run'], stdout=self.stdout)
+            self.stdout.write('{}: {} rows merged, {} source links re-pointed{}'.format(
+                model._meta.verbose_name_plural, merged, moved, ' (dry run)' if options['dry_run'] else '',
+            ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from sources.performance import collect_samples, reset, summarize
+
+
+SORT_CHOICES = ['count', 'p50_ms', 'p90_ms', 'p99_ms', 'db_ms', 'queries']
+
+
+class Command(BaseCommand):
+    help = 'Print rolling per-view request timings recorded by PerformanceMiddleware.'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--sort', choices=SORT_CHOICES, default='p90_ms',
+            help='Column to sort views by (descending).'
+        )
+        parser.add_argument('--limit', type=int, default=25,
+            help='Number of views to show.'
+        )
+        parser.add_argument('--reset', action='store_true',
+            help='Clear the recorded timings after printing them.'
+        )
+
+    def handle(self, *args, **options):
+        summaries = [
+            (view, summarize(samples))
+            for view, samples in collect_samples().items() if samples
+        ]
+        summaries.sort(key=lambda item: item[1][options['sort']], reverse=True)
+
+        if not summaries:
+            self.stdout.write('No request timings recorded (they need a cache shared with the web processes).')
+        else:
+            self.stdout.write('{:<50} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+                'view', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'db ms', 'queries', 'tpl ms'
+            ))
+            for view, summary in summaries[:options['limit']]:
+                self.stdout.write('{:<50} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8.1f} {:>9.1f}'.format(
+                    view[:50], summary['count'], summary['p50_ms'], summary['p90_ms'], summary['p99_ms'],
+                    summary['db_ms'], summary['queries'], summary['template_ms'],
+                ))
+
+        if options['reset']:
+            reset()
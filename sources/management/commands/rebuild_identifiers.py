@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from sources.identifiers import IDENTIFIER_BATCH_SIZE, index_identifiers
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the normalized contact identifiers of every source (see sources/identifiers.py).'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--batch-size', type=int, default=IDENTIFIER_BATCH_SIZE,
+            help='Number of sources to index at a time.'
+        )
+
+    def handle(self, *args, **options):
+        index_identifiers(batch_size=options['batch_size'])
+        self.stdout.write('Rebuilt the contact identifiers')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from sources.search_backends import INDEX_BATCH_SIZE, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Clear the search index and re-index every source and interaction.'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--batch-size', type=int, default=INDEX_BATCH_SIZE,
+            help='Number of rows to index at a time.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Rebuilding the {search_backend.__class__.__name__} index')
+        search_backend.rebuild(batch_size=options['batch_size'], stdout=self.stdout)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from sources.analytics import update_rollup
+from sources.cache import invalidate
+
+
+class Command(BaseCommand):
+    help = 'Recompute the interaction analytics rollup for every day (see sources/analytics.py).'
+
+    def handle(self, *args, **options):
+        update_rollup()
+        invalidate('analytics')
+        self.stdout.write('Rebuilt the interaction rollup')
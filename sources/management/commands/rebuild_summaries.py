@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from sources.summaries import SUMMARY_BATCH_SIZE, refresh_summaries, update_interaction_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the denormalized summary and the interaction totals of every source '
+        '(see sources/summaries.py).'
+    )
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--batch-size', type=int, default=SUMMARY_BATCH_SIZE,
+            help='Number of sources to summarize at a time.'
+        )
+
+    def handle(self, *args, **options):
+        refresh_summaries(batch_size=options['batch_size'])
+        self.stdout.write('Rebuilt the source summaries')
+        update_interaction_totals()
+        self.stdout.write('Recomputed the interaction totals')
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from sources.models import SlowQuery
+
+
+SORT_CHOICES = ['total_ms', 'count', 'mean_ms', 'max_ms']
+
+
+class Command(BaseCommand):
+    help = 'Print the slow query fingerprints with the most total time (see sources/slow_queries.py).'
+
+    def add_arguments(self, parser):
+        ## optional
+        parser.add_argument('--sort', choices=SORT_CHOICES, default='total_ms',
+            help='Column to sort fingerprints by (descending).'
+        )
+        parser.add_argument('--limit', type=int, default=10,
+            help='Number of fingerprints to show.'
+        )
+        parser.add_argument('--hours', type=float,
+            help='Only count queries logged in the last this many hours.'
+        )
+        parser.add_argument('--plans', action='store_true',
+            help='Show the call site and plan of the slowest sample of each fingerprint.'
+        )
+        parser.add_argument('--clear', action='store_true',
+            help='Delete the logged queries after printing them.'
+        )
+
+    def handle(self, *args, **options):
+        queries = SlowQuery.objects.all()
+        if options['hours']:
+            queries = queries.filter(created__gte=timezone.now() - timedelta(hours=options['hours']))
+
+        fingerprints = list(
+            queries.order_by().values('fingerprint').annotate(
+                count=Count('pk'),
+                total_ms=Sum('duration_ms'),
+                mean_ms=Avg('duration_ms'),
+                max_ms=Max('duration_ms'),
+                last_seen=Max('created'),
+            ).order_by('-' + options['sort'])[:options['limit']]
+        )
+
+        if not fingerprints:
+            self.stdout.write('No slow queries logged.')
+        for row in fingerprints:
+            slowest = queries.filter(fingerprint=row['fingerprint']).order_by('-duration_ms').first()
+            self.stdout.write('{}  {} queries, {:.0f} ms total, {:.1f} ms mean, {:.1f} ms max, last {:%Y-%m-%d %H:%M}'.format(
+                row['fingerprint'], row['count'], row['total_ms'], row['mean_ms'], row['max_ms'], row['last_seen'],
+            ))
+            self.stdout.write('  ' + slowest.statement[:500])
+            if options['plans']:
+                self.stdout.write('  called from:')
+                for line in slowest.call_site.splitlines():
+                    self.stdout.write('    ' + line)
+                if slowest.plan:
+                    self.stdout.write('  plan ({:.1f} ms sample):'.format(slowest.duration_ms))
+                    for line in slowest.plan.splitlines():
+                        self.stdout.write('    ' + line)
+            self.stdout.write('')
+
+        if options['clear']:
+            SlowQuery.objects.all().delete()
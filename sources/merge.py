@@ -0,0 +1,166 @@
+"""
+Merging duplicate sources into one survivor.
+
+merge_sources(survivor, duplicates, user) runs in one transaction and with
+set-based statements however much the duplicates have:
+
+    - the survivor's empty fields are filled from the duplicates (the most
+      recently updated first); contact fields only from duplicates whose
+      contact data the user can see
+    - their interactions are moved with one UPDATE
+    - their expertise/industry/organization/dive memberships are copied with
+      one INSERT ... SELECT ... ON CONFLICT DO NOTHING per through table, so
+      memberships the survivor already has are skipped
+    - the duplicates are deleted (their through rows and duplicate
+      candidates with them)
+
+and records a SourceMerge with the deleted rows' values and what moved, so
+a merge can be looked into (or undone by hand) later. The recorded contact
+fields are only shown to those who could see them on the source, see
+visible_details().
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+
+from sources.models import Interaction, Person, SourceMerge
+from sources.signals import schedule_person_refresh, schedule_refresh
+from sources.summaries import update_interaction_totals
+
+
+# Person fields that aren't copied to the survivor
+MERGE_EXCLUDED_FIELDS = {'id', 'created', 'updated', 'created_by', 'related_user', 'search_vector', 'privacy_level',
+                         'interaction_count', 'last_interaction_at'}
+MERGE_M2M_FIELDS = ['expertise', 'industries', 'organization', 'exportable_by']
+# hidden on semi-private sources, as in PersonAdmin._get_correct_contact_field_names
+MERGE_CONTACT_FIELDS = ['email_address', 'phone_number_primary', 'phone_number_secondary']
+
+
+class MergeError(Exception):
+    """ The sources can't be merged """
+
+
+def can_see_contact_data(user, created_by_id, privacy_level):
+    """ Person.objects.contact_visible_to for a merged (deleted) source's recorded values """
+    return created_by_id == user.pk or privacy_level not in ['searchable', 'private_individual']
+
+
+def visible_details(details, user):
+    """ A SourceMerge's details with the contact fields user can't see blanked out """
+    details = json.loads(details)
+    for source in details.get('merged_sources', []):
+        if not can_see_contact_data(user, source.get('created_by'), source.get('privacy_level')):
+            source.update({field_name: '(hidden)' for field_name in MERGE_CONTACT_FIELDS if source.get(field_name)})
+    return json.dumps(details, indent=2)
+
+
+def _copy_memberships(field_name, survivor_id, duplicate_ids):
+    """ Give the survivor the duplicates' memberships of an M2M field; returns the number added """
+    field = Person._meta.get_field(field_name)
+    through = field.remote_field.through._meta
+    source_column = through.get_field(field.m2m_field_name()).column
+    target_column = through.get_field(field.m2m_reverse_field_name()).column
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # the WHERE is also what lets SQLite parse ON CONFLICT after a SELECT
+        cursor.execute(
+            'INSERT INTO {table} ({source}, {target}) '
+            'SELECT DISTINCT %s, {target} FROM {table} WHERE {source} IN ({placeholders}) '
+            'ON CONFLICT DO NOTHING'.format(
+                table=quote(through.db_table),
+                source=quote(source_column),
+                target=quote(target_column),
+                placeholders=', '.join(['%s'] * len(duplicate_ids)),
+            ),
+            [survivor_id] + list(duplicate_ids),
+        )
+        return cursor.rowcount
+
+
+def merge_sources(survivor, duplicates, user):
+    """
+    Merge the duplicates (Persons or ids) into survivor (a Person or id), see
+    the module docstring. Returns the SourceMerge.
+    """
+    survivor_id = getattr(survivor, 'pk', survivor)
+    duplicate_ids = sorted({getattr(duplicate, 'pk', duplicate) for duplicate in duplicates} - {survivor_id})
+    if not duplicate_ids:
+        raise MergeError('Choose at least one source to merge into the survivor.')
+
+    with transaction.atomic():
+        # lock the rows, so a concurrent edit or merge waits for this one
+        people = {
+            person.pk: person
+            for person in Person.objects.select_for_update().filter(pk__in=[survivor_id] + duplicate_ids)
+        }
+        if set(people) != {survivor_id} | set(duplicate_ids):
+            raise MergeError('Some of the sources no longer exist.')
+        survivor = people[survivor_id]
+        duplicates = sorted(
+            (people[pk] for pk in duplicate_ids),
+            key=lambda person: (person.updated is not None, person.updated), reverse=True,
+        )
+
+        contact_visible_ids = set(
+            Person.objects.filter(pk__in=duplicate_ids).contact_visible_to(user).values_list('pk', flat=True)
+        )
+        copied_fields = {}
+        for field in Person._meta.concrete_fields:
+            if field.name in MERGE_EXCLUDED_FIELDS or getattr(survivor, field.attname) not in (None, ''):
+                continue
+            for duplicate in duplicates:
+                if field.name in MERGE_CONTACT_FIELDS and duplicate.pk not in contact_visible_ids:
+                    continue
+                if getattr(duplicate, field.attname) not in (None, ''):
+                    setattr(survivor, field.attname, getattr(duplicate, field.attname))
+                    copied_fields[field.name] = duplicate.pk
+                    break
+        # also bumps updated, which the change view's ETag is built from
+        survivor.save()
+
+        moved_interaction_ids = list(
+            Interaction.objects.filter(interviewee_id__in=duplicate_ids).values_list('pk', flat=True)
+        )
+        Interaction.objects.filter(interviewee_id__in=duplicate_ids).update(interviewee_id=survivor_id)
+        update_interaction_totals([survivor_id])
+
+        memberships = {
+            field_name: _copy_memberships(field_name, survivor_id, duplicate_ids)
+            for field_name in MERGE_M2M_FIELDS
+        }
+
+        # snapshot the duplicates before they go, with one query per M2M field
+        merged_sources = {
+            duplicate.pk: dict(model_to_dict(duplicate, exclude=['search_vector'] + MERGE_M2M_FIELDS), **{
+                field_name: [] for field_name in MERGE_M2M_FIELDS
+            })
+            for duplicate in duplicates
+        }
+        for field_name in MERGE_M2M_FIELDS:
+            field = Person._meta.get_field(field_name)
+            rows = field.remote_field.through.objects.filter(**{
+                f'{field.m2m_field_name()}_id__in': duplicate_ids
+            }).values_list(f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id')
+            for person_id, related_id in rows:
+                merged_sources[person_id][field_name].append(related_id)
+
+        Person.objects.filter(pk__in=duplicate_ids).delete()
+
+        # UPDATE and raw SQL send no signals; index them like a saved row
+        schedule_person_refresh([survivor_id])
+        schedule_refresh('interaction', moved_interaction_ids)
+
+        return SourceMerge.objects.create(
+            survivor=survivor,
+            survivor_name=survivor.name or '',
+            merged_by=user,
+            merged_ids=', '.join(str(pk) for pk in duplicate_ids),
+            details=json.dumps({
+                'merged_sources': list(merged_sources.values()),
+                'copied_fields': copied_fields,
+                'moved_interactions': moved_interaction_ids,
+                'added_memberships': memberships,
+            }, cls=DjangoJSONEncoder, indent=2),
+        )
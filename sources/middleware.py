@@ -0,0 +1,154 @@
+"""
+Request instrumentation middleware.
+
+PerformanceMiddleware is cheap enough to leave on in production
+(debug_toolbar is dev-only). For each request PerformanceMiddleware measures:
+
+    - the number of DB queries and the time spent in them, through
+      connection.execute_wrapper() on every configured database
+    - the time spent rendering the response's template (TemplateResponse,
+      which covers the admin), including any queries run while rendering
+    - the total time spent below this middleware
+
+and reports them as a `Server-Timing` header (staff only; browsers show it
+in the network panel), as one JSON log line on the `sources.performance`
+logger, and into the rolling per-view windows in sources/performance.py.
+
+ProfilingMiddleware runs opted-in staff requests under a profiler, see
+sources/profiling.py.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from sources.performance import view_timings
+from sources.profiling import PROFILE_PARAM, RequestProfile, profile_lock, profiling_requested, save_profile
+
+
+logger = logging.getLogger('sources.performance')
+
+
+class QueryTimer(object):
+    """ execute_wrapper that counts queries and adds up their duration """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class PerformanceMiddleware(object):
+    """ Should come first in MIDDLEWARE so the total covers the other middleware """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        timer = QueryTimer()
+        request._template_seconds = 0.0
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        db_ms = timer.seconds * 1000
+        template_ms = request._template_seconds * 1000
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else '<unresolved>'
+
+        view_timings.record(view_name, total_ms, db_ms, timer.queries, template_ms)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': view_name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'db_ms': round(db_ms, 2),
+                'queries': timer.queries,
+                'template_ms': round(template_ms, 2),
+            }))
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = ', '.join([
+                'db;dur={:.2f};desc="{} queries"'.format(db_ms, timer.queries),
+                'tpl;dur={:.2f};desc="Templates"'.format(template_ms),
+                'total;dur={:.2f};desc="Total"'.format(total_ms),
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Called right before the response is rendered when this middleware is
+        first in MIDDLEWARE; the post-render callback marks the end.
+        """
+        render_start = time.perf_counter()
+
+        def rendered(response):
+            request._template_seconds += time.perf_counter() - render_start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles staff requests that opt in, see sources/profiling.py. Must come
+    after AuthenticationMiddleware; everything below it is profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_requested(request):
+            return self.get_response(request)
+        if PROFILE_PARAM in request.GET:
+            # hide the token from views; the admin changelist rejects unknown parameters
+            query = request.GET.copy()
+            del query[PROFILE_PARAM]
+            query._mutable = False
+            request.GET = query
+        if not profile_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Sources-Profile'] = 'skipped: another request is being profiled'
+            return response
+
+        try:
+            profile = RequestProfile()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.sql))
+                with profile:
+                    response = self.get_response(request)
+                    # render here so template time is part of the profile
+                    if hasattr(response, 'render') and callable(response.render):
+                        response = response.render()
+        finally:
+            profile_lock.release()
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        path = request.path + ('?' + request.GET.urlencode() if request.GET else '')
+        profile_id = save_profile(dict(
+            profile.to_dict(),
+            path=path,
+            method=request.method,
+            view=resolver_match.view_name if resolver_match else '<unresolved>',
+            status=response.status_code,
+            user=request.user.get_username(),
+            created=time.strftime('%Y-%m-%d %H:%M:%S'),
+        ))
+        response['X-Sources-Profile'] = profile_id
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0027_remove_person_language'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['-date_time'], name='interaction_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['interviewee', '-date_time'], name='interaction_interviewee_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['privacy_level', '-date_time'], name='interaction_privacy_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['created_by', '-date_time'], name='interaction_created_by_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['-updated'], name='person_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['privacy_level', '-updated'], name='person_privacy_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['created_by', '-updated'], name='person_created_by_updated_idx'),
+        ),
+        # functional index for the case-insensitive email lookups done on
+        # every imported row (see PersonQuerySet.with_email)
+        migrations.RunSQL(
+            sql='CREATE INDEX person_email_lower_idx ON sources_person (lower(email_address));',
+            reverse_sql='DROP INDEX person_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:21
+
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+# frozen copy of sources.search as of this migration, so later changes to
+# the search vector don't change what migrating an old database does;
+# `manage.py rebuild_index` rebuilds the vectors with the current code
+SEARCH_CONFIG = 'english'
+REBUILD_BATCH_SIZE = 5000
+
+
+def create_search_vector_index(apps, schema_editor):
+    """ GIN index for full-text search; only supported on Postgres """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX person_search_vector_idx ON sources_person USING gin (search_vector);')
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS person_search_vector_idx;')
+
+
+def _m2m_names(Person, field_name):
+    from django.contrib.postgres.aggregates import StringAgg
+
+    m2m_field = Person._meta.get_field(field_name)
+    source_name = m2m_field.m2m_field_name()
+    target_name = m2m_field.m2m_reverse_field_name()
+    return Subquery(
+        m2m_field.remote_field.through.objects.filter(**{source_name: OuterRef('pk')})
+        .values(source_name)
+        .annotate(names=StringAgg(f'{target_name}__name', delimiter=' '))
+        .values('names')
+    )
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+
+    Person = apps.get_model('sources', 'Person')
+
+    def vector(*expressions, weight):
+        return SearchVector(*expressions, weight=weight, config=SEARCH_CONFIG)
+
+    expression = (
+        vector('name', weight='A') +
+        vector('title', _m2m_names(Person, 'organization'), weight='B') +
+        vector('type_of_expert', _m2m_names(Person, 'expertise'), _m2m_names(Person, 'industries'), weight='C') +
+        vector('import_notes', 'email_address', 'twitter', 'website', 'city', 'state', 'country', weight='D')
+    )
+    person_ids = list(Person.objects.order_by().values_list('pk', flat=True))
+    for start in range(0, len(person_ids), REBUILD_BATCH_SIZE):
+        Person.objects.filter(pk__in=person_ids[start:start + REBUILD_BATCH_SIZE]).update(search_vector=expression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0028_add_hot_column_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_vector_index, drop_search_vector_index),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
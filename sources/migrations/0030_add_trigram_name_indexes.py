@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+# (index name, table) for every name column used by the typeahead lookups
+TRIGRAM_INDEXES = [
+    ('person_name_trgm_idx', 'sources_person'),
+    ('organization_name_trgm_idx', 'sources_organization'),
+    ('expertise_name_trgm_idx', 'sources_expertise'),
+    ('industry_name_trgm_idx', 'sources_industry'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    GIN trigram indexes on upper(name), which serve both the pg_trgm %
+    operator and the UPPER(name) LIKE ... that Django's icontains generates.
+    Only supported on Postgres.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    for index_name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {index_name} ON {table} USING gin (upper(name::text) gin_trgm_ops);'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0029_add_person_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0030_add_trigram_name_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('fingerprint', models.CharField(db_index=True, max_length=32)),
+                ('statement', models.TextField(help_text='The statement with literals and parameters normalized away.')),
+                ('duration_ms', models.FloatField()),
+                ('call_site', models.TextField(blank=True)),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN (ANALYZE, BUFFERS) output (Postgres only).')),
+                ('database', models.CharField(default='default', max_length=255)),
+            ],
+            options={
+                'verbose_name_plural': 'Slow queries',
+                'ordering': ['-pk'],
+            },
+        ),
+    ]
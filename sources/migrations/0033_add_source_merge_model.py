@@ -0,0 +1,31 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sources', '0032_add_duplicate_candidate_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceMerge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('survivor_name', models.CharField(blank=True, max_length=255)),
+                ('merged_ids', models.TextField(help_text='Ids of the sources merged into the survivor (and deleted).')),
+                ('details', models.TextField(help_text="JSON: the merged sources' values and memberships, the fields copied to the survivor and the interactions moved.")),
+                ('merged_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source_merges', to=settings.AUTH_USER_MODEL)),
+                ('survivor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='merges', to='sources.Person')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
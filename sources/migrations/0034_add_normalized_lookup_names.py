@@ -0,0 +1,81 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:27
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# frozen copy of sources.names as of this migration, so later changes to the
+# normalization don't change what migrating an old database does;
+# `manage.py normalize_lookups` renormalizes with the current code
+ORGANIZATION_SUFFIXES = {
+    'ag', 'co', 'company', 'corp', 'corporation', 'gmbh', 'inc', 'incorporated',
+    'limited', 'llc', 'llp', 'lp', 'ltd', 'plc', 'sa',
+}
+
+
+def normalize_name(name, model_name=None):
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(character for character in name if not unicodedata.combining(character)).casefold()
+    name = name.replace('&', ' and ')
+    words = re.findall(r'[^\W_]+', name.replace("'", ''))
+    if model_name == 'organization':
+        if len(words) > 1 and words[0] == 'the':
+            words = words[1:]
+        while len(words) > 1 and words[-1] in ORGANIZATION_SUFFIXES and words[-2] != 'and':
+            words = words[:-1]
+    return ' '.join(words)
+
+
+def backfill_normalized_names(apps, schema_editor):
+    for model_name in ('expertise', 'industry', 'organization'):
+        model = apps.get_model('sources', model_name)
+        rows = list(model.objects.only('pk', 'name'))
+        for row in rows:
+            row.normalized_name = normalize_name(row.name, model_name)
+        model.objects.bulk_update(rows, ['normalized_name'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0033_add_source_merge_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LookupAlias',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True, help_text='This is when the item was updated in the system.', null=True, verbose_name='Updated in system')),
+                ('kind', models.CharField(choices=[('expertise', 'Expertise'), ('industry', 'Industry'), ('organization', 'Organization')], max_length=15)),
+                ('alias', models.CharField(help_text='Normalized name that should be treated as the other one.', max_length=255)),
+                ('normalized_name', models.CharField(max_length=255)),
+            ],
+            options={
+                'verbose_name_plural': 'Lookup aliases',
+            },
+        ),
+        migrations.AddField(
+            model_name='expertise',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='industry',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='lookupalias',
+            constraint=models.UniqueConstraint(fields=('kind', 'alias'), name='lookup_alias_kind_alias_unique'),
+        ),
+        migrations.RunPython(backfill_normalized_names, migrations.RunPython.noop),
+    ]
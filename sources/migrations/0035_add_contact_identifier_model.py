@@ -0,0 +1,119 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:31
+
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# frozen copy of the normalization in sources.identifiers as of this
+# migration, so later changes to it don't change what migrating an old
+# database does; `manage.py rebuild_identifiers` reindexes with the current code
+IDENTIFIER_BATCH_SIZE = 2000
+IDENTIFIER_COLUMNS = ['pk', 'email_address', 'phone_number_primary', 'phone_number_secondary', 'twitter', 'skype', 'linkedin', 'website']
+
+
+def normalize_email(email_address):
+    email_address = (email_address or '').strip().lower()
+    if email_address.startswith('mailto:'):
+        email_address = email_address[len('mailto:'):]
+    if not re.match(r'^[^@\s]+@[^@\s]+$', email_address):
+        return ''
+    local, at, domain = email_address.partition('@')
+    local = local.split('+', 1)[0]
+    return '{}@{}'.format(local, domain) if local else ''
+
+
+def normalize_phone(phone_number):
+    default_country_code = getattr(settings, 'DUPLICATE_DEFAULT_COUNTRY_CODE', '1')
+    phone_number = (phone_number or '').strip()
+    phone_number = re.split(r'(?i)\s*(?:x|ext\.?|extension|#)\s*\d+$', phone_number)[0]
+    digits = re.sub(r'\D', '', phone_number)
+    if phone_number.startswith('+'):
+        pass
+    elif phone_number.startswith('00'):
+        digits = digits[2:]
+    elif default_country_code == '1' and len(digits) == 11 and digits.startswith('1'):
+        pass
+    else:
+        digits = default_country_code + digits.lstrip('0')
+    if not 8 <= len(digits) <= 15:
+        return ''
+    return '+' + digits
+
+
+def normalize_handle(handle):
+    handle = (handle or '').strip().lower()
+    handle = re.sub(r'^(?:https?://)?(?:www\.|mobile\.)?(?:twitter|x)\.com/', '', handle)
+    handle = re.sub(r'^(?:live|skype):', '', handle)
+    return handle.lstrip('@').strip('/').split('/')[0].split('?')[0]
+
+
+def normalize_url(url):
+    url = (url or '').strip().lower()
+    if not url:
+        return ''
+    if '://' not in url:
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ''
+    host = parts.hostname or ''
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    if '.' not in host:
+        return ''
+    return host + parts.path.rstrip('/')
+
+
+def identifiers(row):
+    values = {
+        ('email', normalize_email(row['email_address'])),
+        ('phone', normalize_phone(row['phone_number_primary'])),
+        ('phone', normalize_phone(row['phone_number_secondary'])),
+        ('twitter', normalize_handle(row['twitter'])),
+        ('skype', normalize_handle(row['skype'])),
+        ('linkedin', normalize_url(row['linkedin'])),
+        ('website', normalize_url(row['website'])),
+    }
+    return {(kind, value) for kind, value in values if value}
+
+
+def backfill_contact_identifiers(apps, schema_editor):
+    Person = apps.get_model('sources', 'Person')
+    ContactIdentifier = apps.get_model('sources', 'ContactIdentifier')
+    person_ids = list(Person.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(person_ids), IDENTIFIER_BATCH_SIZE):
+        rows = Person.objects.filter(pk__in=person_ids[start:start + IDENTIFIER_BATCH_SIZE]).values(*IDENTIFIER_COLUMNS)
+        ContactIdentifier.objects.bulk_create([
+            ContactIdentifier(person_id=row['pk'], kind=kind, value=value[:255])
+            for row in rows
+            for kind, value in sorted(identifiers(row))
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0034_add_normalized_lookup_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactIdentifier',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('email', 'Email address'), ('phone', 'Phone number'), ('twitter', 'Twitter'), ('skype', 'Skype'), ('linkedin', 'LinkedIn'), ('website', 'Website')], max_length=15)),
+                ('value', models.CharField(max_length=255)),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contact_identifiers', to='sources.Person')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contactidentifier',
+            index=models.Index(fields=['value'], name='contact_identifier_value_idx'),
+        ),
+        migrations.RunPython(backfill_contact_identifiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:35
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+# frozen copy of sources.summaries as of this migration, so later changes to
+# it don't change what migrating an old database does; `manage.py
+# rebuild_summaries` rebuilds the rows with the current code
+SUMMARY_BATCH_SIZE = 2000
+SUMMARY_M2M_FIELDS = {
+    'expertise': 'expertise_names',
+    'industries': 'industry_names',
+    'organization': 'organization_names',
+    'exportable_by': 'dive_names',
+}
+
+
+def _m2m_names(Person, field_name, person_ids):
+    field = Person._meta.get_field(field_name)
+    source_name = field.m2m_field_name()
+    target_name = field.m2m_reverse_field_name()
+    names = defaultdict(list)
+    rows = (
+        field.remote_field.through.objects.filter(**{f'{source_name}_id__in': person_ids})
+        .order_by(f'{target_name}__name')
+        .values_list(f'{source_name}_id', f'{target_name}__name')
+    )
+    for person_id, name in rows:
+        names[person_id].append(name)
+    return {person_id: ', '.join(values) for person_id, values in names.items()}
+
+
+def backfill_person_summaries(apps, schema_editor):
+    Person = apps.get_model('sources', 'Person')
+    Interaction = apps.get_model('sources', 'Interaction')
+    PersonSummary = apps.get_model('sources', 'PersonSummary')
+    person_ids = list(Person.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(person_ids), SUMMARY_BATCH_SIZE):
+        batch = person_ids[start:start + SUMMARY_BATCH_SIZE]
+        rows = {}
+        people = Person.objects.filter(pk__in=batch).order_by().values_list(
+            'pk', 'created_by__first_name', 'created_by__last_name', 'created_by__username'
+        )
+        for pk, first_name, last_name, username in people:
+            rows[pk] = dict(
+                {column: '' for column in SUMMARY_M2M_FIELDS.values()},
+                created_by_name='{} {}'.format(first_name or '', last_name or '').strip() or username or '',
+            )
+        for field_name, column in SUMMARY_M2M_FIELDS.items():
+            for person_id, names in _m2m_names(Person, field_name, batch).items():
+                rows[person_id][column] = names
+        totals = (
+            Interaction.objects.filter(interviewee_id__in=batch).order_by()
+            .values_list('interviewee_id').annotate(count=Count('pk'), last=Max('date_time'))
+        )
+        for person_id, count, last in totals:
+            rows[person_id].update(interaction_count=count, last_interaction_at=last)
+        PersonSummary.objects.bulk_create([
+            PersonSummary(person_id=person_id, **values) for person_id, values in rows.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0035_add_contact_identifier_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonSummary',
+            fields=[
+                ('person', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='sources.Person')),
+                ('expertise_names', models.TextField(blank=True, verbose_name='Expertise')),
+                ('industry_names', models.TextField(blank=True, verbose_name='Industries')),
+                ('organization_names', models.TextField(blank=True, verbose_name='Organization')),
+                ('dive_names', models.TextField(blank=True, verbose_name='Exportable by')),
+                ('created_by_name', models.CharField(blank=True, max_length=255, verbose_name='Created By')),
+                ('interaction_count', models.PositiveIntegerField(default=0, verbose_name='Interactions')),
+                ('last_interaction_at', models.DateTimeField(blank=True, null=True, verbose_name='Last interaction')),
+            ],
+            options={
+                'verbose_name_plural': 'Person summaries',
+            },
+        ),
+        migrations.RunPython(backfill_person_summaries, migrations.RunPython.noop),
+    ]
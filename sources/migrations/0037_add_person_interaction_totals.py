@@ -0,0 +1,65 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:38
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# frozen copy of sources.summaries.update_interaction_totals as of this
+# migration, so later changes to it don't change what migrating an old
+# database does
+TOTALS_BATCH_SIZE = 5000
+
+
+def backfill_interaction_totals(apps, schema_editor):
+    Person = apps.get_model('sources', 'Person')
+    Interaction = apps.get_model('sources', 'Interaction')
+    interactions = Interaction.objects.filter(interviewee=OuterRef('pk')).order_by().values('interviewee')
+    totals = {
+        'interaction_count': Coalesce(
+            Subquery(interactions.annotate(count=Count('pk')).values('count'), output_field=IntegerField()),
+            Value(0),
+        ),
+        'last_interaction_at': Subquery(interactions.annotate(last=Max('date_time')).values('last')),
+    }
+    person_ids = list(Person.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(person_ids), TOTALS_BATCH_SIZE):
+        Person.objects.filter(pk__in=person_ids[start:start + TOTALS_BATCH_SIZE]).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0036_add_person_summary_model'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='personsummary',
+            name='interaction_count',
+        ),
+        migrations.RemoveField(
+            model_name='personsummary',
+            name='last_interaction_at',
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='interaction_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Interactions'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='last_interaction_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last contacted'),
+        ),
+        # before the indexes, which are cheaper to build than to keep updated
+        migrations.RunPython(backfill_interaction_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['-last_interaction_at'], name='person_last_interaction_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['-interaction_count'], name='person_interaction_count_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:45
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+from django.utils import timezone
+
+
+# frozen copy of sources.analytics.update_rollup as of this migration, so
+# later changes to it don't change what migrating an old database does;
+# `manage.py rebuild_rollup` rebuilds the rows with the current code
+ROLLUP_BATCH_SIZE = 5000
+
+
+def backfill_interaction_rollup(apps, schema_editor):
+    Interaction = apps.get_model('sources', 'Interaction')
+    InteractionRollup = apps.get_model('sources', 'InteractionRollup')
+    counts = Counter()
+    # days in settings.TIME_ZONE; TruncDate uses the current time zone
+    with timezone.override(timezone.get_default_timezone()):
+        per_interviewer = (
+            Interaction.objects.filter(interviewer__isnull=False).order_by()
+            .values_list('interviewer', 'interaction_type', TruncDate('date_time'))
+            .annotate(count=Count('pk'))
+        )
+        for user_id, interaction_type, day, count in per_interviewer:
+            counts[user_id, interaction_type, day] = count
+        per_day = (
+            Interaction.objects.order_by()
+            .values_list('interaction_type', TruncDate('date_time'))
+            .annotate(count=Count('pk'))
+        )
+        for interaction_type, day, count in per_day:
+            counts[None, interaction_type, day] = count
+    InteractionRollup.objects.bulk_create([
+        InteractionRollup(user_id=user_id, interaction_type=interaction_type, day=day, count=count)
+        for (user_id, interaction_type, day), count in counts.items()
+    ], batch_size=ROLLUP_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sources', '0037_add_person_interaction_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction_type', models.CharField(blank=True, max_length=255)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='interaction_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='interactionrollup',
+            index=models.Index(fields=['day'], name='interaction_rollup_day_idx'),
+        ),
+        migrations.RunPython(backfill_interaction_rollup, migrations.RunPython.noop),
+    ]
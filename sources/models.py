@@ -1,15 +1,21 @@
 from __future__ import unicode_literals
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 from sources.choices import (
     COUNTRY_CHOICES,
     ENTRY_CHOICES,
     PRIVACY_CHOICES,
-    PREFIX_CHOICES
+    PREFIX_CHOICES,
+    TIMEZONE_CHOICES,
 )
+from sources.names import clean_name, normalize_name
 
 
 class BasicInfo(models.Model):
@@ -30,7 +36,36 @@ class Dive(BasicInfo):
         return '{}'.format(self.name)
 
 
-class Expertise(BasicInfo):
+def canonical_name(model, name):
+    """ The normalized_name of a Expertise/Industry/Organization name, after aliases """
+    key = normalize_name(name, model._meta.model_name)
+    alias = LookupAlias.objects.filter(kind=model._meta.model_name, alias=key).values_list('normalized_name', flat=True).first()
+    return alias or key
+
+
+class NormalizedNameMixin(models.Model):
+    """ Keeps normalized_name in sync with name, see sources/names.py """
+    normalized_name = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+
+    def clean(self):
+        super().clean()
+        if not self.name:
+            return
+        self.name = clean_name(self.name)
+        same = type(self).objects.filter(normalized_name=canonical_name(type(self), self.name)).exclude(pk=self.pk).first()
+        if same is not None:
+            raise ValidationError({'name': 'This is the same as "{}".'.format(same.name)})
+
+    def save(self, *args, **kwargs):
+        self.name = clean_name(self.name) or self.name
+        self.normalized_name = canonical_name(type(self), self.name)
+        return super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class Expertise(NormalizedNameMixin, BasicInfo):
     name = models.CharField(max_length=255, null=True, blank=False, unique=True, verbose_name='Type of expertise')
 
     class Meta:
@@ -40,7 +75,7 @@ class Expertise(BasicInfo):
         return '{}'.format(self.name)
 
 
-class Industry(BasicInfo):
+class Industry(NormalizedNameMixin, BasicInfo):
     name = models.CharField(max_length=255, null=True, blank=False, unique=True, verbose_name='Industry name')
 
     class Meta:
@@ -50,7 +85,7 @@ class Industry(BasicInfo):
         return '{}'.format(self.name)
 
 
-class Organization(BasicInfo):
+class Organization(NormalizedNameMixin, BasicInfo):
     name = models.CharField(max_length=255, null=True, blank=False, unique=True, verbose_name='Organization name')
     # location = models.ForeignKey(Location, null=True, blank=True)
     # website = models.URLField(max_length=200, null=True, blank=True)
@@ -59,6 +94,31 @@ class Organization(BasicInfo):
         return '{}'.format(self.name)
 
 
+class LookupAlias(BasicInfo):
+    """
+    Maps the normalized name of an Expertise/Industry/Organization to the
+    normalized name of the row it's the same as, e.g. "international business
+    machines" -> "ibm". Merging rows adds these, see sources/lookups.py.
+    """
+    KIND_CHOICES = (
+        ('expertise', 'Expertise'),
+        ('industry', 'Industry'),
+        ('organization', 'Organization'),
+    )
+    kind = models.CharField(max_length=15, choices=KIND_CHOICES)
+    alias = models.CharField(max_length=255, help_text='Normalized name that should be treated as the other one.')
+    normalized_name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.alias, self.normalized_name)
+
+    class Meta:
+        verbose_name_plural = 'Lookup aliases'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'alias'], name='lookup_alias_kind_alias_unique'),
+        ]
+
+
 class PrivacyMixin(models.Model):
     privacy_level = models.CharField(choices=PRIVACY_CHOICES, max_length=255, blank=False, help_text='Who has access to view? Searchable (semi-private) means the general information is available, but not certain details.')
 
@@ -66,18 +126,46 @@ class PrivacyMixin(models.Model):
         abstract = True
 
 
+class PrivacyQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """
+        Only show private items to the person who created them. Shared by the
+        admin querysets and anything else that lists sources or interactions.
+        """
+        # if the item is not private, then include it
+        # if the item is private and created by that user, then include it
+        return self.filter(
+            # IMPORANT! don't give superusers access to everything
+            ~Q(privacy_level__contains='private') | \
+            Q(created_by=user, privacy_level='private_individual')
+        )
+
+
+class PersonQuerySet(PrivacyQuerySet):
+
+    def contact_visible_to(self, user):
+        """
+        Only sources whose contact details (email address, phone numbers)
+        the user may see: their own and public ones, as
+        PersonAdmin._determine_whether_to_hide_contact_data. A subset of
+        visible_to(user); superusers get no exception either.
+        """
+        return self.filter(Q(created_by=user) | ~Q(privacy_level__in=['searchable', 'private_individual']))
+
+    def with_email(self, email_address):
+        """
+        Case-insensitive match on email address. Compares against
+        lower(email_address) so the functional index added in migration 0028
+        can be used instead of scanning the table.
+        """
+        return self.annotate(
+            email_address_lower=Lower('email_address')
+        ).filter(email_address_lower=email_address.lower())
+
+
 class Person(BasicInfo, PrivacyMixin):
     """ Representation of a Sources in the system """
-    def timezone_choices():
-        import pytz
-        pytz_all = pytz.all_timezones
-        tz_list = []
-        for tz in pytz_all:
-            item = tz, tz
-            tz_list.append(item)
-        timezones = tuple(tz_list)
-        return timezones
-
     city = models.CharField(max_length=255, null=True, blank=True, verbose_name='City')
     country = models.CharField(max_length=255, choices=COUNTRY_CHOICES, null=True, blank=True, verbose_name='Country')
     email_address = models.EmailField(max_length=254, null=True, blank=False, verbose_name=('Email address'))
@@ -101,14 +189,20 @@ class Person(BasicInfo, PrivacyMixin):
     skype = models.CharField(max_length=255, null=True, blank=True, verbose_name='Skype username')
     state = models.CharField(max_length=255, null=True, blank=True, verbose_name='State/province')
     title = models.CharField(max_length=255, null=True, blank=True, verbose_name='Job title')
-    timezone = models.CharField(max_length=255, choices=timezone_choices(), blank=True, null=True, verbose_name='Time zone')
+    timezone = models.CharField(max_length=255, choices=TIMEZONE_CHOICES, blank=True, null=True, verbose_name='Time zone')
     twitter = models.CharField(null=True, blank=True, max_length=140, help_text='Please do not include the @ symbol.', verbose_name='Twitter')
     type_of_expert = models.CharField(max_length=255, null=True, blank=True, help_text='If applicable (e.g. economist, engineer, researcher, etc.)', verbose_name='Type of expert')
     website = models.URLField(max_length=255, null=True, blank=True, help_text='Please include http:// at the beginning.', verbose_name='Website')
     created_by = models.ForeignKey(User, null=True, blank=True, related_name='created_by_person', on_delete=models.SET_NULL)
     # TODO: remove this bc it's a vestige of other project
     related_user = models.ForeignKey(User, null=True, blank=True, related_name='related_user_person', on_delete=models.SET_NULL)
+    # maintained by sources.search.update_search_vectors; see sources/signals.py
+    search_vector = SearchVectorField(null=True, editable=False)
+    # maintained by sources.summaries.update_interaction_totals; see sources/signals.py
+    interaction_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Interactions')
+    last_interaction_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Last contacted')
 
+    objects = PersonQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         if self.twitter:
@@ -127,6 +221,18 @@ class Person(BasicInfo, PrivacyMixin):
     class Meta:
         ordering = ['-updated']
         verbose_name = ('Source')
+        indexes = [
+            # changelist ordering, with and without the privacy filter
+            models.Index(fields=['-updated'], name='person_updated_idx'),
+            models.Index(fields=['privacy_level', '-updated'], name='person_privacy_updated_idx'),
+            models.Index(fields=['created_by', '-updated'], name='person_created_by_updated_idx'),
+            # changelist sorting/filtering by last contacted and number of interactions
+            models.Index(fields=['-last_interaction_at'], name='person_last_interaction_idx'),
+            models.Index(fields=['-interaction_count'], name='person_interaction_count_idx'),
+            # NOTE: the lower(email_address) index used by the import lookups
+            # is created with raw SQL in migration 0028, and the GIN index on
+            # search_vector in migration 0029 (Postgres only)
+        ]
 
 
 class Interaction(BasicInfo, PrivacyMixin):
@@ -142,6 +248,8 @@ class Interaction(BasicInfo, PrivacyMixin):
     interviewee = models.ForeignKey(Person, null=True, related_name='interviewee', verbose_name='Interviewee', on_delete=models.SET_NULL)
     interviewer = models.ManyToManyField(User, related_name='interviewer', verbose_name='Interviewer(s)')
     notes = models.TextField(blank=True, help_text='Add any notes about interaction that may be helpful to you or others in the future.')
+
+    objects = PrivacyQuerySet.as_manager()
     # timezone with datetime ??? see newspost code
 
     # @property
@@ -162,3 +270,127 @@ class Interaction(BasicInfo, PrivacyMixin):
         ordering = ['-date_time']
         verbose_name = ('Interaction')
         verbose_name_plural = ('Interactions')
+        indexes = [
+            models.Index(fields=['-date_time'], name='interaction_date_time_idx'),
+            models.Index(fields=['interviewee', '-date_time'], name='interaction_interviewee_dt_idx'),
+            models.Index(fields=['privacy_level', '-date_time'], name='interaction_privacy_dt_idx'),
+            models.Index(fields=['created_by', '-date_time'], name='interaction_created_by_dt_idx'),
+        ]
+
+
+class InteractionRollup(models.Model):
+    """ Number of interactions per interviewer (all of them when null), type and day; see sources/analytics.py """
+    user = models.ForeignKey(User, null=True, related_name='interaction_rollups', on_delete=models.CASCADE)
+    interaction_type = models.CharField(max_length=255, blank=True)
+    day = models.DateField()
+    count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return '{} {} {}: {}'.format(self.day, self.user_id or 'all', self.interaction_type, self.count)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day'], name='interaction_rollup_day_idx'),
+        ]
+
+
+class ContactIdentifier(models.Model):
+    """ A source's normalized email/phone/handle/URL, for reverse lookups; see sources/identifiers.py """
+    KIND_CHOICES = (
+        ('email', 'Email address'),
+        ('phone', 'Phone number'),
+        ('twitter', 'Twitter'),
+        ('skype', 'Skype'),
+        ('linkedin', 'LinkedIn'),
+        ('website', 'Website'),
+    )
+    person = models.ForeignKey(Person, related_name='contact_identifiers', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=15, choices=KIND_CHOICES)
+    value = models.CharField(max_length=255)
+
+    def __str__(self):
+        return '{}: {}'.format(self.kind, self.value)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['value'], name='contact_identifier_value_idx'),
+        ]
+
+
+class PersonSummary(models.Model):
+    """ A source's M2M names and creator, pre-joined; see sources/summaries.py """
+    person = models.OneToOneField(Person, primary_key=True, related_name='summary', on_delete=models.CASCADE)
+    expertise_names = models.TextField(blank=True, verbose_name='Expertise')
+    industry_names = models.TextField(blank=True, verbose_name='Industries')
+    organization_names = models.TextField(blank=True, verbose_name='Organization')
+    dive_names = models.TextField(blank=True, verbose_name='Exportable by')
+    created_by_name = models.CharField(max_length=255, blank=True, verbose_name='Created By')
+
+    def __str__(self):
+        return str(self.person_id)
+
+    class Meta:
+        verbose_name_plural = 'Person summaries'
+
+
+class DuplicateCandidate(BasicInfo):
+    """ Two sources that are probably the same person, see sources/duplicates.py """
+    STATUS_CHOICES = (
+        ('pending', 'Pending review'),
+        ('dismissed', 'Not duplicates'),
+    )
+    # person_a has the lower id
+    person_a = models.ForeignKey(Person, related_name='duplicate_candidates_a', on_delete=models.CASCADE)
+    person_b = models.ForeignKey(Person, related_name='duplicate_candidates_b', on_delete=models.CASCADE)
+    score = models.FloatField(help_text='How alike the two sources are, from 0 to 1.')
+    matching_fields = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='pending')
+    reviewed_by = models.ForeignKey(User, null=True, blank=True, related_name='reviewed_duplicate_candidates', on_delete=models.SET_NULL)
+
+    def __str__(self):
+        return '{} / {}'.format(self.person_a, self.person_b)
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['person_a', 'person_b'], name='duplicate_candidate_pair_unique'),
+        ]
+        indexes = [
+            # the review queue
+            models.Index(fields=['status', '-score'], name='duplicate_status_score_idx'),
+        ]
+
+
+class SourceMerge(models.Model):
+    """ Audit record of sources merged into another, see sources/merge.py """
+    created = models.DateTimeField(auto_now_add=True)
+    survivor = models.ForeignKey(Person, null=True, related_name='merges', on_delete=models.SET_NULL)
+    # kept in case the survivor is deleted later
+    survivor_name = models.CharField(max_length=255, blank=True)
+    merged_by = models.ForeignKey(User, null=True, related_name='source_merges', on_delete=models.SET_NULL)
+    merged_ids = models.TextField(help_text='Ids of the sources merged into the survivor (and deleted).')
+    details = models.TextField(help_text='JSON: the merged sources\' values and memberships, the fields copied to the survivor and the interactions moved.')
+
+    def __str__(self):
+        return '{} merged into {}'.format(self.merged_ids, self.survivor_name)
+
+    class Meta:
+        ordering = ['-created']
+
+
+class SlowQuery(models.Model):
+    """ A statement that ran slower than SLOW_QUERY_THRESHOLD_MS, see sources/slow_queries.py """
+    created = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(max_length=32, db_index=True)
+    statement = models.TextField(help_text='The statement with literals and parameters normalized away.')
+    duration_ms = models.FloatField()
+    call_site = models.TextField(blank=True)
+    plan = models.TextField(blank=True, help_text='EXPLAIN (ANALYZE, BUFFERS) output (Postgres only).')
+    database = models.CharField(max_length=255, default='default')
+
+    def __str__(self):
+        return '{} ({:.0f} ms)'.format(self.fingerprint, self.duration_ms)
+
+    class Meta:
+        ordering = ['-pk']
+        verbose_name_plural = 'Slow queries'
@@ -0,0 +1,40 @@
+"""
+Normalized names of Expertise, Industry and Organization rows.
+
+Their names are unique only as exact strings, so imports end up with "Acme",
+"ACME Inc." and "Acme, Inc" side by side. normalize_name() maps those to one
+key ("acme"): accents and case are folded, punctuation becomes space, "&"
+becomes "and" and, for organizations, a leading "the" and legal suffixes
+like Inc. or LLC are dropped. Keys that normalization can't catch ("IBM" and
+"International Business Machines") are mapped by the LookupAlias table; see
+canonical_name() in sources/models.py and sources/lookups.py.
+"""
+import re
+import unicodedata
+
+
+# dropped from the end of organization names, also repeatedly ("Acme Co. Ltd.")
+ORGANIZATION_SUFFIXES = {
+    'ag', 'co', 'company', 'corp', 'corporation', 'gmbh', 'inc', 'incorporated',
+    'limited', 'llc', 'llp', 'lp', 'ltd', 'plc', 'sa',
+}
+
+
+def clean_name(name):
+    """ The name as it should be stored: trimmed, with single spaces """
+    return re.sub(r'\s+', ' ', name or '').strip()
+
+
+def normalize_name(name, model_name=None):
+    """ The comparison key of a name; model_name is e.g. 'organization' """
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(character for character in name if not unicodedata.combining(character)).casefold()
+    name = name.replace('&', ' and ')
+    words = re.findall(r'[^\W_]+', name.replace("'", ''))
+    if model_name == 'organization':
+        if len(words) > 1 and words[0] == 'the':
+            words = words[1:]
+        # legal suffixes, but "Smith & Co" shouldn't become "smith and"
+        while len(words) > 1 and words[-1] in ORGANIZATION_SUFFIXES and words[-2] != 'and':
+            words = words[:-1]
+    return ' '.join(words)
@@ -0,0 +1,225 @@
+"""
+Changelist pagination for the large Source and Interaction tables.
+
+Django's default changelist issues a COUNT(*) over the privacy-filtered
+queryset and pages with OFFSET, both of which get slower as the tables grow.
+Here the count is exact only when the planner thinks it is cheap, and paging
+forward/backward seeks on the model's default ordering (e.g. -updated, -pk)
+instead of skipping rows.
+"""
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from sources.plans import explain_queryset
+
+
+CURSOR_VAR = 'cursor'
+# below this many (estimated) rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """
+    Return the planner's row estimate for a queryset, or None when no
+    estimate is available (i.e. not running on Postgres).
+
+    Unfiltered querysets use pg_class.reltuples; filtered ones use the row
+    estimate from EXPLAIN.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 (PG14+) or 0 for tables that were never analyzed
+        if row and row[0] > 0:
+            return row[0]
+
+    try:
+        plan = explain_queryset(queryset.order_by())
+    except EmptyResultSet:
+        # e.g. queryset.none(), which never hits the database
+        return 0
+    return int(plan['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that only runs COUNT(*) when the estimated row count is below
+    EXACT_COUNT_THRESHOLD and otherwise reports the planner estimate.
+    """
+    count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate <= EXACT_COUNT_THRESHOLD:
+            return self.object_list.count()
+        self.count_is_estimated = True
+        return estimate
+
+    def validate_number(self, number):
+        """ An estimated count can be too low, so don't reject pages past it """
+        if self.count and self.count_is_estimated:
+            try:
+                number = int(number)
+            except (TypeError, ValueError):
+                raise PageNotAnInteger('That page number is not an integer')
+            if number < 1:
+                raise EmptyPage('That page number is less than 1')
+            return number
+        return super().validate_number(number)
+
+    def page(self, number):
+        if not (self.count and self.count_is_estimated):
+            return super().page(number)
+        # don't clamp the slice to the estimate like Paginator.page() does
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+def encode_cursor(direction, value, pk):
+    """ Cursor tokens look like 'n2020-05-27T20:59:00+00:00|123' (n=next, p=previous) """
+    return '{}{}|{}'.format(direction, value.isoformat() if value else '', pk)
+
+
+def decode_cursor(token):
+    try:
+        direction, rest = token[0], token[1:]
+        value, pk = rest.rsplit('|', 1)
+        value = parse_datetime(value) if value else None
+        pk = int(pk)
+    except (IndexError, ValueError):
+        raise IncorrectLookupParameters
+    if direction not in ('n', 'p'):
+        raise IncorrectLookupParameters
+    return direction, value, pk
+
+
+def seek(field, direction, value, pk):
+    """
+    Filter for the rows after (direction 'n') or before ('p') the cursor
+    row in "field DESC NULLS FIRST, pk DESC" order. The extra lte/gte
+    condition gives Postgres an index range to start from.
+    """
+    if direction == 'n':
+        if value is None:
+            return Q(**{f'{field}__isnull': False}) | Q(**{f'{field}__isnull': True, 'pk__lt': pk})
+        return Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(pk__lt=pk))
+    if value is None:
+        return Q(**{f'{field}__isnull': True, 'pk__gt': pk})
+    return (
+        Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(pk__gt=pk))
+    ) | Q(**{f'{field}__isnull': True})
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList that pages with a keyset "seek" on the model's default
+    descending ordering field when the user hasn't sorted by another column.
+    The usual ?p= OFFSET pagination still works and is used otherwise.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        super().__init__(request, *args, **kwargs)
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @cached_property
+    def keyset_field(self):
+        """ e.g. 'updated' for a model ordered by ['-updated'] """
+        ordering = self.lookup_opts.ordering
+        if len(ordering) == 1 and ordering[0].startswith('-'):
+            return ordering[0][1:]
+        return None
+
+    @property
+    def keyset_enabled(self):
+        return bool(self.keyset_field) and ORDER_VAR not in self.params and not self.query
+
+    def get_ordering(self, request, queryset):
+        """ Order full-text search results by rank unless the user sorted by a column """
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
+    def _seek(self, direction, value, pk):
+        return seek(self.keyset_field, direction, value, pk)
+
+    def _cursor_url(self, direction, obj, page_num):
+        token = encode_cursor(direction, getattr(obj, self.keyset_field), obj.pk)
+        return self.get_query_string({CURSOR_VAR: token, PAGE_VAR: page_num})
+
+    def get_results(self, request):
+        if self.keyset_enabled and self.cursor:
+            self._get_keyset_results(request)
+        else:
+            super().get_results(request)
+            self.has_previous = self.page_num > 0
+            self.has_next = self.page_num + 1 < self.paginator.num_pages
+
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR])
+        self.previous_page_url = None
+        self.next_page_url = None
+        if not self.keyset_enabled or not self.multi_page or (self.show_all and self.can_show_all):
+            return
+
+        # build the cursor links from the first/last rows on this page
+        rows = list(self.result_list)
+        if not rows:
+            return
+        if self.has_previous:
+            if self.page_num <= 1:
+                self.previous_page_url = self.first_page_url
+            else:
+                self.previous_page_url = self._cursor_url('p', rows[0], self.page_num - 1)
+        if self.has_next:
+            self.next_page_url = self._cursor_url('n', rows[-1], self.page_num + 1)
+
+    def _get_keyset_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        direction, value, pk = decode_cursor(self.cursor)
+
+        queryset = self.queryset.filter(self._seek(direction, value, pk))
+        if direction == 'p':
+            queryset = queryset.reverse()
+        # fetch one extra row to know whether there is another page
+        rows = list(queryset[:self.list_per_page + 1])
+        has_more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if direction == 'p':
+            rows.reverse()
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_previous = True
+            self.has_next = has_more
+
+        # NOTE: result_list is a list rather than a queryset, so these
+        # changelists can't use list_editable
+        self.result_count = paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = self.result_count <= self.list_max_show_all
+        self.multi_page = True
+        self.paginator = paginator
@@ -0,0 +1,117 @@
+"""
+Rolling per-view request timings, recorded by PerformanceMiddleware (see
+sources/middleware.py) and reported by `manage.py perf_stats`.
+
+Each process keeps the last PERF_WINDOW_SIZE requests per view in memory and
+writes that window to the default cache at most every PERF_FLUSH_INTERVAL
+seconds, so recording a request never waits on the cache. The command merges
+the windows of every live process, which needs a cache shared between
+processes (e.g. the file cache in settings_production); with the default
+per-process locmem cache only the command's own process is visible.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+PERF_WINDOW_SIZE = getattr(settings, 'PERF_WINDOW_SIZE', 1000)
+# seconds
+PERF_FLUSH_INTERVAL = getattr(settings, 'PERF_FLUSH_INTERVAL', 10)
+# windows of processes that stop flushing expire after this long
+PERF_WINDOW_TIMEOUT = 60 * 60
+
+PROCESSES_KEY = 'sources:perf:processes'
+
+logger = logging.getLogger('sources.performance')
+
+
+def percentile(sorted_values, percent):
+    """ Nearest-rank percentile of an already sorted list """
+    if not sorted_values:
+        return None
+    rank = max(int(round(percent / 100 * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ViewTimings(object):
+    """ This process's rolling window of request samples, per view """
+
+    def __init__(self, window_size=PERF_WINDOW_SIZE, flush_interval=PERF_FLUSH_INTERVAL):
+        self.window_size = window_size
+        self.flush_interval = flush_interval
+        self.samples = defaultdict(lambda: deque(maxlen=self.window_size))
+        self.process_key = 'sources:perf:{}:{}'.format(socket.gethostname(), os.getpid())
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, view_name, total_ms, db_ms, queries, template_ms):
+        """ Add a request's sample; publishes the window when a flush is due """
+        with self._lock:
+            self.samples[view_name].append((total_ms, db_ms, queries, template_ms))
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._last_flush = time.monotonic()
+                snapshot = {view: list(samples) for view, samples in self.samples.items()}
+        if due:
+            try:
+                self.flush(snapshot)
+            except Exception:
+                # never fail a request over its timings
+                logger.exception('Could not publish request timings')
+
+    def flush(self, snapshot=None):
+        """ Publish this process's window to the cache """
+        if snapshot is None:
+            with self._lock:
+                snapshot = {view: list(samples) for view, samples in self.samples.items()}
+        cache.set(self.process_key, snapshot, PERF_WINDOW_TIMEOUT)
+        processes = cache.get(PROCESSES_KEY) or set()
+        if self.process_key not in processes:
+            processes.add(self.process_key)
+            cache.set(PROCESSES_KEY, processes, None)
+
+
+view_timings = ViewTimings()
+
+
+def collect_samples():
+    """ {view name: [samples]} merged from every process that has flushed recently """
+    merged = defaultdict(list)
+    processes = cache.get(PROCESSES_KEY) or set()
+    live = set()
+    for process_key, snapshot in cache.get_many(list(processes)).items():
+        live.add(process_key)
+        for view, samples in snapshot.items():
+            merged[view].extend(samples)
+    if live != processes:
+        cache.set(PROCESSES_KEY, live, None)
+    return merged
+
+
+def summarize(samples):
+    """ Count, total time percentiles and mean DB time/queries/template time for a view """
+    totals = sorted(sample[0] for sample in samples)
+    count = len(samples)
+    return {
+        'count': count,
+        'p50_ms': percentile(totals, 50),
+        'p90_ms': percentile(totals, 90),
+        'p99_ms': percentile(totals, 99),
+        'max_ms': totals[-1],
+        'db_ms': sum(sample[1] for sample in samples) / count,
+        'queries': sum(sample[2] for sample in samples) / count,
+        'template_ms': sum(sample[3] for sample in samples) / count,
+    }
+
+
+def reset():
+    """ Forget every process's window """
+    cache.delete_many(list(cache.get(PROCESSES_KEY) or set()) + [PROCESSES_KEY])
+    with view_timings._lock:
+        view_timings.samples.clear()
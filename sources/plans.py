@@ -0,0 +1,86 @@
+"""
+Helpers for capturing Postgres query plans from ORM querysets.
+"""
+from django.db import connections
+
+
+def explain_queryset(queryset, analyze=False, buffers=False):
+    """
+    Run EXPLAIN (FORMAT JSON) for a queryset and return the top-level plan
+    dict (the object holding 'Plan', 'Execution Time', etc.).
+
+    QuerySet.explain() stringifies the JSON rows on Django 3.0, so this builds
+    the statement from the compiled SQL and runs it directly instead.
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    options = ['FORMAT JSON']
+    if analyze:
+        options.append('ANALYZE')
+    if buffers:
+        options.append('BUFFERS')
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ({}) {}'.format(', '.join(options), sql), params)
+        result = cursor.fetchone()[0]
+    return result[0]
+
+
+def plan_nodes(plan):
+    """
+    Flatten a plan tree into a list of (node type, relation name, index name)
+    tuples, in depth-first order.
+    """
+    nodes = []
+
+    def walk(node):
+        nodes.append((node.get('Node Type'), node.get('Relation Name'), node.get('Index Name')))
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan['Plan'])
+    return nodes
+
+
+def describe_plan(plan):
+    """ One-line summary of a plan, e.g. 'Limit > Index Scan (person_updated_idx)' """
+    parts = []
+    for node_type, relation, index in plan_nodes(plan):
+        if index:
+            parts.append(f'{node_type} ({index})')
+        elif relation:
+            parts.append(f'{node_type} ({relation})')
+        else:
+            parts.append(node_type)
+    return ' > '.join(parts)
+
+
+def plan_summary(plan):
+    """
+    The parts of a plan that check_query_plans compares against its
+    baseline: the shape, the estimated total cost and how each table is read.
+    """
+    scans = {}
+    for node_type, relation, index in plan_nodes(plan):
+        if relation:
+            scans.setdefault(relation, []).append(node_type)
+    return {
+        'shape': describe_plan(plan),
+        'cost': plan['Plan']['Total Cost'],
+        'scans': scans,
+    }
+
+
+def plan_regressions(baseline, current, cost_threshold, cost_floor=0):
+    """
+    Ways a plan summary got worse than its baseline: a table that was read
+    through an index is now sequentially scanned, or the estimated cost grew
+    by more than cost_threshold (0.5 = 50%) and by at least cost_floor.
+    """
+    problems = []
+    for relation, node_types in current['scans'].items():
+        if 'Seq Scan' in node_types and 'Seq Scan' not in baseline['scans'].get(relation, ['Seq Scan']):
+            problems.append(f'{relation} is now read with a sequential scan')
+    growth = current['cost'] - baseline['cost']
+    if growth > baseline['cost'] * cost_threshold and growth >= cost_floor:
+        problems.append('estimated cost grew from {:.0f} to {:.0f}'.format(baseline['cost'], current['cost']))
+    return problems
@@ -0,0 +1,232 @@
+"""
+Opt-in profiling of single requests, for "this page is slow for me" reports
+that depend on an editor's own data and privacy level.
+
+ProfilingMiddleware (sources/middleware.py) profiles a request made by a
+staff user when it carries either
+
+    - the PROFILE_HEADER header (X-Sources-Profile: 1), or
+    - the PROFILE_PARAM query parameter holding a token from
+      profile_token(user); tokens are signed for one user and expire after
+      PROFILE_TOKEN_MAX_AGE, so a link can be handed to an editor
+
+The request then runs under cProfile, a stack sampler (for collapsed stacks,
+i.e. flame graph input) and tracemalloc, with every SQL statement timed.
+The result is written as JSON into a ring buffer of the last
+PROFILE_BUFFER_SIZE profiles in PROFILE_DIR, which superusers can browse at
+/sources/profiles/.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core import signing
+
+
+PROFILE_HEADER = 'HTTP_X_SOURCES_PROFILE'
+PROFILE_PARAM = '_profile'
+PROFILE_TOKEN_SALT = 'sources.profiling'
+# seconds
+PROFILE_TOKEN_MAX_AGE = 60 * 60 * 24
+PROFILE_DIR = getattr(settings, 'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'sourcedive_profiles'))
+PROFILE_BUFFER_SIZE = getattr(settings, 'PROFILE_BUFFER_SIZE', 50)
+# seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+TOP_SQL = 25
+
+# one profiled request at a time per process: cProfile and tracemalloc are
+# process-wide and the sampler would see other requests' threads
+profile_lock = threading.Lock()
+
+
+def profile_token(user):
+    """ Signed value for PROFILE_PARAM that enables profiling for this user """
+    return signing.dumps(user.pk, salt=PROFILE_TOKEN_SALT)
+
+
+def profiling_requested(request):
+    """ Whether a (staff) request asked to be profiled """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_active or not user.is_staff:
+        return False
+    if request.META.get(PROFILE_HEADER) == '1':
+        return True
+    token = request.GET.get(PROFILE_PARAM)
+    if not token:
+        return False
+    try:
+        return signing.loads(token, salt=PROFILE_TOKEN_SALT, max_age=PROFILE_TOKEN_MAX_AGE) == user.pk
+    except signing.BadSignature:
+        return False
+
+
+class StackSampler(object):
+    """ Samples one thread's Python stack from a background thread """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """ Brendan Gregg's collapsed stack format, one 'a;b;c count' per line """
+        return '\n'.join('{} {}'.format(stack, count) for stack, count in self.stacks.most_common())
+
+
+class SQLRecorder(object):
+    """ execute_wrapper that totals time per SQL statement (placeholders, not values) """
+
+    def __init__(self):
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            statement = self.statements[sql]
+            statement[0] += 1
+            statement[1] += time.perf_counter() - start
+
+    def top(self, limit=TOP_SQL):
+        rows = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'sql': sql, 'count': count, 'total_ms': round(seconds * 1000, 3)}
+            for sql, (count, seconds) in rows[:limit]
+        ]
+
+
+class RequestProfile(object):
+    """ Context manager that profiles the code run inside it """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident())
+        self.sql = SQLRecorder()
+        self.started_tracemalloc = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        elif hasattr(tracemalloc, 'reset_peak'):
+            # Python 3.9+
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        self.memory_snapshot = tracemalloc.take_snapshot()
+        self.memory_current, self.memory_peak = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    def function_stats(self, limit=TOP_FUNCTIONS):
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def allocations(self, limit=TOP_ALLOCATIONS):
+        snapshot = self.memory_snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        return [
+            {'location': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+
+    def to_dict(self):
+        return {
+            'duration_ms': round(self.duration_ms, 2),
+            'memory_peak_kb': round(self.memory_peak / 1024, 1),
+            'functions': self.function_stats(),
+            'collapsed_stacks': self.sampler.collapsed(),
+            'allocations': self.allocations(),
+            'sql': self.sql.top(),
+        }
+
+
+## ring buffer
+
+def _profile_path(profile_id):
+    # ids are generated by save_profile(); refuse anything else
+    if not profile_id.replace('-', '').isalnum():
+        raise ValueError(profile_id)
+    return os.path.join(PROFILE_DIR, profile_id + '.json')
+
+
+def save_profile(data):
+    """ Write a profile into the ring buffer, dropping the oldest beyond PROFILE_BUFFER_SIZE """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    # ids sort by creation time
+    profile_id = '{}-{}'.format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+    data = dict(data, id=profile_id)
+    temporary_path = _profile_path(profile_id) + '.tmp'
+    with open(temporary_path, 'w') as profile_file:
+        json.dump(data, profile_file)
+    os.replace(temporary_path, _profile_path(profile_id))
+
+    for old_id in list_profile_ids()[PROFILE_BUFFER_SIZE:]:
+        try:
+            os.remove(_profile_path(old_id))
+        except FileNotFoundError:
+            pass
+    return profile_id
+
+
+def list_profile_ids():
+    """ Ids of the stored profiles, newest first """
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-len('.json')] for name in names if name.endswith('.json')), reverse=True)
+
+
+def load_profile(profile_id):
+    """ A stored profile as a dict, or None if it has been rotated out """
+    try:
+        with open(_profile_path(profile_id)) as profile_file:
+            return json.load(profile_file)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,188 @@
+"""
+Full-text search for sources.
+
+On Postgres every Person carries a weighted `search_vector` (name, then
+title/organization, then expertise/industries, then notes and the remaining
+searchable fields) backed by a GIN index. It is rebuilt with one set-based
+UPDATE whenever a source or one of its M2M memberships changes; see
+sources/signals.py.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, OuterRef, Q, Subquery
+
+
+SEARCH_CONFIG = 'english'
+# how many sources to rebuild per UPDATE statement when backfilling
+REBUILD_BATCH_SIZE = 5000
+# used where there is no search vector (e.g. SQLite test databases)
+FALLBACK_SEARCH_FIELDS = [
+    'city',
+    'country',
+    'email_address',
+    'import_notes',
+    'name',
+    'state',
+    'title',
+    'twitter',
+    'type_of_expert',
+    'website',
+]
+
+
+def _m2m_names(person_model, field_name):
+    """ Subquery aggregating the names of a source's related Expertise/Industry/Organization rows """
+    from django.contrib.postgres.aggregates import StringAgg
+
+    m2m_field = person_model._meta.get_field(field_name)
+    through = m2m_field.remote_field.through
+    # e.g. 'person' and 'industry' on the Person.industries through model
+    source_name = m2m_field.m2m_field_name()
+    target_name = m2m_field.m2m_reverse_field_name()
+    return Subquery(
+        through.objects.filter(**{source_name: OuterRef('pk')})
+        .values(source_name)
+        .annotate(names=StringAgg(f'{target_name}__name', delimiter=' '))
+        .values('names')
+    )
+
+
+def build_search_vector(person_model):
+    """
+    Expression that computes a source's search vector. Takes the model so
+    migrations can pass in their historical Person.
+    """
+    from django.contrib.postgres.search import SearchVector
+
+    def vector(*expressions, weight):
+        return SearchVector(*expressions, weight=weight, config=SEARCH_CONFIG)
+
+    return (
+        vector('name', weight='A') +
+        vector('title', _m2m_names(person_model, 'organization'), weight='B') +
+        vector('type_of_expert', _m2m_names(person_model, 'expertise'), _m2m_names(person_model, 'industries'), weight='C') +
+        vector('import_notes', 'email_address', 'twitter', 'website', 'city', 'state', 'country', weight='D')
+    )
+
+
+def update_search_vectors(person_ids=None, person_model=None):
+    """
+    Rebuild the search vector for the given sources, or for all of them when
+    person_ids is None. No-op on databases without full-text search.
+    """
+    if person_model is None:
+        from sources.models import Person as person_model
+
+    queryset = person_model.objects.all()
+    if connections[queryset.db].vendor != 'postgresql':
+        return
+
+    if person_ids is None:
+        person_ids = queryset.order_by().values_list('pk', flat=True)
+    person_ids = list(person_ids)
+    expression = build_search_vector(person_model)
+    for start in range(0, len(person_ids), REBUILD_BATCH_SIZE):
+        batch = person_ids[start:start + REBUILD_BATCH_SIZE]
+        # .update() skips save(), so `updated` is left alone
+        person_model.objects.filter(pk__in=batch).update(search_vector=expression)
+
+
+def _prefix_query(search_term):
+    """
+    Turn free text into a raw tsquery that ANDs each word as a prefix match,
+    e.g. 'jon smi' -> 'jon:* & smi:*'. Anything that isn't a word character is
+    dropped so the raw query can't be malformed.
+    """
+    words = re.findall(r'\w+', search_term)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def search_sources(queryset, search_term):
+    """
+    Filter a Person queryset by a free-text search term. On Postgres the
+    results are annotated with `search_rank` (higher is better); elsewhere it
+    falls back to icontains over FALLBACK_SEARCH_FIELDS.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        for word in search_term.split():
+            or_queries = Q()
+            for field_name in FALLBACK_SEARCH_FIELDS:
+                or_queries |= Q(**{f'{field_name}__icontains': word})
+            queryset = queryset.filter(or_queries)
+        return queryset
+
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    raw_query = _prefix_query(search_term)
+    if not raw_query:
+        return queryset.none()
+    query = SearchQuery(raw_query, config=SEARCH_CONFIG, search_type='raw')
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+    )
+
+
+# pg_trgm's default similarity threshold for the % operator
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+
+
+def _trigrams(value):
+    """ Python version of pg_trgm's show_trgm(), used where pg_trgm isn't available """
+    trigrams = set()
+    for word in re.findall(r'[^\W_]+', value.lower()):
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def trigram_similarity(a, b):
+    """ Python version of pg_trgm's similarity() """
+    a, b = _trigrams(a), _trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similar_names(queryset, term, limit=10, field_name='name'):
+    """
+    Return the top `limit` rows of a queryset whose `field_name` is similar
+    to `term` (misspellings, partial names, "Acme Corp" vs "ACME Corporation")
+    as dicts of id, name and similarity, best match first.
+
+    On Postgres this is served by the upper(name) gin_trgm_ops indexes from
+    migration 0030: candidates either pass the trigram % operator or contain
+    the term as a substring, and are then ranked by similarity(). Elsewhere
+    the whole queryset is scored in Python, which is only meant for tests.
+    """
+    term = term.strip()
+    if not term:
+        return []
+
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Upper
+
+        rows = (
+            queryset
+            # Upper() matches the indexed expression, upper(name::text)
+            .annotate(name_upper=Upper(field_name))
+            .filter(Q(name_upper__trigram_similar=term.upper()) | Q(**{f'{field_name}__icontains': term}))
+            .annotate(similarity=TrigramSimilarity(field_name, term))
+            .order_by('-similarity', field_name)
+            .values('id', field_name, 'similarity')[:limit]
+        )
+        return [
+            {'id': row['id'], 'name': row[field_name], 'similarity': row['similarity']}
+            for row in rows
+        ]
+
+    matches = []
+    for pk, value in queryset.values_list('pk', field_name).iterator():
+        if not value:
+            continue
+        similarity = trigram_similarity(term, value)
+        if similarity >= TRIGRAM_SIMILARITY_THRESHOLD or term.lower() in value.lower():
+            matches.append({'id': pk, 'name': value, 'similarity': similarity})
+    matches.sort(key=lambda match: (-match['similarity'], match['name']))
+    return matches[:limit]
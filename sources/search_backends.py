@@ -0,0 +1,381 @@
+"""
+Pluggable search backends for sources and interactions.
+
+The backend is chosen with the SOURCES_SEARCH_BACKEND setting (a dotted path)
+and defaults to the Postgres search vector in sources/search.py:
+
+    - DatabaseSearchBackend: full-text search inside the primary database
+    - LocalFTSSearchBackend: an in-process SQLite FTS5 index on disk, no
+      services needed (SOURCES_SEARCH_INDEX_PATH)
+    - SolrSearchBackend: a Solr core via pysolr (SOLR_URL), which moves the
+      search load off the primary database
+
+The index is kept current by sources/signals.py, which hands each backend the
+ids of the sources/interactions changed in a transaction once it commits.
+Run `manage.py rebuild_index` after switching backends.
+"""
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from contextlib import closing
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from sources.search import search_sources, update_search_vectors
+
+
+DEFAULT_SEARCH_BACKEND = 'sources.search_backends.DatabaseSearchBackend'
+# most matches an external backend hands back to the changelist
+SEARCH_RESULT_LIMIT = 1000
+INDEX_BATCH_SIZE = 500
+
+# fields copied into person documents, besides the M2M names
+PERSON_TEXT_FIELDS = [
+    'type_of_expert',
+    'import_notes',
+    'email_address',
+    'twitter',
+    'website',
+    'city',
+    'state',
+    'country',
+]
+
+
+def _m2m_names(person_ids, field_name):
+    """ {person id: [names]} for one of Person's expertise/industries/organization fields """
+    from sources.models import Person
+
+    m2m_field = Person._meta.get_field(field_name)
+    through = m2m_field.remote_field.through
+    source_attname = through._meta.get_field(m2m_field.m2m_field_name()).attname
+    target_name = m2m_field.m2m_reverse_field_name()
+    names = defaultdict(list)
+    rows = through.objects.filter(**{f'{source_attname}__in': person_ids}).values_list(
+        source_attname, f'{target_name}__name'
+    )
+    for person_id, name in rows:
+        if name:
+            names[person_id].append(name)
+    return names
+
+
+def person_documents(person_ids):
+    """
+    Plain dicts describing the given sources, built from value rows with
+    one query per M2M field rather than per source.
+    """
+    from sources.models import Person
+
+    rows = list(Person.objects.filter(pk__in=person_ids).values('id', 'name', 'title', *PERSON_TEXT_FIELDS))
+    ids = [row['id'] for row in rows]
+    organizations = _m2m_names(ids, 'organization')
+    expertise = _m2m_names(ids, 'expertise')
+    industries = _m2m_names(ids, 'industries')
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'] or '',
+            'title': row['title'] or '',
+            'organization': organizations[row['id']],
+            'expertise': expertise[row['id']],
+            'industries': industries[row['id']],
+            'text': ' '.join(row[field] for field in PERSON_TEXT_FIELDS if row[field]),
+        }
+        for row in rows
+    ]
+
+
+def interaction_documents(interaction_ids):
+    from sources.models import Interaction
+
+    rows = Interaction.objects.filter(pk__in=interaction_ids).values(
+        'id', 'interviewee_id', 'interaction_type', 'notes'
+    )
+    return [
+        {
+            'id': row['id'],
+            'interviewee_id': row['interviewee_id'],
+            'interaction_type': row['interaction_type'] or '',
+            'notes': row['notes'] or '',
+        }
+        for row in rows
+    ]
+
+
+def _batches(ids, batch_size=INDEX_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def _search_words(search_term):
+    return re.findall(r'\w+', search_term)
+
+
+class BaseSearchBackend(object):
+    """
+    Interface for search backends. Backends that keep their own index return
+    matching ids from search_people()/search_interactions(); the primary
+    database is then only asked for those ids (with the usual privacy rules).
+    """
+
+    def index_people(self, person_ids):
+        """ Add/refresh the given sources; ids that no longer exist are removed """
+        raise NotImplementedError
+
+    def index_interactions(self, interaction_ids):
+        """ Add/refresh the given interactions; ids that no longer exist are removed """
+        raise NotImplementedError
+
+    def search_people(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        """ Return matching Person ids, best match first """
+        raise NotImplementedError
+
+    def search_interactions(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        """ Return matching Interaction ids, best match first """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=INDEX_BATCH_SIZE, stdout=None):
+        """ Clear the index and re-index everything in batches """
+        from sources.models import Interaction, Person
+
+        self.clear()
+        for label, model, index in (('sources', Person, self.index_people), ('interactions', Interaction, self.index_interactions)):
+            ids = model.objects.order_by().values_list('pk', flat=True)
+            count = 0
+            for batch in _batches(ids, batch_size):
+                index(batch)
+                count += len(batch)
+            if stdout:
+                stdout.write(f'Indexed {count} {label}')
+
+    def _filter_by_ids(self, queryset, ids):
+        """ Restrict a queryset to ids, annotated with search_rank in the backend's order """
+        if not ids:
+            return queryset.none()
+        ranks = [When(pk=pk, then=Value(len(ids) - position)) for position, pk in enumerate(ids)]
+        return queryset.filter(pk__in=ids).annotate(
+            search_rank=Case(*ranks, default=Value(0), output_field=IntegerField())
+        )
+
+    def filter_people(self, queryset, search_term):
+        return self._filter_by_ids(queryset, self.search_people(search_term))
+
+    def filter_interactions(self, queryset, search_term):
+        return self._filter_by_ids(queryset, self.search_interactions(search_term))
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """ Full-text search in the primary database (the default) """
+
+    def index_people(self, person_ids):
+        update_search_vectors(person_ids)
+
+    def index_interactions(self, interaction_ids):
+        # interaction notes are searched in place
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, batch_size=INDEX_BATCH_SIZE, stdout=None):
+        update_search_vectors()
+        if stdout:
+            stdout.write('Rebuilt the source search vectors')
+
+    def filter_people(self, queryset, search_term):
+        return search_sources(queryset, search_term)
+
+    def filter_interactions(self, queryset, search_term):
+        for word in search_term.split():
+            queryset = queryset.filter(notes__icontains=word)
+        return queryset
+
+    def search_people(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        from sources.models import Person
+
+        queryset = self.filter_people(Person.objects.all(), search_term)
+        if 'search_rank' in queryset.query.annotations:
+            queryset = queryset.order_by('-search_rank')
+        return list(queryset.values_list('pk', flat=True)[:limit])
+
+    def search_interactions(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        from sources.models import Interaction
+
+        queryset = self.filter_interactions(Interaction.objects.all(), search_term)
+        return list(queryset.values_list('pk', flat=True)[:limit])
+
+
+class LocalFTSSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index in a local file, queried in-process. Rows are keyed by
+    rowid = Person/Interaction pk so updates and deletes are direct lookups.
+    """
+    # bm25() column weights, in table column order
+    PEOPLE_WEIGHTS = (10.0, 5.0, 5.0, 2.0, 2.0, 1.0)
+    INTERACTION_WEIGHTS = (1.0, 1.0)
+
+    def __init__(self, path=None):
+        self.path = path or getattr(
+            settings, 'SOURCES_SEARCH_INDEX_PATH', os.path.join(settings.BASE_DIR, 'search_index.sqlite3')
+        )
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS people USING fts5('
+                'name, title, organization, expertise, industries, text, '
+                "tokenize = 'porter unicode61')"
+            )
+            connection.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS interactions USING fts5('
+                "interaction_type, notes, tokenize = 'porter unicode61')"
+            )
+
+    def _connect(self):
+        # a connection per call keeps this safe to use from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def index_people(self, person_ids):
+        for batch in _batches(person_ids):
+            documents = person_documents(batch)
+            with closing(self._connect()) as connection, connection:
+                connection.executemany('DELETE FROM people WHERE rowid = ?', [(pk,) for pk in batch])
+                connection.executemany(
+                    'INSERT INTO people (rowid, name, title, organization, expertise, industries, text) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        (
+                            document['id'],
+                            document['name'],
+                            document['title'],
+                            ' '.join(document['organization']),
+                            ' '.join(document['expertise']),
+                            ' '.join(document['industries']),
+                            document['text'],
+                        )
+                        for document in documents
+                    ],
+                )
+
+    def index_interactions(self, interaction_ids):
+        for batch in _batches(interaction_ids):
+            documents = interaction_documents(batch)
+            with closing(self._connect()) as connection, connection:
+                connection.executemany('DELETE FROM interactions WHERE rowid = ?', [(pk,) for pk in batch])
+                connection.executemany(
+                    'INSERT INTO interactions (rowid, interaction_type, notes) VALUES (?, ?, ?)',
+                    [(document['id'], document['interaction_type'], document['notes']) for document in documents],
+                )
+
+    def _match(self, table, weights, search_term, limit):
+        words = _search_words(search_term)
+        if not words:
+            return []
+        # quoted prefix terms, implicitly ANDed, e.g. "jon"* "smi"*
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        weight_args = ', '.join(str(weight) for weight in weights)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f'SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY bm25({table}, {weight_args}) LIMIT ?',
+                (match, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def search_people(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        return self._match('people', self.PEOPLE_WEIGHTS, search_term, limit)
+
+    def search_interactions(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        return self._match('interactions', self.INTERACTION_WEIGHTS, search_term, limit)
+
+    def clear(self):
+        with closing(self._connect()) as connection, connection:
+            connection.execute('DELETE FROM people')
+            connection.execute('DELETE FROM interactions')
+
+
+class SolrSearchBackend(BaseSearchBackend):
+    """
+    Solr core via pysolr. Documents are keyed 'person-<pk>' and
+    'interaction-<pk>' and carry a `type` field. Any object with pysolr's
+    add/delete/search interface can be passed as `solr`, e.g. a local
+    stand-in during development.
+
+    The core's schema needs: id, type, name, title, organization, expertise,
+    industries (multi-valued), text, interviewee_id, interaction_type, notes.
+    """
+    PEOPLE_QUERY_FIELDS = 'name^10 title^5 organization^5 expertise^2 industries^2 text'
+    INTERACTION_QUERY_FIELDS = 'notes interaction_type'
+
+    def __init__(self, solr=None, commit_within=None):
+        if solr is None:
+            import pysolr
+
+            solr = pysolr.Solr(settings.SOLR_URL, timeout=getattr(settings, 'SOLR_TIMEOUT', 10))
+        self.solr = solr
+        # ms; let Solr batch commits instead of committing on every save
+        self.commit_within = commit_within or getattr(settings, 'SOLR_COMMIT_WITHIN', 5000)
+
+    def _index(self, prefix, ids, documents):
+        found = {document['id'] for document in documents}
+        docs = []
+        for document in documents:
+            doc = dict(document, id=f'{prefix}-{document["id"]}', type=prefix)
+            docs.append(doc)
+        if docs:
+            self.solr.add(docs, commit=False, commitWithin=self.commit_within)
+        missing = [f'{prefix}-{pk}' for pk in ids if pk not in found]
+        if missing:
+            self.solr.delete(id=missing, commit=False)
+
+    def index_people(self, person_ids):
+        for batch in _batches(person_ids):
+            self._index('person', batch, person_documents(batch))
+
+    def index_interactions(self, interaction_ids):
+        for batch in _batches(interaction_ids):
+            self._index('interaction', batch, interaction_documents(batch))
+
+    def _search(self, prefix, query_fields, search_term, limit):
+        words = _search_words(search_term)
+        if not words:
+            return []
+        results = self.solr.search(
+            ' '.join(words),
+            defType='edismax',
+            qf=query_fields,
+            # every word has to match, like the other backends
+            mm='100%',
+            fq=f'type:{prefix}',
+            fl='id',
+            rows=limit,
+        )
+        return [int(doc['id'].split('-', 1)[1]) for doc in results]
+
+    def search_people(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        return self._search('person', self.PEOPLE_QUERY_FIELDS, search_term, limit)
+
+    def search_interactions(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        return self._search('interaction', self.INTERACTION_QUERY_FIELDS, search_term, limit)
+
+    def clear(self):
+        self.solr.delete(q='*:*', commit=True)
+
+    def rebuild(self, *args, **kwargs):
+        super().rebuild(*args, **kwargs)
+        self.solr.commit()
+
+
+def _load_search_backend():
+    backend_path = getattr(settings, 'SOURCES_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+    return import_string(backend_path)()
+
+
+# module-level instance, created on first use
+search_backend = SimpleLazyObject(_load_search_backend)
@@ -0,0 +1,351 @@
+"""
+Signal receivers that keep data derived from sources and interactions (the
+search index, etc.) in sync with them and with the sources' M2M memberships.
+
+Changes are collected per transaction and the derived data is rebuilt once,
+in bulk, after the transaction commits; saving a source from the admin fires
+post_save plus an m2m_changed per M2M field, and this turns those into one
+refresh instead of four.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+
+from sources.analytics import interaction_days, local_day, update_rollup
+from sources.cache import invalidate as invalidate_cache
+from sources.directory import user_directory
+from sources.identifiers import index_identifiers
+from sources.models import Dive, Expertise, Industry, Interaction, Organization, Person
+from sources.search_backends import search_backend
+from sources.slow_queries import install as install_slow_query_log
+from sources.summaries import refresh_summaries, update_interaction_totals
+
+
+# called with a set of ids after the transaction that changed them commits;
+# the ids of deleted rows are passed too, so refreshers can clean up after them
+REFRESHERS = {
+    'person': [
+        lambda person_ids: search_backend.index_people(person_ids),
+        # reverse lookups by email/phone/handle
+        lambda person_ids: index_identifiers(person_ids),
+        # the changelist/export names and totals
+        lambda person_ids: refresh_summaries(person_ids),
+        # list filter options
+        lambda person_ids: invalidate_cache('lookups'),
+    ],
+    'interaction': [
+        lambda interaction_ids: search_backend.index_interactions(interaction_ids),
+        # the analytics rollup; see interaction_changed for the days interactions left
+        lambda interaction_ids: update_rollup(interaction_days(interaction_ids)),
+        lambda interaction_ids: invalidate_cache('analytics'),
+    ],
+    # days (in settings.TIME_ZONE) that interactions were moved away from or deleted from
+    'interaction_day': [
+        lambda days: update_rollup(days),
+        lambda days: invalidate_cache('analytics'),
+    ],
+    # sources whose summary alone is stale (creator renamed or deleted)
+    'summary': [
+        lambda person_ids: refresh_summaries(person_ids),
+    ],
+}
+
+
+def refresh(kind, ids):
+    """ Rebuild all derived data for the given sources/interactions right away """
+    ids = set(ids)
+    if not ids:
+        return
+    for refresher in REFRESHERS[kind]:
+        refresher(ids)
+
+
+def refresh_people(person_ids):
+    refresh('person', person_ids)
+
+
+class _PendingRefresh(object):
+    """ on_commit callback that accumulates the ids changed in one transaction """
+
+    def __init__(self):
+        self.ids = defaultdict(set)
+
+    def __call__(self):
+        for kind, ids in self.ids.items():
+            refresh(kind, ids)
+
+
+def schedule_refresh(kind, ids):
+    """
+    Queue sources ('person'), interactions ('interaction') or the ids of
+    another REFRESHERS kind whose derived data needs rebuilding once the
+    current transaction commits. Outside a transaction they are refreshed
+    right away.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    if not connection.in_atomic_block:
+        refresh(kind, ids)
+        return
+
+    # reuse this transaction's pending callback if there is one; callbacks
+    # from rolled back savepoints have already been dropped by Django
+    for savepoint_ids, callback in connection.run_on_commit:
+        if isinstance(callback, _PendingRefresh):
+            callback.ids[kind].update(ids)
+            return
+    pending = _PendingRefresh()
+    pending.ids[kind].update(ids)
+    transaction.on_commit(pending)
+
+
+def schedule_person_refresh(person_ids):
+    schedule_refresh('person', person_ids)
+
+
+def touch(queryset):
+    """
+    Bump `updated` on rows whose change view shows something that changed
+    without saving them (memberships, interviewers, a renamed lookup or
+    user), so its ETag changes; see ConditionalChangeViewMixin. The clock
+    rather than Now(), which is when the transaction started and could be
+    earlier than a save in it.
+    """
+    queryset.update(updated=timezone.now())
+
+
+@receiver(pre_save, sender=Person)
+def person_pre_save(sender, instance, raw=False, **kwargs):
+    """ Note whether an existing Person's privacy level is changing """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'privacy_level' not in update_fields:
+        instance._privacy_changed = False
+        return
+    instance._privacy_changed = bool(instance.pk) and not raw and (
+        sender.objects.filter(pk=instance.pk).values_list('privacy_level', flat=True).first() != instance.privacy_level
+    )
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def person_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_person_refresh([instance.pk])
+        if kwargs['signal'] is post_delete or kwargs['created'] or getattr(instance, '_privacy_changed', False):
+            # the admin index counts the rows each user can see
+            invalidate_cache_on_commit('counts')
+    if kwargs['signal'] is post_save and not raw and not kwargs.get('created'):
+        # the save wrote back the totals loaded with the instance, which an
+        # interaction saved since may have changed; see sources/summaries.py
+        update_interaction_totals([instance.pk])
+
+
+@receiver(pre_save, sender=Interaction)
+def interaction_pre_save(sender, instance, raw=False, **kwargs):
+    """ Note the interviewee, day and privacy level an existing Interaction is being changed from """
+    instance._former_interviewee_id = instance._former_day = None
+    instance._privacy_changed = False
+    if instance.pk and not raw:
+        former = (
+            sender.objects.filter(pk=instance.pk).values_list('interviewee_id', 'date_time', 'privacy_level').first()
+        )
+        if former is None:
+            return
+        if former[0] != instance.interviewee_id:
+            instance._former_interviewee_id = former[0]
+        if former[1] != instance.date_time:
+            instance._former_day = local_day(former[1])
+        instance._privacy_changed = former[2] != instance.privacy_level
+
+
+@receiver(post_save, sender=Interaction)
+@receiver(post_delete, sender=Interaction)
+def interaction_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_refresh('interaction', [instance.pk])
+    if kwargs['signal'] is post_delete or kwargs['created'] or getattr(instance, '_privacy_changed', False):
+        # the admin index counts the rows each user can see
+        invalidate_cache_on_commit('counts')
+    # in this transaction rather than after it commits, see sources/summaries.py
+    update_interaction_totals([instance.interviewee_id, getattr(instance, '_former_interviewee_id', None)])
+    # the 'interaction' refreshers only see the day it is on now
+    if kwargs['signal'] is post_delete:
+        schedule_refresh('interaction_day', [local_day(instance.date_time)])
+    elif getattr(instance, '_former_day', None):
+        schedule_refresh('interaction_day', [instance._former_day])
+
+
+@receiver(m2m_changed, sender=Interaction.interviewer.through)
+def interviewers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ The interviewers are counted in the analytics rollup and shown on the change views """
+    if reverse:
+        # instance is a User and pk_set holds Interaction ids
+        if action in ('post_add', 'post_remove') and pk_set:
+            interaction_ids = pk_set
+        elif action == 'pre_clear':
+            interaction_ids = list(sender.objects.filter(user=instance).values_list('interaction_id', flat=True))
+        else:
+            return
+    elif (action in ('post_add', 'post_remove') and pk_set) or action == 'post_clear':
+        interaction_ids = [instance.pk]
+    else:
+        return
+    schedule_refresh('interaction', interaction_ids)
+    touch(Interaction.objects.filter(pk__in=interaction_ids))
+
+
+def person_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is e.g. an Organization and pk_set holds Person ids
+        if action in ('post_add', 'post_remove') and pk_set:
+            person_ids = pk_set
+        elif action == 'pre_clear':
+            person_ids = list(
+                sender.objects.filter(**{sender._meta.get_field(instance._meta.model_name).attname: instance.pk})
+                .values_list('person_id', flat=True)
+            )
+        else:
+            return
+    elif (action in ('post_add', 'post_remove') and pk_set) or action == 'post_clear':
+        person_ids = [instance.pk]
+    else:
+        return
+    schedule_person_refresh(person_ids)
+    touch(Person.objects.filter(pk__in=person_ids))
+
+
+for m2m_field in (Person.expertise, Person.industries, Person.organization, Person.exportable_by):
+    m2m_changed.connect(person_m2m_changed, sender=m2m_field.through)
+
+
+# Person M2M field per lookup model
+LOOKUP_PERSON_FIELDS = {
+    Expertise: 'expertise',
+    Industry: 'industries',
+    Organization: 'organization',
+    Dive: 'exportable_by',
+}
+
+
+def lookup_pre_save(sender, instance, raw=False, **kwargs):
+    """ Note whether an existing Expertise/Industry/Organization/Dive is being renamed """
+    instance._renamed = bool(instance.pk) and not raw and (
+        sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first() != instance.name
+    )
+
+
+def lookup_saved(sender, instance, **kwargs):
+    """ Renaming an Expertise/Industry/Organization/Dive changes the text of every linked source """
+    if not getattr(instance, '_renamed', False):
+        return
+    person_ids = list(Person.objects.filter(**{LOOKUP_PERSON_FIELDS[sender]: instance}).values_list('pk', flat=True))
+    schedule_person_refresh(person_ids)
+    touch(Person.objects.filter(pk__in=person_ids))
+
+
+def lookup_pre_delete(sender, instance, **kwargs):
+    """ Deleting one drops its through rows without an m2m_changed """
+    person_ids = list(Person.objects.filter(**{LOOKUP_PERSON_FIELDS[sender]: instance}).values_list('pk', flat=True))
+    schedule_person_refresh(person_ids)
+    touch(Person.objects.filter(pk__in=person_ids))
+
+
+for lookup_model in LOOKUP_PERSON_FIELDS:
+    pre_save.connect(lookup_pre_save, sender=lookup_model)
+    post_save.connect(lookup_saved, sender=lookup_model)
+    pre_delete.connect(lookup_pre_delete, sender=lookup_model)
+
+
+def invalidate_cache_on_commit(*namespaces):
+    """ Drop cached values once the current transaction commits (right away outside one) """
+    transaction.on_commit(lambda: invalidate_cache(*namespaces))
+
+
+@receiver(post_save, sender=Expertise)
+@receiver(post_save, sender=Industry)
+@receiver(post_save, sender=Organization)
+@receiver(post_save, sender=Dive)
+@receiver(post_delete, sender=Expertise)
+@receiver(post_delete, sender=Industry)
+@receiver(post_delete, sender=Organization)
+@receiver(post_delete, sender=Dive)
+def lookup_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if sender is Dive:
+        invalidate_cache_on_commit('dives', 'counts', 'analytics')
+    else:
+        invalidate_cache_on_commit('lookups', 'counts')
+
+
+@receiver(m2m_changed, sender=Dive.users.through)
+def dive_members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # the per-dive analytics count the members' interactions
+        invalidate_cache_on_commit('dives', 'analytics')
+
+
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, instance, raw=False, **kwargs):
+    """ Note whether an existing User's display name is changing """
+    name_fields = {'first_name', 'last_name', 'username'}
+    update_fields = kwargs.get('update_fields')
+    # e.g. the last_login update on every login
+    if update_fields is not None and not name_fields & set(update_fields):
+        instance._renamed = False
+        return
+    instance._renamed = bool(instance.pk) and not raw and (
+        sender.objects.filter(pk=instance.pk).values_list('first_name', 'last_name', 'username').first()
+        != (instance.first_name, instance.last_name, instance.username)
+    )
+
+
+@receiver(pre_delete, sender=User)
+def user_pre_delete(sender, instance, **kwargs):
+    # created_by is set to NULL with an UPDATE, which sends no signals
+    schedule_refresh('summary', Person.objects.filter(created_by=instance).values_list('pk', flat=True))
+    # as are the interactions' created_by, and their interviewer rows are
+    # deleted without an m2m_changed
+    touch(Interaction.objects.filter(Q(created_by=instance) | Q(interviewer=instance)))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    user_directory.invalidate(instance.pk)
+    if kwargs['signal'] is post_delete:
+        # the dive memberships and analytics rollup rows went with it,
+        # without an m2m_changed
+        invalidate_cache_on_commit('dives', 'analytics')
+    elif getattr(instance, '_renamed', False):
+        schedule_refresh('summary', Person.objects.filter(created_by=instance).values_list('pk', flat=True))
+        # their name is shown on these change views
+        touch(Person.objects.filter(created_by=instance))
+        touch(Interaction.objects.filter(Q(created_by=instance) | Q(interviewer=instance)))
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """
+    With CONN_MAX_AGE a connection can outlive the database server's side of
+    it (restarts, failovers, idle timeouts). For databases with
+    CONN_HEALTH_CHECKS set, drop a reused connection that no longer answers
+    so the request opens a fresh one instead of failing.
+    """
+    for conn in connections.all():
+        if conn.settings_dict.get('CONN_HEALTH_CHECKS') and conn.connection is not None and not conn.is_usable():
+            conn.close()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_slow_query_log(connection)
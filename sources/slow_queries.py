@@ -0,0 +1,174 @@
+"""
+Slow query log for ORM (and raw) SQL.
+
+Every database connection gets a SlowQueryRecorder execute wrapper when it is
+opened (see sources/signals.py). Statements that take longer than
+SLOW_QUERY_THRESHOLD_MS are, for a SLOW_QUERY_SAMPLE_RATE fraction of them,
+written to the SlowQuery table with
+
+    - a fingerprint: the statement with literals, placeholders and IN/VALUES
+      lists normalized away, so the same query from different requests groups
+      together
+    - the project call site (the innermost frames outside Django and
+      third-party packages) that ran it
+    - the duration, and on Postgres the EXPLAIN (ANALYZE, BUFFERS) output;
+      ANALYZE runs the statement a second time, so only SELECTs get it
+
+The table keeps the newest SLOW_QUERY_MAX_ROWS rows. `manage.py slow_queries`
+reports the fingerprints with the most total time. Set
+SLOW_QUERY_THRESHOLD_MS to None to turn the log off.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+
+SLOW_QUERY_THRESHOLD_MS = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+SLOW_QUERY_SAMPLE_RATE = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+SLOW_QUERY_MAX_ROWS = getattr(settings, 'SLOW_QUERY_MAX_ROWS', 1000)
+SLOW_QUERY_EXPLAIN = getattr(settings, 'SLOW_QUERY_EXPLAIN', True)
+# frames kept from the call site
+CALL_SITE_DEPTH = 8
+
+logger = logging.getLogger('sources.performance')
+
+## fingerprints
+
+FINGERPRINT_PATTERNS = [
+    # string literals, numbers and placeholders
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\s+'), ' '),
+    # any number of values, e.g. pk__in=[...] or bulk_create()
+    (re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+'), r'\1, ...'),
+]
+
+
+def normalize_sql(sql):
+    """ The statement with everything that varies between calls replaced """
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(sql):
+    """ (fingerprint, normalized statement) for a statement """
+    normalized = normalize_sql(sql)
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest(), normalized
+
+
+## call sites
+
+# Django, third-party packages, the stdlib, this module and the middleware
+# that wraps every request aren't the call site
+_IGNORED_PATHS = (
+    os.path.dirname(os.path.dirname(os.__file__)),
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'middleware.py'),
+)
+
+
+def call_site(depth=CALL_SITE_DEPTH):
+    """ The innermost project frames of the current stack, innermost last """
+    base_dir = getattr(settings, 'BASE_DIR', '')
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.startswith(_IGNORED_PATHS)
+    ]
+    return '\n'.join(
+        '{}:{} in {}'.format(os.path.relpath(frame.filename, base_dir), frame.lineno, frame.name)
+        for frame in frames[-depth:]
+    )
+
+
+## recording
+
+def explain(connection, sql, params):
+    """ EXPLAIN output for a statement, or '' where we can't get one """
+    if connection.vendor != 'postgresql':
+        return ''
+    if sql.lstrip()[:6].upper() == 'SELECT':
+        options = 'ANALYZE, BUFFERS'
+    else:
+        # ANALYZE would apply the write a second time
+        options = 'COSTS'
+    try:
+        # savepoint, so a failing EXPLAIN doesn't break the caller's transaction
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN ({}) {}'.format(options, sql), params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError:
+        return ''
+
+
+class SlowQueryRecorder(object):
+    """ execute_wrapper that logs statements slower than the threshold """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, sample_rate=SLOW_QUERY_SAMPLE_RATE,
+                 max_rows=SLOW_QUERY_MAX_ROWS, explain=SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.max_rows = max_rows
+        self.explain = explain
+        # set while recording, so the recorder's own queries aren't recorded
+        self._local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self._local, 'recording', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.threshold_ms and random.random() < self.sample_rate:
+            self._local.recording = True
+            try:
+                self.record(context['connection'], sql, params, many, duration_ms)
+            except Exception:
+                # never fail the query over its log entry
+                logger.exception('Could not record slow query')
+            finally:
+                self._local.recording = False
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        from sources.models import SlowQuery
+
+        query_fingerprint, normalized = fingerprint(sql)
+        plan = '' if many or not self.explain else explain(connection, sql, params)
+        with transaction.atomic(using=SlowQuery.objects.db):
+            SlowQuery.objects.create(
+                fingerprint=query_fingerprint,
+                statement=normalized,
+                duration_ms=duration_ms,
+                call_site=call_site(),
+                plan=plan,
+                database=connection.alias,
+            )
+            # keep the table capped
+            cutoff = SlowQuery.objects.order_by('-pk').values_list('pk', flat=True)[self.max_rows:self.max_rows + 1]
+            if cutoff:
+                SlowQuery.objects.filter(pk__lte=cutoff[0]).delete()
+
+
+slow_query_recorder = SlowQueryRecorder()
+
+
+def install(connection):
+    """ Add the recorder to a connection's execute wrappers (once) """
+    if SLOW_QUERY_THRESHOLD_MS is None:
+        return
+    if slow_query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_recorder)
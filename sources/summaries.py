@@ -0,0 +1,136 @@
+"""
+Denormalized per-source data for the changelist and the export.
+
+Showing a source's expertise, industries, organizations and dives means
+joining sources_person to four M2M tables (and auth_user for the creator),
+for every row of every list and export. The PersonSummary table holds one
+row per source with those already joined:
+
+    expertise_names, industry_names,      names joined with ', ', in
+    organization_names, dive_names        alphabetical order
+    created_by_name                       the creator's display name
+
+The rows are rebuilt for the sources changed in a transaction after it
+commits, like the search index (see REFRESHERS in sources/signals.py): a
+source's own save, its M2M memberships and renaming a linked lookup, dive or
+the creator all schedule it. refresh_summaries() / `manage.py
+rebuild_summaries` rebuild every row.
+
+A plain table rather than a Postgres materialized view: it works on SQLite
+too, and refreshing the handful of sources a transaction touched is much
+cheaper than REFRESH MATERIALIZED VIEW CONCURRENTLY over every source.
+
+A source's interaction_count and last_interaction_at are sorted and filtered
+on, so they live on Person itself, indexed. update_interaction_totals()
+recomputes them with one UPDATE in the transaction that saves or deletes
+the interactions, and after a source's own save (which writes back the
+values loaded with it), so they are never stale in a committed state.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+SUMMARY_BATCH_SIZE = 2000
+# how many sources to update per UPDATE statement when backfilling totals
+TOTALS_BATCH_SIZE = 5000
+
+# PersonSummary column per Person M2M field
+SUMMARY_M2M_FIELDS = {
+    'expertise': 'expertise_names',
+    'industries': 'industry_names',
+    'organization': 'organization_names',
+    'exportable_by': 'dive_names',
+}
+
+
+def _m2m_names(person_model, field_name, person_ids):
+    """ {person id: 'name, name'} for one M2M field, in one query """
+    field = person_model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source_name = field.m2m_field_name()
+    target_name = field.m2m_reverse_field_name()
+    names = defaultdict(list)
+    rows = (
+        through.objects.filter(**{f'{source_name}_id__in': person_ids})
+        .order_by(f'{target_name}__name')
+        .values_list(f'{source_name}_id', f'{target_name}__name')
+    )
+    for person_id, name in rows:
+        names[person_id].append(name)
+    return {person_id: ', '.join(values) for person_id, values in names.items()}
+
+
+def summary_rows(person_ids, person_model):
+    """ {person id: PersonSummary field values} for the given sources """
+    rows = {}
+    people = person_model.objects.filter(pk__in=person_ids).order_by().values_list(
+        'pk', 'created_by__first_name', 'created_by__last_name', 'created_by__username'
+    )
+    for pk, first_name, last_name, username in people:
+        rows[pk] = {
+            # as sources.directory
+            'created_by_name': '{} {}'.format(first_name or '', last_name or '').strip() or username or '',
+        }
+        rows[pk].update({column: '' for column in SUMMARY_M2M_FIELDS.values()})
+    if not rows:
+        return rows
+
+    for field_name, column in SUMMARY_M2M_FIELDS.items():
+        for person_id, names in _m2m_names(person_model, field_name, list(rows)).items():
+            rows[person_id][column] = names
+    return rows
+
+
+def refresh_summaries(person_ids=None, person_model=None, batch_size=SUMMARY_BATCH_SIZE):
+    """
+    Rebuild the PersonSummary rows of the given sources, or of all of them
+    when person_ids is None; ids of deleted sources are skipped (their rows
+    went with them).
+    """
+    if person_model is None:
+        from sources.models import Person as person_model
+    summary_model = person_model._meta.get_field('summary').related_model
+
+    if person_ids is None:
+        person_ids = person_model.objects.order_by('pk').values_list('pk', flat=True)
+    person_ids = sorted(person_ids)
+    for start in range(0, len(person_ids), batch_size):
+        batch = person_ids[start:start + batch_size]
+        rows = summary_rows(batch, person_model)
+        with transaction.atomic():
+            summary_model.objects.filter(person_id__in=batch).delete()
+            # a concurrent refresh of the same source may have inserted it already
+            summary_model.objects.bulk_create([
+                summary_model(person_id=person_id, **values) for person_id, values in rows.items()
+            ], ignore_conflicts=True)
+
+
+def update_interaction_totals(person_ids=None, person_model=None, batch_size=TOTALS_BATCH_SIZE):
+    """
+    Recompute interaction_count and last_interaction_at of the given sources,
+    or of all of them when person_ids is None, from their interactions. Runs
+    in the caller's transaction; .update() skips save(), so `updated` is left
+    alone.
+    """
+    if person_model is None:
+        from sources.models import Person as person_model
+    interaction_model = person_model._meta.get_field('interviewee').related_model
+
+    # correlated subqueries over the (interviewee, -date_time) index
+    interactions = interaction_model.objects.filter(interviewee=OuterRef('pk')).order_by().values('interviewee')
+    totals = {
+        'interaction_count': Coalesce(
+            Subquery(interactions.annotate(count=Count('pk')).values('count'), output_field=IntegerField()),
+            Value(0),
+        ),
+        'last_interaction_at': Subquery(interactions.annotate(last=Max('date_time')).values('last')),
+    }
+    if person_ids is None:
+        person_ids = person_model.objects.order_by('pk').values_list('pk', flat=True)
+    # sorted, so concurrent updates lock the rows in the same order
+    person_ids = sorted(set(person_ids) - {None})
+    for start in range(0, len(person_ids), batch_size):
+        person_model.objects.filter(pk__in=person_ids[start:start + batch_size]).update(**totals)
@@ -0,0 +1,126 @@
+"""
+Helpers for seeding a throwaway synthetic dataset. Used by the benchmark and
+query plan management commands, which run inside a transaction that is rolled
+back afterwards, so nothing created here is meant to be kept.
+"""
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from sources.models import Dive, Expertise, Interaction, Organization, Person
+
+
+# roughly the mix we see in production
+PRIVACY_WEIGHTS = (
+    ('public', 6),
+    ('searchable', 3),
+    ('private_individual', 1),
+)
+
+
+def _privacy_level():
+    levels, weights = zip(*PRIVACY_WEIGHTS)
+    return random.choices(levels, weights=weights)[0]
+
+
+def seed_sources(people=10000, interactions=0, users=25, lookups=500, batch_size=5000):
+    """
+    Bulk create users, sources, expertise/organization memberships, a dive
+    and interactions. Returns a dict with the created users, the dive and a
+    sample of the email addresses so callers can run realistic lookups
+    against them.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    user_objs = User.objects.bulk_create([
+        User(username=f'synthetic-{run_id}-{i}', email=f'reporter{i}-{run_id}@example.com')
+        for i in range(users)
+    ])
+    # bulk_create only sets pks on Postgres, so fetch them back to be safe
+    user_objs = list(User.objects.filter(username__startswith=f'synthetic-{run_id}-'))
+
+    Expertise.objects.bulk_create([
+        Expertise(name=f'Expertise {run_id} {i}') for i in range(lookups)
+    ])
+    expertise_ids = list(Expertise.objects.filter(name__startswith=f'Expertise {run_id} ').values_list('id', flat=True))
+    Organization.objects.bulk_create([
+        Organization(name=f'Organization {run_id} {i}') for i in range(lookups)
+    ])
+    organization_ids = list(Organization.objects.filter(name__startswith=f'Organization {run_id} ').values_list('id', flat=True))
+
+    emails = []
+    for start in range(0, people, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, people)):
+            email_address = f'Source.{i}@Example-{run_id}.com'
+            emails.append(email_address)
+            batch.append(Person(
+                name=f'Source {i} {run_id}',
+                email_address=email_address,
+                title='Analyst',
+                privacy_level=_privacy_level(),
+                created_by=random.choice(user_objs),
+                entry_method='import',
+                entry_type='automated',
+            ))
+        Person.objects.bulk_create(batch)
+
+    person_ids = list(Person.objects.filter(name__endswith=f' {run_id}').values_list('id', flat=True))
+    ExpertiseThrough = Person.expertise.through
+    OrganizationThrough = Person.organization.through
+    for start in range(0, len(person_ids), batch_size):
+        chunk = person_ids[start:start + batch_size]
+        ExpertiseThrough.objects.bulk_create([
+            ExpertiseThrough(person_id=person_id, expertise_id=random.choice(expertise_ids))
+            for person_id in chunk
+        ], ignore_conflicts=True)
+        OrganizationThrough.objects.bulk_create([
+            OrganizationThrough(person_id=person_id, organization_id=random.choice(organization_ids))
+            for person_id in chunk
+        ], ignore_conflicts=True)
+
+    # a dive for the first user, with a share of the sources exportable by it
+    dive = Dive.objects.create(name=f'Dive {run_id}')
+    dive.users.add(user_objs[0])
+    ExportableThrough = Person.exportable_by.through
+    exportable_ids = random.sample(person_ids, len(person_ids) // 5)
+    for start in range(0, len(exportable_ids), batch_size):
+        ExportableThrough.objects.bulk_create([
+            ExportableThrough(person_id=person_id, dive_id=dive.pk)
+            for person_id in exportable_ids[start:start + batch_size]
+        ])
+
+    now = timezone.now()
+    for start in range(0, interactions, batch_size):
+        Interaction.objects.bulk_create([
+            Interaction(
+                interviewee_id=random.choice(person_ids),
+                created_by=random.choice(user_objs),
+                date_time=now - timedelta(minutes=random.randint(0, 60 * 24 * 365 * 3)),
+                interaction_type=random.choice(Interaction.INTERACTION_CHOICES)[0],
+                privacy_level=_privacy_level(),
+                notes='Synthetic interaction',
+            )
+            for i in range(start, min(start + batch_size, interactions))
+        ])
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # auto_now stamps every row with the same time; spread them out so
+            # the ordering indexes see a realistic distribution
+            cursor.execute(
+                "UPDATE sources_person SET updated = now() - random() * interval '3 years' WHERE id = ANY(%s)",
+                [person_ids],
+            )
+            cursor.execute('ANALYZE sources_person')
+            cursor.execute('ANALYZE sources_interaction')
+
+    return {
+        'users': user_objs,
+        'dive': dive,
+        'person_ids': person_ids,
+        'emails': random.sample(emails, min(len(emails), 100)),
+    }
@@ -0,0 +1,21 @@
+from django import template
+from django.apps import apps
+from django.contrib import admin
+
+from sources import cache
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def model_count(context, app_label, object_name):
+    """
+    Cached number of rows of a model in the user's changelist (so private
+    rows of other users aren't counted), e.g.
+    {% model_count app.app_label model.object_name %}
+    """
+    request = context['request']
+    model = apps.get_model(app_label, object_name)
+    model_admin = admin.site._registry[model]
+    return cache.model_count(model, request.user.pk, lambda: model_admin.get_queryset(request).count())
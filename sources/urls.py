@@ -1,6 +1,17 @@
 from django.conf.urls import url, include
 from django.urls import path
 
+from sources import api, views
 
-urlpatterns = []
 
+app_name = 'sources'
+
+urlpatterns = [
+    path('typeahead/<str:model_name>/', views.typeahead, name='typeahead'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('api/lookup/', api.lookup, name='api_lookup'),
+    path('api/interactions/bulk/', api.interactions_bulk, name='api_interactions_bulk'),
+    path('api/<str:resource_name>/', api.resource_list, name='api_list'),
+    path('api/<str:resource_name>/<int:pk>/', api.resource_detail, name='api_detail'),
+]
@@ -0,0 +1,172 @@
+from urllib.parse import urlencode
+
+from django.contrib import admin
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render
+
+from sources.directory import user_directory
+from sources.models import Expertise, Industry, Organization, Person
+from sources.profiling import PROFILE_PARAM, list_profile_ids, load_profile, profile_token
+from sources.search import similar_names
+
+
+TYPEAHEAD_MODELS = {
+    'expertise': Expertise,
+    'industry': Industry,
+    'organization': Organization,
+    'person': Person,
+}
+TYPEAHEAD_MAX_LIMIT = 50
+
+
+@staff_member_required
+def typeahead(request, model_name):
+    """
+    Similarity-ranked name lookup for editors, e.g.
+    /sources/typeahead/person/?q=jon+smth&limit=10
+    """
+    try:
+        model = TYPEAHEAD_MODELS[model_name]
+    except KeyError:
+        raise Http404
+    try:
+        limit = min(int(request.GET.get('limit', 10)), TYPEAHEAD_MAX_LIMIT)
+    except ValueError:
+        limit = 10
+
+    queryset = model.objects.all()
+    if model is Person:
+        # same privacy rules as the Source admin
+        queryset = queryset.visible_to(request.user)
+
+    results = similar_names(queryset, request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'results': results})
+
+
+class PagedAutocompleteJsonView(AutocompleteJsonView):
+    """
+    AutocompleteJsonView that answers each page with a single query: it
+    fetches one row past the page to tell whether there are more, instead of
+    running COUNT(*) for a paginator. Labels come from the ModelAdmin's
+    autocomplete_label() and access from its has_autocomplete_permission(),
+    see AutocompleteAdminMixin in sources/admin.py.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not self.model_admin.get_search_fields(request):
+            raise Http404(
+                '%s must have search_fields for the autocomplete_view.' %
+                type(self.model_admin).__name__
+            )
+        if not self.has_perm(request):
+            return JsonResponse({'error': '403 Forbidden'}, status=403)
+
+        self.term = request.GET.get('term', '')
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        start = (page - 1) * self.paginate_by
+        choices = self.get_choices(start, start + self.paginate_by + 1)
+        return JsonResponse({
+            'results': [
+                {'id': str(pk), 'text': label}
+                for pk, label in choices[:self.paginate_by]
+            ],
+            'pagination': {'more': len(choices) > self.paginate_by},
+        })
+
+    def get_choices(self, start, stop):
+        """ (pk, label) pairs for results[start:stop] """
+        return [
+            (obj.pk, self.model_admin.autocomplete_label(obj))
+            for obj in self.get_queryset()[start:stop]
+        ]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if 'search_rank' in qs.query.annotations:
+            # best match first, e.g. from the source search backend
+            qs = qs.order_by('-search_rank', '-pk')
+        elif not qs.ordered:
+            qs = qs.order_by('pk')
+        return qs
+
+    def has_perm(self, request, obj=None):
+        return self.model_admin.has_autocomplete_permission(request)
+
+
+class UserDirectoryAutocompleteJsonView(PagedAutocompleteJsonView):
+    """ User autocomplete answered from the in-process user directory """
+
+    def get_choices(self, start, stop):
+        return user_directory.search(self.term)[start:stop]
+
+
+def _superuser_profile_view(view):
+    """ Profiles show other users' pages and SQL, so only superusers may read them """
+    @staff_member_required
+    def wrapped(request, *args, **kwargs):
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+@_superuser_profile_view
+def profile_list(request):
+    """
+    The stored request profiles, newest first, and a form that makes a
+    profiling link for an editor (see sources/profiling.py).
+    """
+    profiles = [profile for profile in map(load_profile, list_profile_ids()) if profile]
+
+    profile_link = None
+    username = request.GET.get('username', '').strip()
+    path = request.GET.get('path', '').strip()
+    if username and path.startswith('/'):
+        user = User.objects.filter(username=username, is_staff=True).first()
+        if user is None:
+            profile_link = ''
+        else:
+            separator = '&' if '?' in path else '?'
+            profile_link = request.build_absolute_uri(
+                path + separator + urlencode({PROFILE_PARAM: profile_token(user)})
+            )
+
+    context = dict(
+        admin.site.each_context(request),
+        title='Request profiles',
+        profiles=profiles,
+        username=username,
+        path=path,
+        profile_link=profile_link,
+    )
+    return render(request, 'admin/sources/profiles/list.html', context)
+
+
+@_superuser_profile_view
+def profile_detail(request, profile_id):
+    try:
+        profile = load_profile(profile_id)
+    except ValueError:
+        profile = None
+    if profile is None:
+        raise Http404
+
+    if request.GET.get('format') == 'collapsed':
+        # for flamegraph.pl / speedscope
+        response = HttpResponse(profile['collapsed_stacks'], content_type='text/plain')
+        response['Content-Disposition'] = 'attachment; filename="{}.collapsed.txt"'.format(profile_id)
+        return response
+
+    context = dict(
+        admin.site.each_context(request),
+        title='Profile of {} {}'.format(profile['method'], profile['path']),
+        profile=profile,
+    )
+    return render(request, 'admin/sources/profiles/detail.html', context)
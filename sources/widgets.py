@@ -0,0 +1,68 @@
+from django.contrib.admin.widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from django.forms import Select
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from sources.directory import user_directory
+
+
+class UserDirectoryOptionsMixin(object):
+    """
+    Render the selected users of an autocomplete widget with display names
+    from the user directory instead of querying the User table for them.
+    """
+
+    def optgroups(self, name, value, attr=None):
+        default = (None, [], 0)
+        if not self.is_required and not self.allow_multiple_selected:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        user_ids = []
+        for user_id in value:
+            try:
+                user_ids.append(int(user_id))
+            except (TypeError, ValueError):
+                continue
+        names = user_directory.display_names(user_ids)
+        for user_id in user_ids:
+            if user_id in names:
+                index = len(default[1])
+                default[1].append(self.create_option(name, user_id, names[user_id], True, index))
+            if not self.allow_multiple_selected:
+                break
+        return [default]
+
+
+class UserAutocompleteSelect(UserDirectoryOptionsMixin, AutocompleteSelect):
+    pass
+
+
+class UserAutocompleteSelectMultiple(UserDirectoryOptionsMixin, AutocompleteSelectMultiple):
+    pass
+
+
+class CachedSelect(Select):
+    """
+    Select for long, static and flat choice lists (time zones, countries).
+    The stock Select renders a template per option on every request; this
+    renders the option markup once per process and only patches in the
+    `selected` attribute.
+    """
+    # choices -> rendered <option> markup
+    _rendered_options = {}
+
+    def _options(self):
+        choices = tuple((str(value), str(label)) for value, label in self.choices)
+        options = self._rendered_options.get(choices)
+        if options is None:
+            options = format_html_join('', '<option value="{}">{}</option>', choices)
+            self._rendered_options[choices] = options
+        return options
+
+    def render(self, name, value, attrs=None, renderer=None):
+        final_attrs = self.build_attrs(self.attrs, attrs)
+        options = self._options()
+        for selected in self.format_value(value)[:1]:
+            option = format_html('<option value="{}"', selected)
+            options = options.replace(option + '>', option + ' selected>', 1)
+        return mark_safe(format_html('<select name="{}"{}>', name, flatatt(final_attrs)) + options + '</select>')